@@ -7,6 +7,8 @@ import time
 from threading import Thread
 from typing import Dict, List, Optional
 
+from subscriptions import TIER_TICKER
+
 
 class AutoTrader:
     """Автоматический трейдер с поддержкой усреднения и продажи
@@ -14,13 +16,17 @@ class AutoTrader:
     через state_manager (breakeven_params) и trading_permissions.
     """
     
-    def __init__(self, api_client_provider, ws_manager, state_manager):
+    def __init__(self, api_client_provider, ws_manager, state_manager, market=None, seed: Optional[int] = None):
         # api_client_provider: функция, возвращающая актуальный GateAPIClient или None
+        # market: SyntheticMarket - источник цен, если в кэше WS нет цены (бенчмарки, проверка поведения)
+        # seed: зерно случайных решений стратегии (воспроизводимые прогоны)
         self.running = False
         self._thread: Optional[Thread] = None
         self.api_client_provider = api_client_provider
         self.ws_manager = ws_manager
         self.state_manager = state_manager
+        self.market = market
+        self._random = random.Random(seed)
         self.buys: Dict[str, List[float]] = {}  # накопленные покупки (цены) по базе
         self.stats = {
             'total_profit': 0.0,
@@ -30,6 +36,8 @@ class AutoTrader:
             'per_base': {},  # {BASE: {cycles, avg_buy, last_price}}
         }
         self._sleep_interval = 5.0
+        # Пары, удерживаемые автотрейдером в реестре подписок ws_manager
+        self._subscribed: List[str] = []
 
     def start(self):
         if self.running:
@@ -42,11 +50,12 @@ class AutoTrader:
 
     def stop(self):
         self.running = False
+        self._sync_subscriptions([])
         print("[AutoTrader] Остановлен")
         return True
 
     def _get_price(self, base: str, quote: str = 'USDT') -> float:
-        """Получить текущую цену из ws_manager либо вернуться к псевдо-данным"""
+        """Получить текущую цену из ws_manager, иначе из синтетического рынка (0 - цены нет, база пропускается)"""
         if self.ws_manager:
             data = self.ws_manager.get_data(f"{base}_{quote}")
             if data and data.get('ticker') and data['ticker'].get('last'):
@@ -54,8 +63,22 @@ class AutoTrader:
                     return float(data['ticker']['last'])
                 except Exception:
                     pass
-        # fallback псевдо-цена
-        return 100.0 + random.uniform(-2, 2)
+        if self.market is not None:
+            return self.market.price(f"{base}_{quote}")
+        return 0.0
+
+    def _sync_subscriptions(self, pairs: List[str]):
+        """Удерживать в реестре подписок ровно пары разрешенных к торговле баз"""
+        registry = getattr(self.ws_manager, 'subscriptions', None)
+        if registry is None or pairs == self._subscribed or (pairs and not self.running):
+            return
+        try:
+            # Нужна только последняя цена - уровень тикера
+            registry.acquire('autotrader', [p for p in pairs if p not in self._subscribed], tier=TIER_TICKER)
+            registry.release('autotrader', [p for p in self._subscribed if p not in pairs], all_refs=True)
+            self._subscribed = list(pairs)
+        except Exception as e:
+            print(f"[AutoTrader] Ошибка обновления подписок: {e}")
 
     def _get_params(self, base: str) -> dict:
         """Получить текущие параметры для базы"""
@@ -106,7 +129,7 @@ class AutoTrader:
         if len(self.buys[base]) >= max_stages:
             return
         # простое вероятностное условие (заглушка стратегии)
-        if random.random() < 0.20:
+        if self._random.random() < 0.20:
             start_volume = params.get('start_volume', 3.0)
             amount = str(start_volume / price) if price > 0 else '0.001'
             add_price = round(price * 0.995, 8)
@@ -177,29 +200,34 @@ class AutoTrader:
         """Основной цикл автоторговли (пер-валютный)"""
         while self.running:
             try:
-                if not self.state_manager.get_auto_trade_enabled():
-                    time.sleep(self._sleep_interval)
-                    continue
-                perms = self.state_manager.get_trading_permissions()  # {BASE: bool}
-                for base, enabled in perms.items():
-                    if not enabled:
-                        continue
-                    base = base.upper()
-                    current_price = self._get_price(base)
-                    if current_price <= 0:
-                        continue
-                    # старт цикла если нет активных покупок
-                    if not self.buys.get(base):
-                        self._start_new_cycle(base, current_price)
-                    else:
-                        self._maybe_add_buy(base, current_price)
-                        self._maybe_sell_cycle(base, current_price)
-                    # обновляем last_price в статистике
-                    self.stats['per_base'].setdefault(base, {'cycles': 0, 'avg_buy': 0, 'last_price': 0})
-                    self.stats['per_base'][base]['last_price'] = current_price
-                time.sleep(self._sleep_interval)
+                self.run_once()
             except Exception as e:
                 print(f"[AutoTrader] Ошибка цикла: {e}")
-                time.sleep(self._sleep_interval)
+            time.sleep(self._sleep_interval)
+
+    def run_once(self):
+        """Один проход по разрешенным базам (цикл _run; бенчмарки вызывают напрямую)"""
+        if not self.state_manager.get_auto_trade_enabled():
+            self._sync_subscriptions([])
+            return
+        perms = self.state_manager.get_trading_permissions()  # {BASE: bool}
+        # Цены берутся из кэша WS - пары разрешенных баз не должны отписываться
+        self._sync_subscriptions(sorted(f"{b.upper()}_USDT" for b, enabled in perms.items() if enabled))
+        for base, enabled in perms.items():
+            if not enabled:
+                continue
+            base = base.upper()
+            current_price = self._get_price(base)
+            if current_price <= 0:
+                continue
+            # старт цикла если нет активных покупок
+            if not self.buys.get(base):
+                self._start_new_cycle(base, current_price)
+            else:
+                self._maybe_add_buy(base, current_price)
+                self._maybe_sell_cycle(base, current_price)
+            # обновляем last_price в статистике
+            self.stats['per_base'].setdefault(base, {'cycles': 0, 'avg_buy': 0, 'last_price': 0})
+            self.stats['per_base'][base]['last_price'] = current_price
 
 # Конец файла
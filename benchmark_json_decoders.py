@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк декодеров JSON на кадрах Gate.io WebSocket
+
+Использование:
+    python benchmark_json_decoders.py                 # типовые кадры (тикер, стакан, диффы, сделки, pong)
+    python benchmark_json_decoders.py frames.jsonl    # записанные кадры, по одному в строке (.gz/.xz тоже)
+"""
+
+import json
+import random
+import sys
+import time
+from collections import OrderedDict
+
+import json_codec
+from capture import iter_capture
+
+
+def sample_frames(seed: int = 7):
+    """Типовые кадры в формате Gate.io v4 (стакан 20 уровней, дифф, тикер, сделка, служебные)"""
+    rnd = random.Random(seed)
+    now = int(time.time())
+    mid = 65000.0
+
+    def levels(side):
+        return [[f"{mid + side * (i + 1) * 0.1:.1f}", f"{rnd.uniform(0.001, 2):.6f}"] for i in range(20)]
+
+    frames = OrderedDict()
+    frames['order_book'] = json.dumps({
+        "time": now, "time_ms": now * 1000, "channel": "spot.order_book", "event": "update",
+        "result": {"t": now * 1000, "lastUpdateId": 48791820, "s": "BTC_USDT", "asks": levels(1), "bids": levels(-1)}
+    }, separators=(',', ':'))
+    frames['order_book_update'] = json.dumps({
+        "time": now, "time_ms": now * 1000, "channel": "spot.order_book_update", "event": "update",
+        "result": {"t": now * 1000, "e": "depthUpdate", "E": now, "s": "BTC_USDT", "U": 48776301, "u": 48776306,
+                   "b": levels(-1)[:3], "a": levels(1)[:2]}
+    }, separators=(',', ':'))
+    frames['ticker'] = json.dumps({
+        "time": now, "time_ms": now * 1000, "channel": "spot.tickers", "event": "update",
+        "result": {"currency_pair": "BTC_USDT", "last": "65000.1", "lowest_ask": "65000.2", "highest_bid": "65000.1",
+                   "change_percentage": "-0.53", "base_volume": "7813.1", "quote_volume": "507850123.6",
+                   "high_24h": "65900", "low_24h": "64310"}
+    }, separators=(',', ':'))
+    frames['trade'] = json.dumps({
+        "time": now, "time_ms": now * 1000, "channel": "spot.trades", "event": "update",
+        "result": {"id": 309143071, "create_time": now, "create_time_ms": f"{now * 1000}.123", "side": "sell",
+                   "currency_pair": "BTC_USDT", "amount": "0.0153", "price": "65000.1", "range": "2390902-2390902"}
+    }, separators=(',', ':'))
+    frames['pong'] = json.dumps({"time": now, "time_ms": now * 1000, "channel": "spot.pong", "event": "", "result": None},
+                                separators=(',', ':'))
+    frames['subscribe_ack'] = json.dumps({
+        "time": now, "time_ms": now * 1000, "channel": "spot.tickers", "event": "subscribe",
+        "payload": ["BTC_USDT"], "result": {"status": "success"}
+    }, separators=(',', ':'))
+    return frames
+
+
+def load_frames(path: str):
+    """Записанные кадры, сгруппированные по каналу"""
+    frames = OrderedDict()
+    for _, frame in iter_capture(path):
+        channel = json_codec._CHANNEL_PATTERN.search(frame[:160])
+        frames.setdefault(channel.group(1) if channel else 'other', []).append(frame)
+    return frames
+
+
+def measure(func, frames, min_time: float = 0.3) -> float:
+    """Среднее время вызова на кадр в микросекундах"""
+    rounds = 0
+    started = time.perf_counter()
+    while True:
+        for frame in frames:
+            func(frame)
+        rounds += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return elapsed / (rounds * len(frames)) * 1e6
+
+
+def main():
+    if len(sys.argv) > 1:
+        groups = load_frames(sys.argv[1])
+    else:
+        groups = OrderedDict((name, [frame]) for name, frame in sample_frames().items())
+
+    decoders = json_codec.available_decoders()
+    print("=" * 80)
+    print(f"ДЕКОДЕРЫ JSON: {', '.join(decoders)} (выбран: {json_codec.DECODER_NAME})")
+    print("=" * 80)
+    header = f"{'кадр':<22}{'байт':>8}" + "".join(f"{name + ' мкс':>14}" for name in decoders) + f"{'фильтр мкс':>14}"
+    print(header)
+    print("-" * len(header))
+    for name, frames in groups.items():
+        size = sum(len(frame) for frame in frames) / len(frames)
+        row = f"{name:<22}{size:>8.0f}"
+        for loads in decoders.values():
+            row += f"{measure(loads, frames):>14.2f}"
+        row += f"{measure(json_codec.classify_frame, frames):>14.2f}"
+        print(row)
+    print("-" * len(header))
+    print("фильтр - classify_frame: pong и подтверждения подписки обрабатываются без разбора JSON")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Capture Module
+Запись сырых кадров WebSocket с отметкой времени получения в сжатые файлы по суткам
+"""
+
+import gzip
+import json
+import lzma
+import os
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from data_limits import DataLimits
+
+logger = logging.getLogger(__name__)
+
+# Сжатие: (расширение файла, функция открытия на дозапись)
+COMPRESSIONS = {
+    'gzip': ('.jsonl.gz', lambda path: gzip.open(path, 'ab', compresslevel=6)),
+    'lzma': ('.jsonl.xz', lambda path: lzma.open(path, 'ab', preset=3)),
+}
+
+
+class CaptureRecorder:
+    """
+    Запись кадров в файлы {prefix}-ГГГГММДД[-N].jsonl.gz|.xz
+
+    Строка файла - {"ts": время получения (time.time()), "frame": "<сырой кадр>"}, тот же
+    формат читают benchmark_json_decoders.py и воспроизведение. Файлы только дописываются:
+    после перезапуска запись того же дня продолжается новым сжатым блоком в конце файла
+    (gzip и xz допускают склейку потоков). Файл меняется при смене суток UTC и при
+    превышении rotate_bytes.
+
+    record() вызывается в потоке чтения сокета и стоит одного добавления в deque;
+    сжатие и запись выполняет свой поток раз в flush_interval. Очередь ограничена
+    max_pending кадрами - при отставании диска новые кадры отбрасываются (счетчик dropped),
+    а поток чтения не ждет.
+    """
+
+    def __init__(self, directory: Optional[str] = None, compression: Optional[str] = None,
+                 max_pending: Optional[int] = None, rotate_bytes: Optional[int] = None,
+                 flush_interval: Optional[float] = None, prefix: str = 'capture'):
+        """
+        Args:
+            directory: Каталог файлов (по умолчанию DataLimits.WS_CAPTURE_DIR)
+            compression: gzip | lzma (по умолчанию DataLimits.WS_CAPTURE_COMPRESSION)
+            max_pending: Максимум кадров, ожидающих записи
+            rotate_bytes: Размер файла, после которого начинается следующий файл того же дня
+            flush_interval: Интервал записи на диск в секундах
+            prefix: Начало имени файлов
+        """
+        self.directory = directory or DataLimits.WS_CAPTURE_DIR
+        self.compression = (compression or DataLimits.WS_CAPTURE_COMPRESSION).lower()
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f"Неизвестное сжатие {self.compression} (доступны: {', '.join(COMPRESSIONS)})")
+        self.max_pending = max_pending or DataLimits.WS_CAPTURE_MAX_PENDING
+        self.rotate_bytes = rotate_bytes or DataLimits.WS_CAPTURE_ROTATE_MB * 1024 * 1024
+        self.flush_interval = flush_interval or DataLimits.WS_CAPTURE_FLUSH_SECONDS
+        self.prefix = prefix
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.files = 0
+        self.path: Optional[str] = None
+        self._pending: deque = deque()
+        self._file = None
+        self._day: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def record(self, frame: Any, received_at: float):
+        """Поставить кадр в очередь записи (поток чтения сокета)"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((received_at, frame))
+        self.recorded += 1
+
+    def start(self) -> 'CaptureRecorder':
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="ws-capture", daemon=True)
+        self._thread.start()
+        logger.info(f"Запись кадров WebSocket в {self.directory} ({self.compression})")
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Записать оставшиеся кадры и закрыть файл"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info(f"Запись кадров остановлена: записано {self.written}, отброшено {self.dropped}")
+
+    def _writer_loop(self):
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self._write_pending()
+            self._write_pending()
+        except Exception as e:
+            logger.error(f"Ошибка записи кадров: {e}")
+        finally:
+            self._close_file()
+
+    def _write_pending(self):
+        """Сжать и дописать накопленные кадры (поток записи)"""
+        pending = self._pending
+        if not pending:
+            return
+        lines = []
+        day = self._day
+        while pending:
+            received_at, frame = pending.popleft()
+            if isinstance(frame, bytes):
+                frame = frame.decode('utf-8', 'replace')
+            frame_day = time.strftime('%Y%m%d', time.gmtime(received_at))
+            if frame_day != day:
+                # Кадры прошедших суток дописываются в их файл до перехода к новому
+                self._write_lines(lines)
+                lines = []
+                self._open_file(frame_day)
+                day = frame_day
+            lines.append(f'{{"ts":{received_at:.6f},"frame":{json.dumps(frame, ensure_ascii=False)}}}\n')
+        self._write_lines(lines)
+        if self.path and os.path.getsize(self.path) >= self.rotate_bytes:
+            self._open_file(day)
+
+    def _write_lines(self, lines):
+        if lines:
+            self._file.write(''.join(lines).encode('utf-8'))
+            self._file.flush()
+            self.written += len(lines)
+
+    def _open_file(self, day: str):
+        """Открыть файл суток на дозапись: первый с местом до rotate_bytes"""
+        self._close_file()
+        extension, opener = COMPRESSIONS[self.compression]
+        index = 0
+        while True:
+            suffix = f"-{index}" if index else ""
+            path = os.path.join(self.directory, f"{self.prefix}-{day}{suffix}{extension}")
+            if not os.path.exists(path) or os.path.getsize(path) < self.rotate_bytes:
+                break
+            index += 1
+        self._file = opener(path)
+        self._day = day
+        self.path = path
+        self.files += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception as e:
+                logger.error(f"Ошибка закрытия файла записи {self.path}: {e}")
+            self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'directory': self.directory,
+            'compression': self.compression,
+            'path': self.path,
+            'files': self.files,
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+            'max_pending': self.max_pending
+        }
+
+
+def iter_capture(path: str) -> Iterator[Tuple[Optional[float], str]]:
+    """
+    Кадры файла записи по порядку (.gz/.xz или без сжатия)
+
+    Yields:
+        (время получения, кадр); для файлов из одних кадров по строке - (None, кадр)
+    """
+    opener = gzip.open if path.endswith('.gz') else lzma.open if path.endswith('.xz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            # Формат записи: {"ts": ..., "frame": "<сырой кадр>"} или сам кадр
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'frame' in record:
+                yield record.get('ts'), record['frame']
+            else:
+                yield None, line
+
+
+# Активная запись процесса (None - запись выключена)
+_recorder: Optional[CaptureRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_active_recorder() -> Optional[CaptureRecorder]:
+    """Текущая запись (читается в потоке чтения сокета на каждый кадр, без блокировки)"""
+    return _recorder
+
+
+def start_capture(**kwargs) -> CaptureRecorder:
+    """Включить запись всех кадров всех соединений (повторный вызов возвращает текущую)"""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None or not _recorder.running:
+            _recorder = CaptureRecorder(**kwargs).start()
+        return _recorder
+
+
+def stop_capture() -> Optional[Dict[str, Any]]:
+    """Выключить запись; возвращает ее итоговую статистику"""
+    global _recorder
+    with _recorder_lock:
+        recorder, _recorder = _recorder, None
+    if recorder is None:
+        return None
+    recorder.stop()
+    return recorder.stats()
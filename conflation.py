@@ -0,0 +1,180 @@
+"""
+Conflation Module
+Конфляция обновлений рыночных данных: последнее значение на ключ (пара, канал)
+и собственная частота доставки для каждого потребителя
+"""
+
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ConflatingConsumer:
+    """
+    Потребитель обновлений с конфляцией
+
+    offer() вызывается в потоке чтения WebSocket и стоит O(1): значение кладется в словарь
+    ожидающих, повторное обновление того же ключа до доставки заменяет предыдущее
+    (счетчик dropped). Поэтому медленный потребитель (SSE клиент, автотрейдер, запись)
+    никогда не накапливает очередь больше числа ключей.
+
+    Доставка - либо собственным потоком с вызовом handler (start), либо вытягиванием
+    пачек через drain() в потоке потребителя.
+    """
+
+    def __init__(self, name: str, handler: Optional[Callable[[Hashable, Any], None]] = None,
+                 max_rate: Optional[float] = None, pairs: Optional[Iterable[str]] = None):
+        """
+        Args:
+            name: Имя потребителя (для статистики)
+            handler: Обработчик (ключ, значение) для режима с собственным потоком
+            max_rate: Максимум доставок пачек в секунду (None или 0 - без ограничения)
+            pairs: Интересующие пары (None - все)
+        """
+        self.name = name
+        self.pairs = frozenset(pair.upper() for pair in pairs) if pairs is not None else None
+        self.handler = handler
+        self.min_interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0.0
+        self.offered = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._pending: Dict[Hashable, Any] = {}
+        self._last_drain = 0.0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def max_rate(self) -> Optional[float]:
+        return 1.0 / self.min_interval if self.min_interval else None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def set_pairs(self, pairs: Optional[Iterable[str]]):
+        """Заменить набор интересующих пар (None - все); ожидающие обновления других пар отбрасываются"""
+        new_pairs = frozenset(pair.upper() for pair in pairs) if pairs is not None else None
+        with self._cond:
+            self.pairs = new_pairs
+            if new_pairs is not None:
+                self._pending = {key: value for key, value in self._pending.items()
+                                 if not isinstance(key, tuple) or key[0] in new_pairs}
+
+    def offer(self, key: Hashable, value: Any):
+        """Положить обновление; более старое значение того же ключа отбрасывается"""
+        with self._cond:
+            if self._closed:
+                return
+            self.offered += 1
+            if key in self._pending:
+                self.dropped += 1
+            self._pending[key] = value
+            self._cond.notify()
+
+    def drain(self, timeout: Optional[float] = None) -> Dict[Hashable, Any]:
+        """
+        Дождаться и забрать накопленные обновления с учетом частоты доставки
+
+        Args:
+            timeout: Максимальное ожидание в секундах (None - без ограничения)
+
+        Returns:
+            {ключ: последнее значение} в порядке первого поступления; пустой словарь
+            по истечении timeout или после close()
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                ready_at = self._last_drain + self.min_interval
+                if self._pending and now >= ready_at:
+                    batch, self._pending = self._pending, {}
+                    self._last_drain = now
+                    self.delivered += len(batch)
+                    return batch
+                if deadline is not None and now >= deadline:
+                    break
+                # Ждем первого обновления или окончания интервала частоты доставки
+                wait = ready_at - now if self._pending else None
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+        return {}
+
+    def start(self) -> 'ConflatingConsumer':
+        """Запустить поток доставки в handler"""
+        if self.handler is None:
+            raise ValueError(f"Потребитель {self.name} без обработчика работает только через drain()")
+        self._thread = threading.Thread(target=self._deliver_loop, name=f"conflation-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _deliver_loop(self):
+        while not self._closed:
+            for key, value in self.drain().items():
+                try:
+                    self.handler(key, value)
+                except Exception as e:
+                    logger.error(f"Ошибка потребителя {self.name} для {key}: {e}")
+
+    def close(self):
+        """Остановить доставку и отбросить ожидающие обновления"""
+        with self._cond:
+            self._closed = True
+            self._pending = {}
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'offered': self.offered,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+            'max_rate': self.max_rate
+        }
+
+
+class UpdateConflator:
+    """
+    Раздача обновлений потребителям с конфляцией
+
+    Набор потребителей хранится кортежем, который заменяется целиком при изменении,
+    поэтому offer() в потоке чтения WebSocket проходит без общей блокировки.
+    """
+
+    def __init__(self):
+        self._consumers: Tuple[ConflatingConsumer, ...] = ()
+        self._lock = threading.Lock()
+
+    def add_consumer(self, consumer: ConflatingConsumer) -> ConflatingConsumer:
+        with self._lock:
+            self._consumers = self._consumers + (consumer,)
+        return consumer
+
+    def remove_consumer(self, consumer: ConflatingConsumer):
+        with self._lock:
+            self._consumers = tuple(item for item in self._consumers if item is not consumer)
+
+    @property
+    def consumers(self) -> Tuple[ConflatingConsumer, ...]:
+        return self._consumers
+
+    def offer(self, pair: str, channels: Iterable[str], value: Any):
+        """Раздать значение всем потребителям под ключами (пара, канал)"""
+        consumers = self._consumers
+        if not consumers:
+            return
+        keys: List[Tuple[str, str]] = [(pair, channel) for channel in channels]
+        for consumer in consumers:
+            if consumer.pairs is not None and pair not in consumer.pairs:
+                continue
+            for key in keys:
+                consumer.offer(key, value)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики доставленных и отброшенных обновлений по потребителям"""
+        return {consumer.name: consumer.stats() for consumer in self._consumers}
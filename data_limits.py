@@ -12,6 +12,32 @@ class DataLimits:
     MAX_TRADES_HISTORY = 50        # Максимум сделок в истории для пары
     CACHE_TTL_SECONDS = 300        # Время жизни кэша без обновлений (5 минут)
     
+    # WebSocket соединения
+    WS_MULTIPLEX = True            # Несколько пар в одном WS соединении
+    WS_PAIRS_PER_CONNECTION = 25   # Максимум пар в одном мультиплексированном соединении
+    WS_INCREMENTAL_ORDERBOOK = True  # Стакан по диффам spot.order_book_update вместо снимков
+    WS_ORDERBOOK_SNAPSHOT_DEPTH = 100  # Глубина REST снимка для синхронизации стакана
+    WS_ORDERBOOK_LOCAL_LEVELS = 500  # Максимум уровней локального стакана на сторону
+    WS_DISPATCH_WORKERS = 0        # Потоки разбора кадров вне потока чтения сокета (0 - разбор в потоке чтения)
+    WS_METRICS = True              # Гистограммы задержек и частоты кадров по каналам и парам
+    WS_JSON_DECODER = 'auto'       # Разбор кадров: auto (orjson > ujson > json) | orjson | ujson | json
+    WS_SUBSCRIPTION_GRACE_SECONDS = 60  # Задержка отписки пары после ухода последнего потребителя (и срок аренды)
+    WS_MARKET_URL = None           # Свой WS рыночных данных (например, ws://127.0.0.1:8765/ws/v4/ из mock_gateio_server.py)
+    WS_MARKET_REST_HOST = None     # Свой REST хост снимков стакана (например, http://127.0.0.1:8765)
+    
+    # Запись сырых кадров WebSocket для воспроизведения
+    WS_CAPTURE = False             # Включить запись при создании менеджера
+    WS_CAPTURE_DIR = 'captures'    # Каталог файлов записи (по файлу в сутки UTC)
+    WS_CAPTURE_COMPRESSION = 'gzip'  # gzip (.jsonl.gz, быстрее) | lzma (.jsonl.xz, компактнее)
+    WS_CAPTURE_MAX_PENDING = 20000  # Максимум кадров в памяти до записи (сверх - отбрасываются)
+    WS_CAPTURE_ROTATE_MB = 256     # Новый файл того же дня после этого размера
+    WS_CAPTURE_FLUSH_SECONDS = 1.0  # Интервал записи накопленных кадров на диск
+    
+    # Поток рыночных данных для браузера (SSE)
+    SSE_MAX_UPDATES_PER_SECOND = 4  # Максимум отправок пачки обновлений в секунду одному клиенту
+    SSE_HEARTBEAT_SECONDS = 15     # Интервал keep-alive комментариев при отсутствии обновлений
+    SSE_MAX_PAIRS = 20             # Максимум пар в одном потоке
+    
     # Файлы конфигурации
     MAX_CURRENCIES = 50            # Максимум валют в списке
     MAX_ACCOUNTS = 10              # Максимум аккаунтов
@@ -0,0 +1,84 @@
+"""
+Dispatch Module
+Пул потоков разбора и применения кадров WebSocket вне потока чтения сокета
+"""
+
+import queue
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchPool:
+    """
+    Пул обработчиков с сохранением порядка по ключу
+
+    Задачи одного ключа (торговой пары) всегда попадают в очередь одного и того же
+    потока, поэтому обновления пары применяются строго в порядке получения, а разные
+    пары обрабатываются параллельно. Очереди не ограничены: диффы стакана нельзя
+    отбрасывать, глубину очередей видно в stats().
+    """
+
+    def __init__(self, workers: int, name: str = "ws-dispatch"):
+        """
+        Args:
+            workers: Количество потоков (>= 1)
+            name: Префикс имен потоков
+        """
+        self.workers = max(1, int(workers))
+        self._queues: List[queue.SimpleQueue] = [queue.SimpleQueue() for _ in range(self.workers)]
+        self._submitted = [0] * self.workers
+        self._processed = [0] * self.workers
+        self._max_depth = [0] * self.workers
+        self._threads = [
+            threading.Thread(target=self._worker, args=(index,), name=f"{name}-{index}", daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: Optional[Hashable], func: Callable, *args: Any):
+        """
+        Поставить задачу в очередь потока, закрепленного за ключом
+
+        Args:
+            key: Ключ упорядочивания (пара); None - первый поток
+            func, args: Задача
+        """
+        index = hash(key) % self.workers if key is not None else 0
+        work_queue = self._queues[index]
+        work_queue.put((func, args))
+        self._submitted[index] += 1
+        depth = work_queue.qsize()
+        if depth > self._max_depth[index]:
+            self._max_depth[index] = depth
+
+    def _worker(self, index: int):
+        work_queue = self._queues[index]
+        while True:
+            item = work_queue.get()
+            if item is None:
+                break
+            func, args = item
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика в потоке диспетчера #{index}: {e}")
+            self._processed[index] += 1
+
+    def shutdown(self):
+        """Остановить потоки после обработки уже поставленных задач"""
+        for work_queue in self._queues:
+            work_queue.put(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очередей и счетчики задач по потокам"""
+        return {
+            'workers': self.workers,
+            'depth': [work_queue.qsize() for work_queue in self._queues],
+            'max_depth': list(self._max_depth),
+            'submitted': list(self._submitted),
+            'processed': list(self._processed)
+        }
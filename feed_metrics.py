@@ -0,0 +1,202 @@
+"""
+Feed Metrics Module
+Метрики потока рыночных данных: задержки биржа -> получение -> кэш, частота и объем кадров
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Tuple
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек в миллисекундах с фиксированными границами корзин
+
+    Запись - бинарный поиск корзины и пара сложений; перцентили оцениваются по
+    верхней границе корзины. Отрицательные значения (расхождение часов с биржей)
+    попадают в первую корзину, минимум хранится отдельно.
+    """
+
+    BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, value_ms: float):
+        self.counts[bisect_left(self.BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if self.min is None or value_ms < self.min:
+            self.min = value_ms
+        if self.max is None or value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Оценка перцентиля (верхняя граница корзины; для последней - максимум)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= target and bucket:
+                return self.BOUNDS_MS[index] if index < len(self.BOUNDS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'min': round(self.min, 3) if self.min is not None else None,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': round(self.max, 3) if self.max is not None else None,
+            'buckets': {f"le_{bound}": count for bound, count in zip(self.BOUNDS_MS, self.counts) if count}
+        }
+
+
+class RateCounter:
+    """Скользящая частота событий и байт за последние WINDOW секунд (кольцо посекундных корзин)"""
+
+    WINDOW = 10
+
+    __slots__ = ('_events', '_bytes', '_seconds', 'total_events', 'total_bytes')
+
+    def __init__(self):
+        size = self.WINDOW + 1
+        self._events = [0] * size
+        self._bytes = [0] * size
+        self._seconds = [0] * size
+        self.total_events = 0
+        self.total_bytes = 0
+
+    def add(self, size_bytes: int, now: float):
+        second = int(now)
+        index = second % len(self._seconds)
+        if self._seconds[index] != second:
+            self._seconds[index] = second
+            self._events[index] = 0
+            self._bytes[index] = 0
+        self._events[index] += 1
+        self._bytes[index] += size_bytes
+        self.total_events += 1
+        self.total_bytes += size_bytes
+
+    def rates(self, now: float) -> Tuple[float, float]:
+        """(кадров/сек, байт/сек) по завершенным секундам окна"""
+        current = int(now)
+        events = bytes_ = 0
+        for index, second in enumerate(self._seconds):
+            if current - self.WINDOW <= second < current:
+                events += self._events[index]
+                bytes_ += self._bytes[index]
+        return events / self.WINDOW, bytes_ / self.WINDOW
+
+
+class _SeriesMetrics:
+    """Метрики одного ряда (канал или канал + пара)"""
+
+    __slots__ = ('exchange_to_receive', 'queue_wait', 'decode', 'apply', 'receive_to_applied', 'rate')
+
+    def __init__(self):
+        self.exchange_to_receive = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+        self.decode = LatencyHistogram()
+        self.apply = LatencyHistogram()
+        self.receive_to_applied = LatencyHistogram()
+        self.rate = RateCounter()
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        messages_per_sec, bytes_per_sec = self.rate.rates(now)
+        return {
+            'messages': self.rate.total_events,
+            'bytes': self.rate.total_bytes,
+            'messages_per_sec': round(messages_per_sec, 2),
+            'bytes_per_sec': round(bytes_per_sec, 1),
+            'exchange_to_receive_ms': self.exchange_to_receive.to_dict(),
+            'queue_wait_ms': self.queue_wait.to_dict(),
+            'decode_ms': self.decode.to_dict(),
+            'apply_ms': self.apply.to_dict(),
+            'receive_to_applied_ms': self.receive_to_applied.to_dict()
+        }
+
+
+class FeedMetrics:
+    """
+    Метрики кадров обновлений по каналам и по (канал, пара)
+
+    exchange_to_receive - от отметки времени биржи (time_ms кадра) до получения сокетом:
+    биржа + сеть (включает расхождение часов). queue_wait - ожидание в очереди диспетчера,
+    decode - разбор JSON, apply - обработчики (кэш и его блокировки), receive_to_applied -
+    все вместе от получения до применения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels: Dict[str, _SeriesMetrics] = {}
+        self._pairs: Dict[Tuple[str, str], _SeriesMetrics] = {}
+        self.started_at = time.time()
+
+    def record(self, channel: str, pair: Optional[str], size_bytes: int, exchange_ms: Optional[float],
+               received_at: float, started_at: float, decoded_at: float, applied_at: float):
+        """
+        Записать обработанный кадр обновления
+
+        Args:
+            channel: Канал
+            pair: Торговая пара (None - без разбивки по паре)
+            size_bytes: Размер кадра
+            exchange_ms: Отметка времени биржи, мс Unix (None - нет в кадре)
+            received_at, started_at, decoded_at, applied_at: time.time() получения кадра,
+                начала обработки, окончания разбора и возврата обработчиков
+        """
+        with self._lock:
+            series = [self._channels.get(channel) or self._channels.setdefault(channel, _SeriesMetrics())]
+            if pair:
+                key = (channel, pair)
+                series.append(self._pairs.get(key) or self._pairs.setdefault(key, _SeriesMetrics()))
+            for item in series:
+                item.rate.add(size_bytes, received_at)
+                if exchange_ms is not None:
+                    item.exchange_to_receive.record(received_at * 1000 - exchange_ms)
+                item.queue_wait.record((started_at - received_at) * 1000)
+                item.decode.record((decoded_at - started_at) * 1000)
+                item.apply.record((applied_at - decoded_at) * 1000)
+                item.receive_to_applied.record((applied_at - received_at) * 1000)
+
+    def reset(self):
+        with self._lock:
+            self._channels.clear()
+            self._pairs.clear()
+            self.started_at = time.time()
+
+    def snapshot(self, pair: Optional[str] = None) -> Dict[str, Any]:
+        """Метрики для эндпоинта (pair - только ряды этой пары)"""
+        now = time.time()
+        with self._lock:
+            pairs: Dict[str, Dict[str, Any]] = {}
+            for (channel, series_pair), series in self._pairs.items():
+                if pair is None or series_pair == pair.upper():
+                    pairs.setdefault(series_pair, {})[channel] = series.to_dict(now)
+            return {
+                'since': self.started_at,
+                'channels': {channel: series.to_dict(now) for channel, series in self._channels.items()},
+                'pairs': pairs
+            }
+
+
+# Глобальные метрики процесса
+_feed_metrics = FeedMetrics()
+
+
+def get_feed_metrics() -> FeedMetrics:
+    """Получить метрики потока рыночных данных процесса"""
+    return _feed_metrics
@@ -98,6 +98,16 @@ class GateAPIClient:
         
         return self._request('POST', '/spot/orders', data=order_data)
     
+    def get_order_book(self, currency_pair: str, limit: int = 20, with_id: bool = False):
+        """Получить стакан (with_id=True добавляет id снимка для синхронизации с WS диффами)"""
+        params = {
+            "currency_pair": currency_pair.upper(),
+            "limit": limit
+        }
+        if with_id:
+            params["with_id"] = "true"
+        return self._request('GET', '/spot/order_book', params=params)
+    
     def get_spot_orders(self, currency_pair: str, status: str = "open"):
         """Получить список ордеров"""
         params = {
@@ -5,28 +5,144 @@ Gate.io WebSocket Module
 """
 
 import json
+import random
+import re
 import time
 import hmac
 import hashlib
 import threading
 import websocket
-from datetime import datetime
-from typing import Callable, Dict, Any, Optional
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
 import logging
 from data_limits import DataLimits
+from gate_api_client import GateAPIClient
+from orderbook import CompactOrderBook, IncrementalOrderBook
+from trades_history import TradesRingBuffer
+from capture import get_active_recorder, start_capture
+from conflation import ConflatingConsumer, UpdateConflator
+from dispatch import DispatchPool
+from feed_metrics import FeedMetrics, get_feed_metrics
+import json_codec
+from json_codec import FRAME_PONG, FRAME_SUBSCRIBED, FRAME_UNSUBSCRIBED, classify_frame
+from scheduler import TimerHandle, get_scheduler
+from subscriptions import TIER_FULL, TIER_TOP, SubscriptionRegistry, tier_rank
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+class ContentionLock:
+    """threading.Lock со счетчиками конкуренции: сколько захватов пришлось ждать и как долго"""
+    
+    __slots__ = ('_lock', 'acquisitions', 'contended', 'wait_seconds')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+    
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        # Счетчики меняются только под самой блокировкой
+        self.acquisitions += 1
+        self.contended += 1
+        self.wait_seconds += time.perf_counter() - started
+        return True
+    
+    def release(self):
+        self._lock.release()
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_ms': round(self.wait_seconds * 1000, 3)
+        }
+
+
+class PairSnapshot(dict):
+    """
+    Неизменяемый снимок данных пары (ticker, orderbook, trades, last_update, version)
+    
+    last_update - время последней публикации (Unix timestamp, time.time()) для клиентов API;
+    возраст пары для TTL и вытеснения менеджер ведет отдельно по time.monotonic() (_recency).
+    
+    На каждое обновление публикуется новый объект, ссылка в кэше заменяется атомарно,
+    поэтому читатели работают без блокировок и никогда не видят частично обновленные данные.
+    sections хранит версию последнего изменения каждого раздела - по ней строятся
+    дельты для клиентов, передающих since=<version>.
+    """
+    
+    # Разделы, которые отдаются клиенту дельтой
+    SECTIONS = ('ticker', 'orderbook', 'trades')
+    
+    __slots__ = ()
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("PairSnapshot неизменяем, используйте evolve() или dict(snapshot)")
+    
+    __setitem__ = __delitem__ = update = pop = popitem = clear = setdefault = _readonly
+    
+    def evolve(self, **sections) -> 'PairSnapshot':
+        """Новый снимок с замененными разделами и следующим номером версии"""
+        version = self['version'] + 1
+        data = dict(self)
+        data.update(sections)
+        data['version'] = version
+        data['sections'] = dict(self['sections'], **dict.fromkeys(sections.keys() & set(self.SECTIONS), version))
+        data['last_update'] = time.time()
+        return PairSnapshot(data)
+
+
 class GateIOWebSocket:
     """WebSocket клиент для Gate.io"""
     
     # WebSocket URLs
     WS_URL_SPOT = "wss://api.gateio.ws/ws/v4/"
     
-    def __init__(self, api_key: str = None, api_secret: str = None, ws_url: str = None):
+    # Маршрут, получающий обновления канала по всем парам
+    ROUTE_WILDCARD = "*"
+    
+    # Каналы, которые Gate.io принимает списком пар в одном сообщении подписки
+    BATCH_CHANNELS = ("spot.tickers", "spot.trades", "spot.book_ticker")
+    
+    # Heartbeat (секунды): период проверки, ping при отсутствии данных, признак зависания
+    HEARTBEAT_INTERVAL = 5
+    PING_AFTER = 15
+    STALE_AFTER = 60
+    
+    # Переподключение: экспоненциальная задержка base * 2^попытка (не больше max),
+    # случайно уменьшенная до JITTER доли - разные соединения не переподключаются залпом
+    RECONNECT_BASE_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 30.0
+    RECONNECT_JITTER = 0.5
+    # Счетчик попыток сбрасывается по первому кадру данных или после стольких секунд
+    # работы соединения: сервер, который принимает соединение и сразу закрывает его,
+    # не должен возвращать задержку к базовой
+    RECONNECT_STABLE_AFTER = 10.0
+    
+    # Пара в сыром кадре (без разбора JSON) - ключ упорядочивания для пула диспетчера
+    _PAIR_PATTERN = re.compile(r'"(?:currency_pair|s)"\s*:\s*"([^"]+)"')
+    
+    def __init__(self, api_key: str = None, api_secret: str = None, ws_url: str = None,
+                 dispatcher: Optional[DispatchPool] = None):
         """
         Инициализация WebSocket клиента
         
@@ -34,18 +150,42 @@ class GateIOWebSocket:
             api_key: API ключ Gate.io (опционально для публичных данных)
             api_secret: API секрет Gate.io (опционально для публичных данных)
             ws_url: Полный WS URL (для testnet передаем wss://api-testnet.gateapi.io/ws/v4/)
+            dispatcher: Пул разбора кадров; None - разбор и обработчики в потоке чтения
         """
         self.api_key = api_key
         self.api_secret = api_secret
         self.ws_url = ws_url or self.WS_URL_SPOT
+        self.dispatcher = dispatcher
+        self.metrics: Optional[FeedMetrics] = get_feed_metrics() if DataLimits.WS_METRICS else None
+        # Разбор кадров: orjson/ujson при наличии (DataLimits.WS_JSON_DECODER), иначе json
+        self.decode: Callable[[Any], Any] = json_codec.loads
         self.ws = None
         self.ws_thread = None
-        self.ping_thread = None
+        # Таймер heartbeat в общем планировщике процесса (вместо потока на соединение)
+        self._heartbeat_timer: Optional[TimerHandle] = None
+        self._ping_thread: Optional[threading.Thread] = None
+        # Переподключение после обрыва (кроме явного disconnect)
+        self.auto_reconnect = True
+        self.reconnect_attempts = 0
+        self.reconnects = 0
+        self.on_reconnect: Optional[Callable[['GateIOWebSocket'], None]] = None
+        self._reconnect_timer: Optional[TimerHandle] = None
+        self._closing = False
+        self._opened_before = False
+        self._opened_at: Optional[float] = None
         self.is_running = False
         self.subscriptions = {}
-        self.callbacks = {}
+        # Таблица маршрутизации: (канал, пара) -> кортеж обработчиков
+        # Кортежи заменяются целиком (copy-on-write), поток чтения обходит их без блокировки
+        self.routes: Dict[Tuple[str, str], Tuple[Callable, ...]] = {}
+        self._routes_lock = threading.Lock()
         self.last_data_time = time.time()
+        self.last_frame_time = self.last_data_time
+        self.stale = False
         self.error: Optional[str] = None  # текст ошибки подключения
+        # Сигналы готовности: соединение открыто / получены первые данные
+        self.connected = threading.Event()
+        self.first_data = threading.Event()
     
     def _sign_message(self, channel: str, event: str, timestamp: int) -> str:
         """
@@ -72,15 +212,48 @@ class GateIOWebSocket:
         return signature
     
     def _on_message(self, ws, message):
-        """Обработчик входящих сообщений"""
+        """Обработчик входящих сообщений (поток чтения сокета)"""
+        received_at = self.last_frame_time = time.time()
+        if self.stale:
+            self.stale = False
+        # Запись сырых кадров (если включена) - только постановка в очередь потока записи
+        recorder = get_active_recorder()
+        if recorder is not None:
+            recorder.record(message, received_at)
+        # Служебные кадры распознаются по началу строки - без разбора JSON и очереди
+        kind, channel = classify_frame(message)
+        if kind == FRAME_PONG:
+            logger.debug(f"Pong получен: {channel}")
+            return
+        if kind == FRAME_SUBSCRIBED:
+            logger.info(f"Подписка успешна: {channel}")
+            return
+        if kind == FRAME_UNSUBSCRIBED:
+            logger.info(f"Отписка успешна: {channel}")
+            return
+        dispatcher = self.dispatcher
+        if dispatcher is None:
+            self._handle_message(ws, message, received_at)
+            return
+        # Поток чтения только ставит кадр в очередь потока, закрепленного за парой
+        match = self._PAIR_PATTERN.search(message) if isinstance(message, str) else None
+        dispatcher.submit(match.group(1) if match else None, self._handle_message, ws, message, received_at)
+    
+    def _handle_message(self, ws, message, received_at: Optional[float] = None):
+        """Разбор кадра и вызов обработчиков маршрута"""
         try:
-            data = json.loads(message)
+            started_at = time.time()
+            data = self.decode(message)
+            decoded_at = time.time()
             
             # Обработка различных типов сообщений
             if 'event' in data:
                 event = data['event']
                 
-                if event == 'subscribe':
+                if data.get('error'):
+                    logger.error(f"Ошибка {event} {data.get('channel')}: {data['error']}")
+                
+                elif event == 'subscribe':
                     logger.info(f"Подписка успешна: {data.get('channel')}")
                     
                 elif event == 'unsubscribe':
@@ -92,10 +265,16 @@ class GateIOWebSocket:
                     
                     # Обновляем время последних данных
                     self.last_data_time = time.time()
+                    if self.reconnect_attempts:
+                        # Соединение отдает данные - серия неудачных попыток закончилась
+                        self.reconnect_attempts = 0
+                    if not self.first_data.is_set():
+                        self.first_data.set()
                     
-                    # Вызов callback для этого канала
-                    if channel in self.callbacks:
-                        self.callbacks[channel](result)
+                    pair = self._dispatch(channel, result)
+                    if self.metrics is not None:
+                        self.metrics.record(channel, pair, len(message), self._exchange_time_ms(data, result),
+                                            received_at or started_at, started_at, decoded_at, time.time())
                         
             # Обработка ping-pong
             elif 'ping' in data:
@@ -103,30 +282,126 @@ class GateIOWebSocket:
                 ws.send(pong_message)
                 logger.debug(f"Pong отправлен: {data['ping']}")
                 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
+            # JSONDecodeError всех декодеров - подкласс ValueError
             logger.error(f"Ошибка декодирования JSON: {e}")
         except Exception as e:
             logger.error(f"Ошибка обработки сообщения: {e}")
     
-    def _ping_loop(self):
-        """Поток для отправки ping каждые 20 секунд (если нет данных в течение 15 сек)"""
-        while self.is_running:
+    @staticmethod
+    def _extract_pair(result) -> Optional[str]:
+        """Извлечь торговую пару из результата обновления (currency_pair или s)"""
+        item = result[0] if isinstance(result, list) and result else result
+        if not isinstance(item, dict):
+            return None
+        pair = item.get('currency_pair') or item.get('s')
+        return str(pair).upper() if pair else None
+    
+    @staticmethod
+    def _exchange_time_ms(data: Dict[str, Any], result) -> Optional[float]:
+        """Отметка времени биржи в мс: time_ms кадра или t стакана (секундный time слишком груб)"""
+        if 'time_ms' in data:
+            return float(data['time_ms'])
+        if isinstance(result, dict) and 't' in result:
+            return float(result['t'])
+        return None
+    
+    def _dispatch(self, channel: str, result) -> Optional[str]:
+        """
+        Передать обновление обработчикам пары и обработчикам-подписчикам на все пары
+        
+        Returns:
+            Пара обновления (None, если в результате ее нет)
+        """
+        routes = self.routes
+        pair = self._extract_pair(result)
+        handlers = routes.get((channel, pair), ()) if pair else ()
+        wildcard_handlers = routes.get((channel, self.ROUTE_WILDCARD), ())
+        
+        for handler in handlers + wildcard_handlers:
             try:
-                time.sleep(5)  # Проверяем каждые 5 секунд
-                
-                if not self.is_running:
-                    break
-                
-                # Если данных не было более 15 секунд, отправляем ping
-                time_since_last_data = time.time() - self.last_data_time
-                
-                if time_since_last_data > 15 and self.ws:
-                    ping_message = json.dumps({"time": int(time.time()), "channel": "spot.ping"})
-                    self.ws.send(ping_message)
-                    logger.debug(f"Ping отправлен (нет данных {time_since_last_data:.1f} сек)")
-                    
+                handler(result)
             except Exception as e:
-                logger.error(f"Ошибка в ping loop: {e}")
+                # Ошибка одного потребителя не должна мешать остальным
+                logger.error(f"Ошибка обработчика {channel} ({pair}): {e}")
+        return pair
+    
+    def add_route(self, channel: str, currency_pair: str, handler: Callable):
+        """
+        Добавить обработчик обновлений канала для пары
+        
+        Args:
+            channel: Название канала
+            currency_pair: Торговая пара или ROUTE_WILDCARD для всех пар канала
+            handler: Функция обратного вызова
+        """
+        key = (channel, currency_pair.upper())
+        with self._routes_lock:
+            handlers = self.routes.get(key, ())
+            if handler not in handlers:
+                self.routes[key] = handlers + (handler,)
+    
+    def remove_route(self, channel: str, currency_pair: str, handler: Optional[Callable] = None) -> bool:
+        """
+        Удалить обработчик (или все обработчики) канала для пары
+        
+        Args:
+            channel: Название канала
+            currency_pair: Торговая пара или ROUTE_WILDCARD
+            handler: Обработчик; None - удалить все обработчики маршрута
+            
+        Returns:
+            True, если у маршрута остались другие обработчики
+        """
+        key = (channel, currency_pair.upper())
+        with self._routes_lock:
+            if handler is None:
+                self.routes.pop(key, None)
+                return False
+            handlers = tuple(h for h in self.routes.get(key, ()) if h != handler)
+            if handlers:
+                self.routes[key] = handlers
+                return True
+            self.routes.pop(key, None)
+            return False
+    
+    def _heartbeat(self):
+        """Проверка соединения по таймеру общего планировщика: ping и признак устаревания"""
+        if not self.is_running or not self.ws:
+            return
+        now = time.time()
+        # Если данных не было более PING_AFTER секунд, отправляем ping
+        time_since_last_data = now - self.last_data_time
+        if time_since_last_data > self.PING_AFTER:
+            # Отправка на зависшем сокете может блокироваться - она идет в отдельном потоке,
+            # не больше одной на соединение, и не задерживает таймеры других соединений
+            ping_thread = self._ping_thread
+            if ping_thread is None or not ping_thread.is_alive():
+                ping_message = json.dumps({"time": int(now), "channel": "spot.ping"})
+                self._ping_thread = threading.Thread(target=self._send_ping, args=(self.ws, ping_message),
+                                                     name="ws-ping", daemon=True)
+                self._ping_thread.start()
+                logger.debug(f"Ping отправлен (нет данных {time_since_last_data:.1f} сек)")
+            else:
+                logger.debug("Предыдущий ping еще не отправлен")
+        # Никаких кадров (даже pong) дольше STALE_AFTER - соединение считаем зависшим
+        silence = now - self.last_frame_time
+        if silence > self.STALE_AFTER and not self.stale:
+            self.stale = True
+            logger.warning(f"WebSocket {self.ws_url}: нет кадров {silence:.0f} сек, переподключение")
+            # Закрытие завершит run_forever, дальше - обычное переподключение. На мертвом
+            # сокете close() ждет ответного кадра и может зависнуть на отправке - это
+            # делается в отдельном потоке, поток планировщика не блокируется
+            threading.Thread(target=self.ws.close, kwargs={'timeout': 0}, name="ws-stale-close",
+                             daemon=True).start()
+    
+    @staticmethod
+    def _send_ping(ws, ping_message: str):
+        """Отправить ping (поток ws-ping); ошибка сокета обработается переподключением"""
+        try:
+            ws.send(ping_message)
+        except Exception as e:
+            logger.debug(f"Ping не отправлен: {e}")
     
     def _on_error(self, ws, error):
         """Обработчик ошибок"""
@@ -137,6 +412,7 @@ class GateIOWebSocket:
         """Обработчик закрытия соединения"""
         logger.info(f"WebSocket соединение закрыто: {close_status_code} - {close_msg}")
         self.is_running = False
+        self.connected.clear()
         if close_status_code or close_msg:
             self.error = f"closed {close_status_code} {close_msg}".strip()
 
@@ -145,33 +421,116 @@ class GateIOWebSocket:
         logger.info("WebSocket соединение установлено")
         self.is_running = True
         self.error = None
+        self._opened_at = time.monotonic()
         
-        # Восстановление подписок после переподключения
-        for channel, payload in self.subscriptions.items():
+        # Восстановление подписок после переподключения (и отложенных до открытия)
+        for payload in self._resubscribe_payloads():
             ws.send(json.dumps(payload))
+        self.connected.set()
+        
+        if self._opened_before:
+            self.reconnects += 1
+            logger.info(f"WebSocket переподключен ({self.reconnects}), подписок: {len(self.subscriptions)}")
+            if self.on_reconnect:
+                try:
+                    self.on_reconnect(self)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика переподключения: {e}")
+        self._opened_before = True
+    
+    def _resubscribe_payloads(self) -> List[Dict[str, Any]]:
+        """Сохраненные подписки; для каналов со списком пар - одно сообщение на канал"""
+        payloads: List[Dict[str, Any]] = []
+        batched: Dict[str, Dict[str, Any]] = {}
+        for payload in list(self.subscriptions.values()):
+            channel = payload.get('channel')
+            if channel not in self.BATCH_CHANNELS or payload.get('event') != 'subscribe':
+                payloads.append(payload)
+                continue
+            merged = batched.get(channel)
+            if merged is None:
+                merged = batched[channel] = dict(payload, time=int(time.time()), payload=[])
+                payloads.append(merged)
+            merged['payload'].extend(pair for pair in payload['payload'] if pair not in merged['payload'])
+        return payloads
     
     def connect(self):
-        """Установить WebSocket соединение (с защитой от исключений)"""
+        """
+        Начать установку WebSocket соединения (с защитой от исключений)
+        
+        Не блокирует: соединение открывается в фоновом потоке, подписки,
+        сделанные до открытия, отправляются в _on_open. Для ожидания - wait_ready().
+        После обрыва соединение восстанавливается автоматически до disconnect().
+        """
         if self.ws and self.is_running:
             logger.warning("WebSocket уже подключен")
             return
+        self._closing = False
+        self._start_socket()
+        if self._heartbeat_timer is None:
+            self._heartbeat_timer = get_scheduler().call_every(
+                self.HEARTBEAT_INTERVAL, self._heartbeat, name=f"heartbeat {self.ws_url}")
+    
+    def _start_socket(self):
+        """Создать WebSocketApp и запустить поток чтения"""
         try:
             websocket.enableTrace(False)
-            self.ws = websocket.WebSocketApp(
+            ws = websocket.WebSocketApp(
                 self.ws_url,
                 on_message=self._on_message,
                 on_error=self._on_error,
                 on_close=self._on_close,
                 on_open=self._on_open
             )
-            self.ws_thread = threading.Thread(target=self.ws.run_forever, daemon=True)
+            self.ws = ws
+            self.ws_thread = threading.Thread(target=self._run_socket, args=(ws,), daemon=True)
             self.ws_thread.start()
-            self.ping_thread = threading.Thread(target=self._ping_loop, daemon=True)
-            self.ping_thread.start()
-            time.sleep(1)
         except Exception as e:
             self.error = f"connect exception: {e}"
             logging.error(f"WS connect failed: {e}")
+            self._schedule_reconnect()
+    
+    def _run_socket(self, ws):
+        """Поток чтения: run_forever до обрыва, затем планирование переподключения"""
+        try:
+            ws.run_forever()
+        except Exception as e:
+            self.error = f"run_forever exception: {e}"
+            logger.error(f"WebSocket run_forever завершился с ошибкой: {e}")
+        finally:
+            # Сокет мог быть уже заменен новым - планируем только для текущего
+            if ws is self.ws:
+                self.is_running = False
+                self.connected.clear()
+                self._schedule_reconnect()
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """Задержка перед попыткой переподключения с джиттером"""
+        delay = min(self.RECONNECT_MAX_DELAY, self.RECONNECT_BASE_DELAY * (2 ** min(attempt, 16)))
+        return delay * random.uniform(1.0 - self.RECONNECT_JITTER, 1.0)
+    
+    def _schedule_reconnect(self):
+        """Запланировать переподключение в общем планировщике (не более одного таймера)"""
+        if self._closing or not self.auto_reconnect:
+            return
+        if self._reconnect_timer is not None and not self._reconnect_timer.cancelled:
+            return
+        opened_at, self._opened_at = self._opened_at, None
+        if opened_at is not None and time.monotonic() - opened_at >= self.RECONNECT_STABLE_AFTER:
+            self.reconnect_attempts = 0
+        delay = self._backoff_delay(self.reconnect_attempts)
+        self.reconnect_attempts += 1
+        logger.warning(f"WebSocket {self.ws_url}: переподключение через {delay:.2f} сек "
+                       f"(попытка {self.reconnect_attempts})")
+        self._reconnect_timer = get_scheduler().call_later(delay, self._reconnect, name=f"reconnect {self.ws_url}")
+    
+    def _reconnect(self):
+        self._reconnect_timer = None
+        if self._closing:
+            return
+        self.stale = False
+        self.last_frame_time = time.time()
+        self._start_socket()
 
     def status(self) -> Dict[str, Any]:
         """Краткий статус соединения"""
@@ -180,18 +539,41 @@ class GateIOWebSocket:
             'error': self.error,
             'url': self.ws_url,
             'subs': list(self.subscriptions.keys()),
-            'last_data_age': round(time.time() - self.last_data_time, 2)
+            'ready': self.connected.is_set(),
+            'last_data_age': round(time.time() - self.last_data_time, 2),
+            'stale': self.stale,
+            'reconnects': self.reconnects,
+            'reconnect_attempts': self.reconnect_attempts
         }
 
+    def wait_ready(self, timeout: Optional[float] = None, first_data: bool = False) -> bool:
+        """
+        Дождаться открытия соединения (или первых данных)
+        
+        Args:
+            timeout: Максимальное время ожидания в секундах
+            first_data: Ждать первого обновления вместо открытия соединения
+            
+        Returns:
+            True, если событие произошло
+        """
+        event = self.first_data if first_data else self.connected
+        return event.wait(timeout)
+    
     def disconnect(self):
         """Закрыть WebSocket соединение"""
+        self._closing = True
+        if self._reconnect_timer is not None:
+            self._reconnect_timer.cancel()
+            self._reconnect_timer = None
+        if self._heartbeat_timer is not None:
+            self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
         if self.ws:
             self.is_running = False
             self.ws.close()
             if self.ws_thread:
                 self.ws_thread.join(timeout=2)
-            if self.ping_thread:
-                self.ping_thread.join(timeout=2)
             logger.info("WebSocket отключен")
     
     def subscribe_ticker(self, currency_pair: str, callback: Callable):
@@ -215,7 +597,7 @@ class GateIOWebSocket:
         }
         
         self.subscriptions[f"{channel}_{pair_formatted}"] = payload
-        self.callbacks[channel] = callback
+        self.add_route(channel, pair_formatted, callback)
         
         if self.ws and self.is_running:
             self.ws.send(json.dumps(payload))
@@ -245,12 +627,38 @@ class GateIOWebSocket:
         }
         
         self.subscriptions[f"{channel}_{pair_formatted}"] = payload
-        self.callbacks[channel] = callback
+        self.add_route(channel, pair_formatted, callback)
         
         if self.ws and self.is_running:
             self.ws.send(json.dumps(payload))
             logger.info(f"Подписка на стакан: {pair_formatted} (level={level}, interval={interval})")
     
+    def subscribe_orderbook_updates(self, currency_pair: str, interval: str, callback: Callable):
+        """
+        Подписаться на инкрементальные обновления стакана (диффы с номерами U/u)
+        
+        Args:
+            currency_pair: Торговая пара (например, BTC_USDT)
+            interval: Интервал обновления ("20ms", "100ms")
+            callback: Функция обратного вызова для обработки диффов
+        """
+        pair_formatted = currency_pair.upper()
+        
+        channel = "spot.order_book_update"
+        payload = {
+            "time": int(time.time()),
+            "channel": channel,
+            "event": "subscribe",
+            "payload": [pair_formatted, interval]
+        }
+        
+        self.subscriptions[f"{channel}_{pair_formatted}"] = payload
+        self.add_route(channel, pair_formatted, callback)
+        
+        if self.ws and self.is_running:
+            self.ws.send(json.dumps(payload))
+            logger.info(f"Подписка на обновления стакана: {pair_formatted} (interval={interval})")
+    
     def subscribe_trades(self, currency_pair: str, callback: Callable):
         """
         Подписаться на последние сделки
@@ -271,43 +679,99 @@ class GateIOWebSocket:
         }
         
         self.subscriptions[f"{channel}_{pair_formatted}"] = payload
-        self.callbacks[channel] = callback
+        self.add_route(channel, pair_formatted, callback)
         
         if self.ws and self.is_running:
             self.ws.send(json.dumps(payload))
             logger.info(f"Подписка на сделки: {pair_formatted}")
     
-    def unsubscribe(self, channel: str, currency_pair: str):
+    def subscribe_pairs(self, channel: str, currency_pairs: List[str], callback: Optional[Callable] = None):
+        """
+        Подписаться на канал сразу для нескольких пар одним сообщением
+        
+        Подходит для каналов, принимающих список пар (spot.tickers, spot.trades).
+        
+        Args:
+            channel: Название канала
+            currency_pairs: Список торговых пар
+            callback: Обработчик для каждой пары (None - маршруты уже заданы через add_route)
+        """
+        pairs_formatted = [pair.upper() for pair in currency_pairs]
+        if not pairs_formatted:
+            return
+        
+        now = int(time.time())
+        for pair_formatted in pairs_formatted:
+            # Храним по одной записи на пару, чтобы отписка была точечной
+            self.subscriptions[f"{channel}_{pair_formatted}"] = {
+                "time": now,
+                "channel": channel,
+                "event": "subscribe",
+                "payload": [pair_formatted]
+            }
+            if callback:
+                self.add_route(channel, pair_formatted, callback)
+        
+        if self.ws and self.is_running:
+            payload = {
+                "time": now,
+                "channel": channel,
+                "event": "subscribe",
+                "payload": pairs_formatted
+            }
+            self.ws.send(json.dumps(payload))
+            logger.info(f"Пакетная подписка {channel}: {len(pairs_formatted)} пар")
+    
+    def unsubscribe(self, channel: str, currency_pair: str, handler: Optional[Callable] = None):
         """
         Отписаться от канала
         
+        Подписка на бирже снимается только вместе с последним обработчиком маршрута:
+        на общем соединении канал пары могут читать и другие потребители.
+        
         Args:
             channel: Название канала
             currency_pair: Торговая пара
+            handler: Снять только этот обработчик маршрута; None - все обработчики
+            
+        Returns:
+            True, если подписка на канал пары снята (а не только обработчик)
         """
         # Gate.io WebSocket требует ЗАГЛАВНЫЕ буквы для пар
         pair_formatted = currency_pair.upper()
         
+        if self.remove_route(channel, pair_formatted, handler):
+            logger.debug(f"Канал {channel} - {pair_formatted} нужен другим обработчикам, подписка остается")
+            return False
+        subscription_key = f"{channel}_{pair_formatted}"
+        subscription = self.subscriptions.pop(subscription_key, None)
+        
+        # Для стакана отписка должна содержать те же аргументы (глубина, интервал)
         payload = {
             "time": int(time.time()),
             "channel": channel,
             "event": "unsubscribe",
-            "payload": [pair_formatted]
+            "payload": subscription['payload'] if subscription else [pair_formatted]
         }
         
-        subscription_key = f"{channel}_{pair_formatted}"
-        if subscription_key in self.subscriptions:
-            del self.subscriptions[subscription_key]
-        
         if self.ws and self.is_running:
             self.ws.send(json.dumps(payload))
             logger.info(f"Отписка от канала: {channel} - {pair_formatted}")
+        return True
 
 
 class PairWebSocketManager:
     """Менеджер WebSocket соединений для торговых пар"""
     
-    def __init__(self, api_key: str = None, api_secret: str = None, ws_url: str = None):
+    BATCH_CHANNELS = GateIOWebSocket.BATCH_CHANNELS
+    # Класс клиента соединения и режим загрузки снимков стакана (переопределяются при воспроизведении)
+    client_class = GateIOWebSocket
+    background_resync = True
+    
+    def __init__(self, api_key: str = None, api_secret: str = None, ws_url: str = None,
+                 multiplex: Optional[bool] = None, pairs_per_connection: Optional[int] = None,
+                 incremental_orderbook: Optional[bool] = None, dispatch_workers: Optional[int] = None,
+                 subscription_grace: Optional[float] = None, rest_host: Optional[str] = None):
         """
         Инициализация менеджера
         
@@ -315,13 +779,52 @@ class PairWebSocketManager:
             api_key: API ключ Gate.io
             api_secret: API секрет Gate.io
             ws_url: Полный WS URL (work|test)
+            multiplex: Передавать все пары через общие соединения (по умолчанию DataLimits.WS_MULTIPLEX)
+            pairs_per_connection: Максимум пар в одном общем соединении
+            incremental_orderbook: Вести стакан по диффам (по умолчанию DataLimits.WS_INCREMENTAL_ORDERBOOK)
+            dispatch_workers: Потоки разбора кадров вне потока чтения (по умолчанию DataLimits.WS_DISPATCH_WORKERS, 0 - выкл.)
+            subscription_grace: Задержка отписки ненужной пары (по умолчанию DataLimits.WS_SUBSCRIPTION_GRACE_SECONDS)
+            rest_host: REST хост снимков стакана (по умолчанию основной API Gate.io)
         """
         self.api_key = api_key
         self.api_secret = api_secret
         self.ws_url = ws_url or GateIOWebSocket.WS_URL_SPOT
+        self.rest_host = rest_host
+        self.multiplex = DataLimits.WS_MULTIPLEX if multiplex is None else multiplex
+        self.pairs_per_connection = max(1, pairs_per_connection or DataLimits.WS_PAIRS_PER_CONNECTION)
+        self.incremental_orderbook = (DataLimits.WS_INCREMENTAL_ORDERBOOK
+                                      if incremental_orderbook is None else incremental_orderbook)
+        workers = DataLimits.WS_DISPATCH_WORKERS if dispatch_workers is None else dispatch_workers
+        # Общий для всех соединений пул: порядок сохраняется по паре, а не по сокету
+        self.dispatcher: Optional[DispatchPool] = DispatchPool(workers) if workers > 0 else None
+        self.order_books: Dict[str, IncrementalOrderBook] = {}
         self.connections: Dict[str, GateIOWebSocket] = {}
-        self.data_cache: Dict[str, Dict[str, Any]] = {}
-        self.lock = threading.Lock()
+        # Уровень подписки пары (subscriptions.TIERS): набор каналов пары
+        self.pair_tiers: Dict[str, str] = {}
+        # Собственные обработчики менеджера по парам: {пара: {канал: обработчик}} - при смене
+        # уровня снимаются только они, маршруты других потребителей (add_route) остаются
+        self._pair_handlers: Dict[str, Dict[str, Callable]] = {}
+        self.shared_connections: List[GateIOWebSocket] = []
+        # Кэш пар: {пара: PairSnapshot}; запись - заменой ссылки под блокировкой пары
+        self.data_cache: Dict[str, PairSnapshot] = {}
+        self._trades: Dict[str, TradesRingBuffer] = {}
+        # Готовность пары: событие выставляется при первых данных в кэше
+        self._pair_ready: Dict[str, threading.Event] = {}
+        # self.lock защищает только структуры в памяти (состав пар, соединения) -
+        # сетевой ввод/вывод выполняется вне его. Данные пары защищает её собственная
+        # блокировка, поэтому обновления разных пар не сериализуются.
+        self.lock = ContentionLock()
+        self._pair_locks: Dict[str, ContentionLock] = {}
+        # Подписка, смена уровня и освобождение пары (с сетевыми вызовами) выполняются
+        # по очереди под блокировкой уровня пары; порядок захвата - она, затем self.lock
+        self._tier_locks: Dict[str, threading.Lock] = {}
+        # Пары от давно обновлявшейся к свежей: {пара: time.monotonic() обновления}
+        self._recency: 'OrderedDict[str, float]' = OrderedDict()
+        # Потребители новых снимков (SSE, автотрейдер, запись) - с конфляцией по (пара, раздел)
+        self.conflator = UpdateConflator()
+        # Кто и какие пары использует: подписки открываются и закрываются только через реестр
+        self.subscriptions = SubscriptionRegistry(self._ensure_connections, self.close_connection,
+                                                  grace=subscription_grace)
         self.last_cleanup_time = time.time()
         self._created_at = time.time()
         
@@ -329,20 +832,46 @@ class PairWebSocketManager:
         self._start_cleanup_thread()
     
     def status(self) -> Dict[str, Any]:
+        # Снимок реестра - до self.lock: блокировки реестра и менеджера не удерживаются вместе
+        subscriptions = self.subscriptions.snapshot()
         with self.lock:
             return {
                 'ws_url': self.ws_url,
                 'created_at': self._created_at,
+                'multiplex': self.multiplex,
+                'tiers': dict(self.pair_tiers),
+                'sockets': len({id(client) for client in self.connections.values()}),
                 'connections': {pair: client.status() for pair, client in self.connections.items()},
-                'cache_pairs': list(self.data_cache.keys())
+                'orderbooks': {
+                    pair: {'synced': book.is_synced, 'update_id': book.last_update_id, 'resyncs': book.resync_count}
+                    for pair, book in self.order_books.items()
+                },
+                'cache_pairs': list(self.data_cache.keys()),
+                'lock_contention': self.lock_stats(),
+                'dispatch': self.dispatcher.stats() if self.dispatcher else None,
+                'scheduler': get_scheduler().stats(),
+                'consumers': self.conflator.stats(),
+                'subscriptions': subscriptions
             }
     
-    def create_connection(self, currency_pair: str) -> GateIOWebSocket:
+    def lock_stats(self) -> Dict[str, Any]:
+        """Статистика конкуренции за общую блокировку и блокировки пар"""
+        return {
+            'global': self.lock.stats(),
+            'pairs': {pair: pair_lock.stats() for pair, pair_lock in list(self._pair_locks.items())}
+        }
+    
+    def create_connection(self, currency_pair: str, tier: str = TIER_FULL) -> GateIOWebSocket:
         """
         Создать WebSocket соединение для пары
         
+        В режиме мультиплексирования пара добавляется в одно из общих соединений.
+        Не блокирует: возвращает клиента сразу, соединение открывается в фоне.
+        Дождаться данных можно через wait_for_data().
+        
         Args:
             currency_pair: Торговая пара (например, BTC_USDT или btc_usdt)
+            tier: Уровень подписки (ticker | top | full)
             
         Returns:
             WebSocket клиент
@@ -355,67 +884,476 @@ class PairWebSocketManager:
                 logger.warning(f"Соединение для {pair_formatted} уже существует")
                 return self.connections[pair_formatted]
             
-            ws_client = GateIOWebSocket(self.api_key, self.api_secret, self.ws_url)
-            ws_client.connect()
-            
-            # Инициализация кэша данных для пары
-            self.data_cache[pair_formatted] = {
-                'ticker': {},
-                'orderbook': {'asks': [], 'bids': []},
-                'trades': [],
-                'last_update': None
-            }
+            if self.multiplex:
+                ws_client, is_new = self._acquire_shared_connection()
+            else:
+                ws_client, is_new = self._new_client(), True
             
-            # Подписка на тикер
-            def ticker_callback(data):
-                with self.lock:
-                    # Gate.io возвращает данные напрямую, а не в массиве
-                    if isinstance(data, dict) and 'currency_pair' in data:
-                        self.data_cache[pair_formatted]['ticker'] = data
-                        self.data_cache[pair_formatted]['last_update'] = datetime.now().isoformat()
-                        logger.debug(f"Тикер обновлен для {pair_formatted}: {data.get('last')}")
+            self._init_pair_cache(pair_formatted)
+            self.connections[pair_formatted] = ws_client
+            self.pair_tiers[pair_formatted] = tier
+            # Блокировка новой пары свободна; смена уровня подождет первой подписки
+            tier_lock = self._tier_locks[pair_formatted]
+            tier_lock.acquire()
+        
+        # Подписки и подключение - вне блокировки кэша
+        try:
+            self._subscribe_pairs(ws_client, [pair_formatted], tier)
+        finally:
+            tier_lock.release()
+        if is_new:
+            ws_client.connect()
+        logger.info(f"WebSocket соединение создано для {pair_formatted}")
+        
+        return ws_client
+    
+    def create_connections(self, currency_pairs: List[str], tier: str = TIER_FULL) -> Dict[str, GateIOWebSocket]:
+        """
+        Создать соединения сразу для нескольких пар
+        
+        В режиме мультиплексирования пары распределяются по общим соединениям,
+        а подписки на тикеры и сделки отправляются одним сообщением на соединение.
+        
+        Args:
+            currency_pairs: Список торговых пар
+            tier: Уровень подписки новых пар (ticker | top | full)
             
-            # Подписка на стакан
-            def orderbook_callback(data):
-                with self.lock:
-                    if isinstance(data, dict):
-                        # Проверяем разные форматы ответа Gate.io
-                        if 'asks' in data and 'bids' in data:
-                            # Применяем ограничение размера
-                            limited_orderbook = self._limit_orderbook_size({
-                                'asks': data['asks'],
-                                'bids': data['bids']
-                            })
-                            self.data_cache[pair_formatted]['orderbook'] = limited_orderbook
-                            self.data_cache[pair_formatted]['last_update'] = datetime.now().isoformat()
-                            logger.debug(f"Стакан обновлен для {pair_formatted}: {len(limited_orderbook['asks'])} asks, {len(limited_orderbook['bids'])} bids")
+        Returns:
+            Словарь {пара: WebSocket клиент}
+        """
+        pairs_formatted = list(dict.fromkeys(pair.upper() for pair in currency_pairs))
+        
+        if not self.multiplex:
+            return {pair: self.create_connection(pair, tier) for pair in pairs_formatted}
+        
+        with self.lock:
+            groups: Dict[int, Tuple[GateIOWebSocket, List[str], bool]] = {}
+            tier_locks: List[threading.Lock] = []
+            for pair in pairs_formatted:
+                if pair in self.connections:
+                    continue
+                ws_client, is_new = self._acquire_shared_connection()
+                self._init_pair_cache(pair)
+                self.connections[pair] = ws_client
+                self.pair_tiers[pair] = tier
+                tier_locks.append(self._tier_locks[pair])
+                tier_locks[-1].acquire()
+                groups.setdefault(id(ws_client), (ws_client, [], is_new))[1].append(pair)
+            result = {pair: self.connections[pair] for pair in pairs_formatted}
+        
+        try:
+            for ws_client, pairs, _ in groups.values():
+                self._subscribe_pairs(ws_client, pairs, tier)
+        finally:
+            for tier_lock in tier_locks:
+                tier_lock.release()
+        for ws_client, pairs, is_new in groups.values():
+            if is_new:
+                ws_client.connect()
+            logger.info(f"WebSocket подписки созданы для {len(pairs)} пар в общем соединении")
+        
+        return result
+    
+    def _ensure_connections(self, currency_pairs: List[str], tier: str = TIER_FULL):
+        """Подписать пары на уровень: новые - создать, у подписанных - сменить уровень"""
+        with self.lock:
+            pairs = [pair.upper() for pair in currency_pairs]
+            missing = [pair for pair in pairs if pair not in self.connections]
+            changed = [pair for pair in pairs if pair in self.connections and self.pair_tiers.get(pair) != tier]
+        if missing:
+            self.create_connections(missing, tier)
+        for pair in changed:
+            self.set_tier(pair, tier)
+    
+    def set_tier(self, currency_pair: str, tier: str) -> bool:
+        """
+        Сменить уровень подписки пары без переподключения: подписка на недостающие
+        каналы и отписка от лишних
+        
+        Смены уровня одной пары выполняются по очереди (вместе с сетевыми вызовами),
+        поэтому каналы пары всегда соответствуют pair_tiers.
+        
+        Args:
+            currency_pair: Торговая пара
+            tier: Новый уровень (ticker | top | full)
             
-            # Подписка на сделки
-            def trades_callback(data):
-                with self.lock:
-                    # Gate.io возвращает данные в разных форматах
-                    if isinstance(data, dict):
-                        # Одна сделка
-                        if 'id' in data:
-                            self.data_cache[pair_formatted]['trades'].insert(0, data)
-                            # Ограничиваем размер истории
-                            self.data_cache[pair_formatted]['trades'] = self.data_cache[pair_formatted]['trades'][:DataLimits.MAX_TRADES_HISTORY]
-                            self.data_cache[pair_formatted]['last_update'] = datetime.now().isoformat()
-                            logger.debug(f"Сделка добавлена для {pair_formatted}: {data.get('price')}")
-                    elif isinstance(data, list):
-                        # Список сделок - ограничиваем размер
-                        self.data_cache[pair_formatted]['trades'] = data[:DataLimits.MAX_TRADES_HISTORY]
-                        self.data_cache[pair_formatted]['last_update'] = datetime.now().isoformat()
-                        logger.debug(f"Сделки обновлены для {pair_formatted}: {len(data)} сделок")
+        Returns:
+            True, если у пары есть соединение
+        """
+        tier_rank(tier)
+        pair_formatted = currency_pair.upper()
+        tier_lock = self._lock_pair_tier(pair_formatted)
+        if tier_lock is None:
+            return False
+        try:
+            with self.lock:
+                ws_client = self.connections.get(pair_formatted)
+                if ws_client is None:
+                    return False
+                previous = self.pair_tiers.get(pair_formatted, TIER_FULL)
+                if previous == tier:
+                    return True
+                self.pair_tiers[pair_formatted] = tier
+                if tier != TIER_FULL:
+                    self.order_books.pop(pair_formatted, None)
+                handlers = self._pair_handlers.setdefault(pair_formatted, {})
             
-            ws_client.subscribe_ticker(pair_formatted, ticker_callback)
-            ws_client.subscribe_orderbook(pair_formatted, "20", "100ms", orderbook_callback)
-            ws_client.subscribe_trades(pair_formatted, trades_callback)
+            old_channels = self._tier_channels(previous)
+            new_channels = self._tier_channels(tier)
+            for channel in old_channels:
+                handler = handlers.pop(channel, None) if channel not in new_channels else None
+                if handler is not None:
+                    ws_client.unsubscribe(channel, pair_formatted, handler)
+            self._subscribe_channels(ws_client, [pair_formatted], [c for c in new_channels if c not in old_channels])
+            if previous == TIER_FULL and tier != TIER_FULL:
+                # Источника сделок больше нет - не отдаем устаревшие
+                self._clear_trades(pair_formatted)
+            if tier_rank(tier) < tier_rank(previous):
+                # Глубокого стакана (или любого) больше нет - сразу публикуем то, что
+                # продолжит обновляться: лучшие цены (top) или пустой стакан (ticker)
+                self._truncate_orderbook(pair_formatted, 1 if tier == TIER_TOP else 0)
+        finally:
+            tier_lock.release()
+        logger.info(f"Уровень подписки {pair_formatted}: {previous} -> {tier}")
+        return True
+    
+    def _lock_pair_tier(self, pair_formatted: str) -> Optional[threading.Lock]:
+        """
+        Захватить блокировку уровня пары (вызывать без self.lock)
+        
+        Returns:
+            Захваченная блокировка текущей жизни пары или None, если пары нет
+        """
+        while True:
+            with self.lock:
+                tier_lock = self._tier_locks.get(pair_formatted)
+            if tier_lock is None:
+                return None
+            tier_lock.acquire()
+            with self.lock:
+                if self._tier_locks.get(pair_formatted) is tier_lock:
+                    return tier_lock
+            # Пара освобождена (или создана заново), пока ждали ее блокировку
+            tier_lock.release()
+    
+    def _truncate_orderbook(self, pair_formatted: str, levels: int):
+        """Опубликовать стакан пары, урезанный до levels лучших уровней (0 - пустой)"""
+        pair_lock = self._pair_locks.get(pair_formatted)
+        if pair_lock is None:
+            return
+        with pair_lock:
+            current = self.data_cache.get(pair_formatted)
+            if current is None:
+                return
+            book = current['orderbook']
+            self._publish_locked(pair_formatted, orderbook=CompactOrderBook(
+                book.ask_prices[:levels], book.ask_sizes[:levels], book.bid_prices[:levels], book.bid_sizes[:levels]))
+        self._after_publish(pair_formatted, ('orderbook',))
+    
+    def _clear_trades(self, pair_formatted: str):
+        """Очистить историю сделок пары и опубликовать пустую"""
+        trades = self._trades.get(pair_formatted)
+        pair_lock = self._pair_locks.get(pair_formatted)
+        if trades is None or pair_lock is None:
+            return
+        with pair_lock:
+            trades.replace(())
+            self._publish_locked(pair_formatted, trades=trades.snapshot(), trades_seq=trades.sequence)
+        self._after_publish(pair_formatted, ('trades',))
+    
+    def _acquire_shared_connection(self) -> Tuple[GateIOWebSocket, bool]:
+        """
+        Найти общее соединение со свободным местом или создать новое (вызывать под self.lock)
+        
+        Returns:
+            (клиент, True если клиент новый и его нужно подключить вне блокировки)
+        """
+        for ws_client in self.shared_connections:
+            load = sum(1 for client in self.connections.values() if client is ws_client)
+            if load < self.pairs_per_connection:
+                return ws_client, False
+        
+        ws_client = self._new_client()
+        self.shared_connections.append(ws_client)
+        logger.info(f"Открыто общее WebSocket соединение #{len(self.shared_connections)}")
+        return ws_client, True
+    
+    def _new_client(self) -> GateIOWebSocket:
+        """Новый WebSocket клиент менеджера (общий пул разбора, пересинхронизация при переподключении)"""
+        ws_client = self.client_class(self.api_key, self.api_secret, self.ws_url, self.dispatcher)
+        ws_client.on_reconnect = self._on_client_reconnect
+        return ws_client
+    
+    def _on_client_reconnect(self, ws_client: GateIOWebSocket):
+        """После переподключения диффы стакана пропущены - загружаем новые снимки"""
+        with self.lock:
+            books = [self.order_books[pair] for pair, client in self.connections.items()
+                     if client is ws_client and pair in self.order_books]
+        for book in books:
+            book.invalidate()
+        if books:
+            logger.info(f"Пересинхронизация стаканов после переподключения: {len(books)}")
+    
+    def _init_pair_cache(self, pair_formatted: str):
+        """Инициализация кэша данных для пары"""
+        self.data_cache[pair_formatted] = PairSnapshot(
+            ticker={},
+            orderbook=CompactOrderBook(),
+            trades=(),
+            trades_seq=0,
+            last_update=None,
+            version=0,
+            sections=dict.fromkeys(PairSnapshot.SECTIONS, 0)
+        )
+        self._trades[pair_formatted] = TradesRingBuffer(DataLimits.MAX_TRADES_HISTORY)
+        # Пара без данных стареет от момента создания
+        self._recency[pair_formatted] = time.monotonic()
+        self._recency.move_to_end(pair_formatted)
+        self._pair_locks[pair_formatted] = ContentionLock()
+        self._tier_locks[pair_formatted] = threading.Lock()
+        self._pair_ready[pair_formatted] = threading.Event()
+    
+    def _publish(self, pair_formatted: str, **sections):
+        """Опубликовать новый снимок пары с обновленными разделами"""
+        pair_lock = self._pair_locks.get(pair_formatted)
+        if pair_lock is None:
+            return
+        with pair_lock:
+            self._publish_locked(pair_formatted, **sections)
+        self._after_publish(pair_formatted, tuple(name for name in sections if name in PairSnapshot.SECTIONS))
+    
+    def _publish_locked(self, pair_formatted: str, **sections):
+        """Заменить снимок пары (вызывать под блокировкой пары)"""
+        current = self.data_cache.get(pair_formatted)
+        if current is not None:
+            snapshot = current.evolve(**sections)
+            self.data_cache[pair_formatted] = snapshot
+            # Порядок вытеснения: O(1) перенос пары в конец (самые свежие)
+            self._recency[pair_formatted] = time.monotonic()
+            self._recency.move_to_end(pair_formatted)
+    
+    def _after_publish(self, pair_formatted: str, channels: Tuple[str, ...]):
+        """Отметить получение данных пары и раздать снимок потребителям (вне блокировки пары)"""
+        ready = self._pair_ready.get(pair_formatted)
+        if ready is not None and not ready.is_set():
+            ready.set()
+        snapshot = self.data_cache.get(pair_formatted)
+        if snapshot is not None:
+            self.conflator.offer(pair_formatted, channels, snapshot)
+    
+    def add_consumer(self, consumer: ConflatingConsumer) -> ConflatingConsumer:
+        """
+        Подключить потребителя снимков пар
+        
+        Args:
+            consumer: Получает ключи (пара, раздел) со значением - последним PairSnapshot;
+                      обновления, не доставленные до следующего, схлопываются
+        """
+        return self.conflator.add_consumer(consumer)
+    
+    def remove_consumer(self, consumer: ConflatingConsumer):
+        """Отключить потребителя и остановить его доставку"""
+        self.conflator.remove_consumer(consumer)
+        consumer.close()
+    
+    def wait_for_data(self, currency_pair: str, timeout: float) -> bool:
+        """
+        Дождаться первых данных пары (без блокировки кэша)
+        
+        Args:
+            currency_pair: Торговая пара
+            timeout: Максимальное время ожидания в секундах
             
-            self.connections[pair_formatted] = ws_client
-            logger.info(f"WebSocket соединение создано для {pair_formatted}")
+        Returns:
+            True, если данные пары уже есть в кэше
+        """
+        ready = self._pair_ready.get(currency_pair.upper())
+        return ready.wait(timeout) if ready is not None else False
+    
+    def _subscribe_pairs(self, ws_client: GateIOWebSocket, pairs: List[str], tier: str = TIER_FULL):
+        """Зарегистрировать обработчики пар и подписаться на каналы их уровня"""
+        self._subscribe_channels(ws_client, pairs, self._tier_channels(tier))
+    
+    def _subscribe_channels(self, ws_client: GateIOWebSocket, pairs: List[str], channels: Iterable[str]):
+        """Подписать пары на каналы (каналы со списком пар - одним сообщением)"""
+        channels = tuple(channels)
+        if not channels:
+            return
+        for pair in pairs:
+            ticker_callback, orderbook_callback, trades_callback, book_ticker_callback = self._make_pair_callbacks(pair)
+            routes = {
+                "spot.tickers": ticker_callback,
+                "spot.trades": trades_callback,
+                "spot.book_ticker": book_ticker_callback
+            }
+            handlers = self._pair_handlers.setdefault(pair, {})
+            for channel in channels:
+                if channel in routes:
+                    handlers[channel] = routes[channel]
+                    ws_client.add_route(channel, pair, routes[channel])
+                elif channel == "spot.order_book_update":
+                    handlers[channel] = self._subscribe_incremental_orderbook(ws_client, pair)
+                elif channel == "spot.order_book":
+                    handlers[channel] = orderbook_callback
+                    ws_client.subscribe_orderbook(pair, "20", "100ms", orderbook_callback)
+        
+        for channel in self.BATCH_CHANNELS:
+            if channel in channels:
+                ws_client.subscribe_pairs(channel, pairs)
+    
+    def _subscribe_incremental_orderbook(self, ws_client: GateIOWebSocket, pair_formatted: str) -> Callable:
+        """Создать локальный стакан пары и подписать его на диффы; Returns: обработчик диффов"""
+        book = IncrementalOrderBook(
+            pair_formatted,
+            self._load_orderbook_snapshot,
+            max_levels=DataLimits.WS_ORDERBOOK_LOCAL_LEVELS,
+            on_snapshot=self._publish_orderbook,
+            background_resync=self.background_resync
+        )
+        self.order_books[pair_formatted] = book
+        
+        def orderbook_update_callback(data):
+            if isinstance(data, dict) and 'u' in data and book.apply_update(data):
+                self._publish_orderbook(book)
+        
+        ws_client.subscribe_orderbook_updates(pair_formatted, "100ms", orderbook_update_callback)
+        return orderbook_update_callback
+    
+    def _load_orderbook_snapshot(self, pair_formatted: str) -> Dict[str, Any]:
+        """REST снимок стакана с id (рыночные данные всегда с основного API или rest_host)"""
+        client = GateAPIClient(None, None, 'work')
+        if self.rest_host:
+            client.host = self.rest_host
+        return client.get_order_book(pair_formatted, limit=DataLimits.WS_ORDERBOOK_SNAPSHOT_DEPTH, with_id=True)
+    
+    def _publish_orderbook(self, book: IncrementalOrderBook):
+        """Записать верх локального стакана в кэш пары"""
+        pair_formatted = book.currency_pair
+        pair_lock = self._pair_locks.get(pair_formatted)
+        if pair_lock is None:
+            return
+        # Верх стакана снимается под блокировкой пары: поток пересинхронизации и поток
+        # диффов публикуют по очереди, и каждый - текущее состояние, а не снятое до
+        # ожидания блокировки (иначе в кэш мог вернуться более старый стакан).
+        # Актуальность стакана проверяется там же: после понижения уровня запоздавший
+        # дифф не вернет в кэш глубокий стакан поверх урезанного
+        with pair_lock:
+            if self.order_books.get(pair_formatted) is not book:
+                return
+            self._publish_locked(pair_formatted, orderbook=book.to_compact(DataLimits.MAX_ORDERBOOK_LEVELS))
+        self._after_publish(pair_formatted, ('orderbook',))
+    
+    def _tier_channels(self, tier: str) -> Tuple[str, ...]:
+        """Каналы пары на уровне подписки"""
+        if tier == TIER_FULL:
+            orderbook_channel = "spot.order_book_update" if self.incremental_orderbook else "spot.order_book"
+            return ("spot.tickers", orderbook_channel, "spot.trades")
+        if tier == TIER_TOP:
+            return ("spot.tickers", "spot.book_ticker")
+        return ("spot.tickers",)
+    
+    def add_route(self, channel: str, currency_pair: str, handler: Callable) -> bool:
+        """
+        Подключить дополнительного потребителя к потоку пары без нового соединения
+        
+        Args:
+            channel: Название канала (spot.tickers, spot.order_book, spot.trades)
+            currency_pair: Торговая пара
+            handler: Функция обратного вызова
             
-            return ws_client
+        Returns:
+            True, если у пары есть активное соединение
+        """
+        pair_formatted = currency_pair.upper()
+        with self.lock:
+            ws_client = self.connections.get(pair_formatted)
+        if ws_client is None:
+            return False
+        ws_client.add_route(channel, pair_formatted, handler)
+        return True
+    
+    def _make_pair_callbacks(self, pair_formatted: str) -> Tuple[Callable, Callable, Callable, Callable]:
+        """Создать обработчики тикера, стакана, сделок и лучших цен для пары"""
+        # Буфер сделок и блокировка пары фиксируются один раз - без общей блокировки
+        trades = self._trades[pair_formatted]
+        pair_lock = self._pair_locks[pair_formatted]
+        
+        def ticker_callback(data):
+            # Gate.io возвращает данные напрямую, а не в массиве
+            if isinstance(data, dict) and 'currency_pair' in data:
+                self._publish(pair_formatted, ticker=data)
+                logger.debug(f"Тикер обновлен для {pair_formatted}: {data.get('last')}")
+        
+        def orderbook_callback(data):
+            # Проверяем разные форматы ответа Gate.io
+            if not (isinstance(data, dict) and 'asks' in data and 'bids' in data):
+                return
+            # Разбираем строки один раз, с ограничением размера, вне блокировки
+            orderbook = CompactOrderBook.from_levels(data['asks'], data['bids'], DataLimits.MAX_ORDERBOOK_LEVELS)
+            self._publish(pair_formatted, orderbook=orderbook)
+            logger.debug(f"Стакан обновлен для {pair_formatted}: {len(orderbook.ask_prices)} asks, {len(orderbook.bid_prices)} bids")
+        
+        def trades_callback(data):
+            with pair_lock:
+                # Gate.io возвращает данные в разных форматах
+                if isinstance(data, dict):
+                    # Одна сделка
+                    if 'id' in data:
+                        # Кольцевой буфер сам вытесняет старые сделки сверх MAX_TRADES_HISTORY
+                        trades.push(data)
+                        self._publish_locked(pair_formatted, trades=trades.snapshot(), trades_seq=trades.sequence)
+                        logger.debug(f"Сделка добавлена для {pair_formatted}: {data.get('price')}")
+                elif isinstance(data, list):
+                    # Список сделок - буфер берет не больше своей емкости
+                    trades.replace(data)
+                    self._publish_locked(pair_formatted, trades=trades.snapshot(), trades_seq=trades.sequence)
+                    logger.debug(f"Сделки обновлены для {pair_formatted}: {len(data)} сделок")
+            self._after_publish(pair_formatted, ('trades',))
+        
+        def book_ticker_callback(data):
+            # Лучшие цены: b/B - покупка и объем, a/A - продажа и объем
+            if isinstance(data, dict) and data.get('a') and data.get('b'):
+                orderbook = CompactOrderBook.from_levels([[data['a'], data.get('A', 0)]],
+                                                         [[data['b'], data.get('B', 0)]])
+                self._publish(pair_formatted, orderbook=orderbook)
+        
+        return ticker_callback, orderbook_callback, trades_callback, book_ticker_callback
+    
+    def _release_connection(self, pair_formatted: str) -> Optional[Tuple[GateIOWebSocket, bool, Dict[str, Callable]]]:
+        """
+        Убрать пару из учета соединений (вызывать под self.lock, без сетевых операций)
+        
+        Returns:
+            (клиент, закрыть ли соединение целиком, обработчики менеджера {канал: обработчик})
+            для _finish_release() вне блокировки
+        """
+        ws_client = self.connections.pop(pair_formatted, None)
+        self.order_books.pop(pair_formatted, None)
+        self._tier_locks.pop(pair_formatted, None)
+        handlers = self._pair_handlers.pop(pair_formatted, None) or {}
+        self.pair_tiers.pop(pair_formatted, None)
+        if ws_client is None:
+            return None
+        
+        if ws_client in self.shared_connections:
+            # Последняя пара ушла - закрываем общее соединение
+            if any(client is ws_client for client in self.connections.values()):
+                return ws_client, False, handlers
+            self.shared_connections.remove(ws_client)
+        return ws_client, True, handlers
+    
+    def _finish_release(self, pair_formatted: str,
+                        release: Optional[Tuple[GateIOWebSocket, bool, Dict[str, Callable]]]):
+        """Сетевая часть освобождения пары: отписка или закрытие соединения"""
+        if release is None:
+            return
+        ws_client, close_socket, handlers = release
+        if close_socket:
+            ws_client.disconnect()
+        else:
+            # Снимаются только обработчики менеджера: маршруты других потребителей пары остаются
+            for channel, handler in handlers.items():
+                ws_client.unsubscribe(channel, pair_formatted, handler)
     
     def close_connection(self, currency_pair: str):
         """
@@ -426,11 +1364,18 @@ class PairWebSocketManager:
         """
         pair_formatted = currency_pair.upper()
         
-        with self.lock:
-            if pair_formatted in self.connections:
-                self.connections[pair_formatted].disconnect()
-                del self.connections[pair_formatted]
+        # Освобождение не перемешивается со сменой уровня той же пары
+        tier_lock = self._lock_pair_tier(pair_formatted)
+        if tier_lock is None:
+            return
+        try:
+            with self.lock:
+                release = self._release_connection(pair_formatted)
+            if release is not None:
+                self._finish_release(pair_formatted, release)
                 logger.info(f"WebSocket соединение закрыто для {pair_formatted}")
+        finally:
+            tier_lock.release()
     
     def get_data(self, currency_pair: str) -> Optional[Dict[str, Any]]:
         """
@@ -440,20 +1385,63 @@ class PairWebSocketManager:
             currency_pair: Торговая пара
             
         Returns:
-            Словарь с данными тикера, стакана и сделок
+            Неизменяемый снимок (PairSnapshot) с данными тикера, стакана, сделок и версией
         """
-        pair_formatted = currency_pair.upper()
+        # Без блокировок: снимок публикуется атомарной заменой ссылки и не меняется после этого
+        return self.data_cache.get(currency_pair.upper(), None)
+    
+    def get_changes(self, currency_pair: str, since: int, trades_seq: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Изменения данных пары после версии since (условный запрос клиента)
         
-        with self.lock:
-            return self.data_cache.get(pair_formatted, None)
+        Args:
+            currency_pair: Торговая пара
+            since: Версия снимка, которая уже есть у клиента
+            trades_seq: Счетчик сделок из того же ответа клиенту (для отдачи только новых сделок)
+            
+        Returns:
+            None, если пары нет в кэше; иначе словарь:
+            {'version', 'unchanged': True} - данные не менялись;
+            {'version', 'delta': True, 'data': {...}} - только измененные разделы,
+            вместо trades может прийти trades_new (новые сделки, новые первыми);
+            {'version', 'data': снимок} - полный снимок (since из другой жизни кэша)
+        """
+        snapshot = self.get_data(currency_pair)
+        if snapshot is None:
+            return None
+        version = snapshot['version']
+        if since == version:
+            return {'version': version, 'unchanged': True}
+        if since < 0 or since > version:
+            # Версия не из текущего кэша (например, пара пересоздана) - отдаем все
+            return {'version': version, 'data': snapshot}
+        
+        sections = snapshot['sections']
+        data = {name: snapshot[name] for name in ('ticker', 'orderbook') if sections[name] > since}
+        if sections['trades'] > since:
+            trades = snapshot['trades']
+            new_count = snapshot['trades_seq'] - trades_seq if trades_seq is not None else -1
+            if 0 <= new_count <= len(trades):
+                data['trades_new'] = trades[:new_count]
+            else:
+                data['trades'] = trades
+            data['trades_seq'] = snapshot['trades_seq']
+        data['last_update'] = snapshot['last_update']
+        return {'version': version, 'delta': True, 'data': data}
     
     def close_all(self):
         """Закрыть все WebSocket соединения"""
         with self.lock:
-            for currency_pair in list(self.connections.keys()):
-                self.connections[currency_pair].disconnect()
+            clients = list({id(client): client for client in self.connections.values()}.values())
             self.connections.clear()
-            logger.info("Все WebSocket соединения закрыты")
+            self.pair_tiers.clear()
+            self.shared_connections.clear()
+            self.order_books.clear()
+            self._pair_handlers.clear()
+            self._tier_locks.clear()
+        for ws_client in clients:
+            ws_client.disconnect()
+        logger.info("Все WebSocket соединения закрыты")
     
     def _start_cleanup_thread(self):
         """Запуск потока автоматической очистки"""
@@ -467,66 +1455,79 @@ class PairWebSocketManager:
         logger.info("Поток автоматической очистки кэша запущен")
     
     def _cleanup_old_cache(self):
-        """Очистка старого кэша"""
+        """
+        Очистка старого кэша: пары без обновлений дольше CACHE_TTL_SECONDS и сверх MAX_CURRENCY_PAIRS_CACHE
+        
+        Пары просматриваются от давно обновлявшейся (начало _recency), просмотр останавливается
+        на первой свежей паре при соблюдении лимита. Порядок копируется один раз, поэтому
+        параллельные публикации не мешают просмотру. Пары, нужные потребителям реестра
+        подписок, пропускаются: их закрывает только реестр.
+        """
+        releases = []
+        removed = 0
         with self.lock:
-            current_time = time.time()
-            pairs_to_remove = []
-            
-            # Находим пары для удаления
-            for pair, data in self.data_cache.items():
-                if 'last_update' in data and data['last_update']:
-                    try:
-                        last_update = datetime.fromisoformat(data['last_update'])
-                        age_seconds = (datetime.now() - last_update).total_seconds()
-                        
-                        # Удаляем старые данные
-                        if age_seconds > DataLimits.CACHE_TTL_SECONDS:
-                            pairs_to_remove.append(pair)
-                    except:
-                        pass
-            
-            # Проверяем лимит количества пар
-            if len(self.data_cache) > DataLimits.MAX_CURRENCY_PAIRS_CACHE:
-                # Сортируем пары по времени последнего обновления
-                sorted_pairs = sorted(
-                    self.data_cache.items(),
-                    key=lambda x: x[1].get('last_update', ''),
-                    reverse=False
-                )
-                
-                # Оставляем только N самых свежих
-                excess_count = len(self.data_cache) - DataLimits.MAX_CURRENCY_PAIRS_CACHE
-                for pair, _ in sorted_pairs[:excess_count]:
-                    if pair not in pairs_to_remove:
-                        pairs_to_remove.append(pair)
-            
-            # Удаляем неактивные пары
-            for pair in pairs_to_remove:
-                if len(self.data_cache) > DataLimits.MIN_PAIRS_TO_KEEP:
-                    if pair in self.connections:
-                        self.connections[pair].disconnect()
-                        del self.connections[pair]
-                    if pair in self.data_cache:
-                        del self.data_cache[pair]
-                    logger.info(f"Удалена неактивная пара из кэша: {pair}")
+            now = time.monotonic()
+            candidates = iter(list(self._recency))
+            while len(self.data_cache) > DataLimits.MIN_PAIRS_TO_KEEP:
+                pair = next(candidates, None)
+                if pair is None:
+                    break
+                if self.subscriptions.needed(pair):
+                    continue
+                touched = self._recency.get(pair)
+                expired = touched is not None and now - touched > DataLimits.CACHE_TTL_SECONDS
+                if not expired and len(self.data_cache) <= DataLimits.MAX_CURRENCY_PAIRS_CACHE:
+                    break
+                tier_lock = self._tier_locks.get(pair)
+                if tier_lock is not None and not tier_lock.acquire(False):
+                    # Пара сейчас подписывается или меняет уровень - ждать ее под self.lock нельзя
+                    continue
+                releases.append((pair, tier_lock, self._release_connection(pair)))
+                pair_lock = self._pair_locks.pop(pair, None)
+                if pair_lock is not None:
+                    # Под блокировкой пары, чтобы запоздавшая публикация не вернула пару в кэш
+                    with pair_lock:
+                        self.data_cache.pop(pair, None)
+                        self._recency.pop(pair, None)
+                else:
+                    self.data_cache.pop(pair, None)
+                    self._recency.pop(pair, None)
+                self._trades.pop(pair, None)
+                self._pair_ready.pop(pair, None)
+                removed += 1
+                logger.info(f"Удалена неактивная пара из кэша: {pair}")
             
-            if pairs_to_remove:
-                logger.info(f"Очистка кэша: удалено {len(pairs_to_remove)} пар")
-    
-    def _limit_orderbook_size(self, orderbook: dict) -> dict:
-        """Ограничение размера стакана"""
-        if 'asks' in orderbook:
-            orderbook['asks'] = orderbook['asks'][:DataLimits.MAX_ORDERBOOK_LEVELS]
-        if 'bids' in orderbook:
-            orderbook['bids'] = orderbook['bids'][:DataLimits.MAX_ORDERBOOK_LEVELS]
-        return orderbook
+            if removed:
+                logger.info(f"Очистка кэша: удалено {removed} пар")
+        
+        for pair, tier_lock, release in releases:
+            try:
+                self._finish_release(pair, release)
+            finally:
+                if tier_lock is not None:
+                    tier_lock.release()
 
 
 # Глобальный менеджер (будет инициализирован в main приложении)
 ws_manager: Optional[PairWebSocketManager] = None
+# Обработчики создания нового глобального менеджера (переключение сети, ленивая инициализация)
+_manager_listeners: List[Callable[[PairWebSocketManager], None]] = []
 
 
-def init_websocket_manager(api_key: str, api_secret: str, network_mode: str = 'work') -> PairWebSocketManager:
+def add_manager_listener(callback: Callable[[PairWebSocketManager], None]):
+    """
+    Вызывать callback для каждого нового глобального менеджера
+    
+    Если менеджер уже создан, callback вызывается сразу с ним.
+    """
+    _manager_listeners.append(callback)
+    if ws_manager is not None:
+        callback(ws_manager)
+
+
+def init_websocket_manager(api_key: str, api_secret: str, network_mode: str = 'work',
+                           multiplex: Optional[bool] = None, ws_url: Optional[str] = None,
+                           rest_host: Optional[str] = None) -> PairWebSocketManager:
     """
     Инициализировать глобальный WebSocket менеджер с учетом сети
     
@@ -534,6 +1535,10 @@ def init_websocket_manager(api_key: str, api_secret: str, network_mode: str = 'w
         api_key: API ключ Gate.io
         api_secret: API секрет Gate.io
         network_mode: Режим сети ('work' или 'test')
+        multiplex: Общие соединения для всех пар (по умолчанию DataLimits.WS_MULTIPLEX)
+        ws_url: WS рыночных данных (по умолчанию DataLimits.WS_MARKET_URL или основной Gate.io),
+                например локальный mock_gateio_server.py для нагрузочных тестов
+        rest_host: REST хост снимков стакана (по умолчанию DataLimits.WS_MARKET_REST_HOST)
         
     Returns:
         Экземпляр PairWebSocketManager
@@ -543,12 +1548,30 @@ def init_websocket_manager(api_key: str, api_secret: str, network_mode: str = 'w
         т.к. тестовая сеть не предоставляет актуальные рыночные данные.
         Режим network_mode влияет только на торговые операции (балансы, ордера).
     """
-    global ws_manager
-    # ВСЕГДА используем основной WebSocket API для рыночных данных
-    ws_url = "wss://api.gateio.ws/ws/v4/"
+    # ВСЕГДА используем основной WebSocket API для рыночных данных (если не задан свой)
+    ws_url = ws_url or DataLimits.WS_MARKET_URL or GateIOWebSocket.WS_URL_SPOT
+    rest_host = rest_host or DataLimits.WS_MARKET_REST_HOST
     print(f"[WEBSOCKET] Инициализация WebSocket менеджера (network_mode={network_mode}, ws_url={ws_url})")
-    ws_manager = PairWebSocketManager(api_key, api_secret, ws_url)
-    return ws_manager
+    if DataLimits.WS_CAPTURE:
+        start_capture()
+    return set_websocket_manager(PairWebSocketManager(api_key, api_secret, ws_url, multiplex=multiplex,
+                                                      rest_host=rest_host))
+
+
+def set_websocket_manager(manager: PairWebSocketManager) -> PairWebSocketManager:
+    """
+    Сделать менеджер глобальным (HTTP эндпоинты, watchlist) и уведомить обработчики
+    
+    Используется init_websocket_manager и воспроизведением записи без сети.
+    """
+    global ws_manager
+    ws_manager = manager
+    for callback in list(_manager_listeners):
+        try:
+            callback(manager)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика создания WebSocket менеджера: {e}")
+    return manager
 
 
 def get_websocket_manager() -> Optional[PairWebSocketManager]:
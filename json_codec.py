@@ -0,0 +1,107 @@
+"""
+JSON Codec Module
+Быстрый разбор кадров WebSocket: orjson/ujson при наличии, иначе стандартный json,
+и дешевое распознавание служебных кадров (pong, подтверждения подписки) без разбора
+"""
+
+import json
+import re
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from data_limits import DataLimits
+
+logger = logging.getLogger(__name__)
+
+# Порядок автоматического выбора
+DECODER_PREFERENCE = ('orjson', 'ujson', 'json')
+
+
+def _import_loads(name: str) -> Optional[Callable[[Any], Any]]:
+    """Функция loads библиотеки или None, если она не установлена"""
+    if name == 'json':
+        return json.loads
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    return module.loads
+
+
+def available_decoders() -> Dict[str, Callable[[Any], Any]]:
+    """Установленные декодеры {имя: loads} в порядке предпочтения"""
+    decoders = {}
+    for name in DECODER_PREFERENCE:
+        loads = _import_loads(name)
+        if loads is not None:
+            decoders[name] = loads
+    return decoders
+
+
+def select_decoder(preferred: Optional[str] = None) -> Tuple[str, Callable[[Any], Any]]:
+    """
+    Выбрать декодер
+
+    Args:
+        preferred: 'orjson' | 'ujson' | 'json' | 'auto' (по умолчанию DataLimits.WS_JSON_DECODER)
+
+    Returns:
+        (имя, loads); недоступный декодер заменяется первым доступным по предпочтению.
+        Все варианты при ошибке бросают ValueError (JSONDecodeError - его подкласс).
+    """
+    preferred = (preferred or DataLimits.WS_JSON_DECODER or 'auto').lower()
+    if preferred != 'auto':
+        loads = _import_loads(preferred)
+        if loads is not None:
+            return preferred, loads
+        logger.warning(f"JSON декодер {preferred} не установлен, используется автоматический выбор")
+    for name in DECODER_PREFERENCE:
+        loads = _import_loads(name)
+        if loads is not None:
+            return name, loads
+    return 'json', json.loads
+
+
+DECODER_NAME, loads = select_decoder()
+
+
+# --- Предварительный фильтр служебных кадров ---
+
+# Gate.io отдает компактный JSON: канал и событие стоят в начале кадра, до result
+_HEAD_SIZE = 160
+_CHANNEL_PATTERN = re.compile(r'"channel":"([^"]*)"')
+
+FRAME_UPDATE = 'update'
+FRAME_PONG = 'pong'
+FRAME_SUBSCRIBED = 'subscribe'
+FRAME_UNSUBSCRIBED = 'unsubscribe'
+
+
+def classify_frame(message: Any) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Распознать тип кадра по началу строки без разбора JSON
+
+    Returns:
+        (тип, канал): FRAME_UPDATE - обновление данных (разбирается полностью),
+        FRAME_PONG - ответ на spot.ping, FRAME_SUBSCRIBED/FRAME_UNSUBSCRIBED - успешная
+        подписка/отписка;
+        (None, None) - неизвестно, нужен полный разбор (в т.ч. ошибки подписки)
+    """
+    if not isinstance(message, str):
+        return None, None
+    head = message[:_HEAD_SIZE]
+    if '"event":"update"' in head:
+        return FRAME_UPDATE, None
+    if '.pong"' in head:
+        kind = FRAME_PONG
+    elif '"status":"success"' in message and '"error":{' not in message:
+        if '"event":"subscribe"' in head:
+            kind = FRAME_SUBSCRIBED
+        elif '"event":"unsubscribe"' in head:
+            kind = FRAME_UNSUBSCRIBED
+        else:
+            return None, None
+    else:
+        return None, None
+    match = _CHANNEL_PATTERN.search(head)
+    return kind, match.group(1) if match else None
@@ -0,0 +1,17 @@
+"""
+JSON Provider Module
+JSON сериализация Flask с поддержкой компактных структур рыночных данных
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class MarketDataJSONProvider(DefaultJSONProvider):
+    """JSON провайдер: объекты с методом to_json() (например, CompactOrderBook) сериализуются через него"""
+
+    @staticmethod
+    def default(o):
+        to_json = getattr(o, 'to_json', None)
+        if callable(to_json):
+            return to_json()
+        return DefaultJSONProvider.default(o)
@@ -15,7 +15,7 @@ import signal
 import atexit
 import random  # добавлено для автотрейдера
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
 import requests
 from threading import Thread
 from typing import Dict, List, Optional
@@ -23,10 +23,16 @@ from data_limits import DataLimits
 
 # Импорт WebSocket модуля
 from gateio_websocket import init_websocket_manager, get_websocket_manager
+from market_stream import MarketStreamSubscriber
+from feed_metrics import get_feed_metrics
+from capture import get_active_recorder, start_capture, stop_capture
+from subscriptions import TIER_FULL, TIER_TICKER
 # Импорт State Manager
 from state_manager import get_state_manager
 # Импорт Trade Logger
 from trade_logger import get_trade_logger
+# JSON сериализация компактных рыночных данных
+from json_provider import MarketDataJSONProvider
 
 # Конфигурация Flask
 app = Flask(__name__)
@@ -35,6 +41,7 @@ app.secret_key = os.urandom(24)
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 app.config['ETAG_DISABLED'] = True
+app.json = MarketDataJSONProvider(app)
 
 # Отключить кеширование для всех ответов
 @app.after_request
@@ -297,6 +304,8 @@ class ProcessManager:
 server_start_time = time.time()
 PAIR_INFO_CACHE = {}
 PAIR_INFO_CACHE_TTL = 3600  # 1 час
+# Активная пара UI: полный уровень подписки, при переключении прежняя понижается
+UI_ACTIVE_PAIR: Optional[str] = None
 
 # Загружаем режим сети из state_manager (единственный источник истины)
 state_mgr = get_state_manager()
@@ -318,11 +327,12 @@ def _init_default_watchlist():
         if not ws_manager:
             return
         # Минимальный набор популярных пар, чтобы данные появились сразу
-        for pair in ('BTC_USDT', 'ETH_USDT'):
-            try:
-                ws_manager.create_connection(pair)
-            except Exception:
-                pass
+        try:
+            held = set(ws_manager.subscriptions.pairs('watchlist'))
+            ws_manager.subscriptions.acquire('watchlist', [p for p in ('BTC_USDT', 'ETH_USDT') if p not in held],
+                                             tier=TIER_TICKER)
+        except Exception:
+            pass
     except Exception:
         pass
 
@@ -1431,7 +1441,13 @@ def subscribe_pair():
             print(f"[WEBSOCKET] Lazy init manager (mode={CURRENT_NETWORK_MODE}, keys={'yes' if ak and sk else 'no'})")
         if not ws_manager:
             return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
-        ws_manager.create_connection(currency_pair)
+        # UI не сообщает об уходе с пары - аренда продлевается запросами данных пары
+        global UI_ACTIVE_PAIR
+        ws_manager.subscriptions.lease('ui', [currency_pair], tier=TIER_FULL)
+        previous, UI_ACTIVE_PAIR = UI_ACTIVE_PAIR, currency_pair.upper()
+        if previous and previous != UI_ACTIVE_PAIR:
+            # Переключение базы: прежняя пара остается на уровне других потребителей (watchlist - тикер)
+            ws_manager.subscriptions.release('ui', [previous], all_refs=True)
         return jsonify({"success": True, "pair": currency_pair, "message": f"Подписка на {currency_pair} создана"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -1444,19 +1460,27 @@ def get_pair_data():
         base_currency = request.args.get('base_currency', 'BTC')
         quote_currency = request.args.get('quote_currency', 'USDT')
         force_refresh = request.args.get('force', '0') == '1'
+        # Условный запрос: since - версия данных у клиента, trades_seq - счетчик сделок из того же ответа
+        since = request.args.get('since', type=int)
+        trades_seq = request.args.get('trades_seq', type=int)
         currency_pair = f"{base_currency}_{quote_currency}"
         ws_manager = get_websocket_manager()
         data = None
         if ws_manager:
+            # Продлеваем аренду пары для UI (подписка создается, если ее еще нет)
+            ws_manager.subscriptions.lease('ui', [currency_pair])
             data = ws_manager.get_data(currency_pair)
-            # Если force=1 или данных нет, создаём новое соединение
+            # Если force=1 или данных нет, ждём данные новой подписки
             if data is None or force_refresh:
-                print(f"[PAIR_DATA] Creating/refreshing connection for {currency_pair} (force={force_refresh})")
-                ws_manager.create_connection(currency_pair)
-                # Ждём немного, чтобы получить первые данные
-                import time
-                time.sleep(0.5)
+                print(f"[PAIR_DATA] Waiting for data of {currency_pair} (force={force_refresh})")
+                # Ждём первые данные (не дольше 0.5 с), соединение открывается в фоне
+                ws_manager.wait_for_data(currency_pair, timeout=0.5)
                 data = ws_manager.get_data(currency_pair)
+            elif since is not None:
+                # Только изменившиеся разделы (или unchanged) вместо полного снимка
+                changes = ws_manager.get_changes(currency_pair, since, trades_seq)
+                if changes is not None:
+                    return jsonify({'success': True, 'pair': currency_pair, **changes})
         if not data:
             # REST fallback тикер + стакан
             # ВАЖНО: Для рыночных данных (orderbook, ticker) ВСЕГДА используем основной API Gate.io,
@@ -1480,11 +1504,87 @@ def get_pair_data():
                 print(f"[ERROR] Failed to load real market data for {currency_pair}: {rest_err}")
                 return jsonify({'success': False, 'error': f'Не удалось загрузить данные рынка: {str(rest_err)}'})
         
-        return jsonify({'success': True, 'pair': currency_pair, 'data': data})
+        return jsonify({'success': True, 'pair': currency_pair, 'version': data.get('version'), 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+@app.route('/api/stream/market', methods=['GET'])
+def stream_market():
+    """SSE поток рыночных данных: полный снимок пары, затем дельты (не чаще rate в секунду)"""
+    try:
+        pairs_param = request.args.get('pairs', '')
+        if pairs_param:
+            pairs = [p.strip().upper() for p in pairs_param.split(',') if p.strip()]
+        else:
+            base_currency = request.args.get('base_currency', 'BTC')
+            quote_currency = request.args.get('quote_currency', 'USDT')
+            pairs = [f"{base_currency}_{quote_currency}".upper()]
+        rate = request.args.get('rate', type=float)
+        
+        ws_manager = get_websocket_manager()
+        if not ws_manager:
+            return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
+        
+        # Подписки на пары удерживает сам подписчик на время потока
+        # Клиент не может запросить частоту выше серверного лимита
+        max_rate = min(rate, DataLimits.SSE_MAX_UPDATES_PER_SECOND) if rate and rate > 0 else None
+        subscriber = MarketStreamSubscriber(ws_manager, pairs, app.json.dumps, max_rate=max_rate)
+        return Response(
+            stream_with_context(subscriber.events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route('/api/ws/metrics', methods=['GET'])
+def ws_metrics():
+    """Метрики потока: задержки биржа -> получение -> кэш, частоты кадров, состояние менеджера"""
+    try:
+        pair = request.args.get('pair')
+        ws_manager = get_websocket_manager()
+        return jsonify({
+            "success": True,
+            "feed": get_feed_metrics().snapshot(pair),
+            "manager": ws_manager.status() if ws_manager else None
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route('/api/ws/subscriptions', methods=['GET'])
+def ws_subscriptions():
+    """Реестр подписок: потребители и счетчики ссылок по парам, ожидающие отписки"""
+    try:
+        ws_manager = get_websocket_manager()
+        if not ws_manager:
+            return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
+        return jsonify({"success": True, **ws_manager.subscriptions.snapshot()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route('/api/ws/capture', methods=['GET', 'POST'])
+def ws_capture():
+    """Запись сырых кадров WebSocket: GET - состояние, POST {"action": "start"|"stop", "compression"}"""
+    try:
+        if request.method == 'POST':
+            payload = request.get_json(silent=True) or {}
+            action = payload.get('action')
+            if action == 'start':
+                recorder = start_capture(compression=payload.get('compression'))
+                return jsonify({"success": True, **recorder.stats()})
+            if action == 'stop':
+                return jsonify({"success": True, "stopped": stop_capture()})
+            return jsonify({"success": False, "error": "action: start | stop"}), 400
+        recorder = get_active_recorder()
+        return jsonify({"success": True, **(recorder.stats() if recorder else {"running": False})})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
 @app.route('/api/pair/unsubscribe', methods=['POST'])
 def unsubscribe_pair():
     """Отписаться от данных торговой пары"""
@@ -1499,8 +1599,8 @@ def unsubscribe_pair():
         if not ws_manager:
             return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
         
-        # Закрыть соединение для пары
-        ws_manager.close_connection(currency_pair)
+        # UI больше не нужна пара; отписка - через grace, если пара не нужна другим
+        ws_manager.subscriptions.release('ui', [currency_pair], all_refs=True)
         
         return jsonify({
             "success": True,
@@ -15,6 +15,7 @@ from process_manager import ProcessManager
 from trading_engine import AccountManager
 from gateio_websocket import init_websocket_manager, get_websocket_manager
 from state_manager import get_state_manager
+from json_provider import MarketDataJSONProvider
 
 # Импорт модулей маршрутов
 from api_routes import APIRoutes
@@ -31,6 +32,7 @@ app.secret_key = os.urandom(24)
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 app.config['ETAG_DISABLED'] = True
+app.json = MarketDataJSONProvider(app)
 
 # =============================================================================
 # GLOBAL VARIABLES
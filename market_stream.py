@@ -0,0 +1,98 @@
+"""
+Market Stream Module
+Поток рыночных данных для браузера (Server-Sent Events) из кэша PairWebSocketManager
+"""
+
+import itertools
+import logging
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from conflation import ConflatingConsumer
+from data_limits import DataLimits
+
+logger = logging.getLogger(__name__)
+
+
+class MarketStreamSubscriber:
+    """
+    Подписчик SSE на обновления пар с конфляцией на стороне сервера
+
+    Подключается к менеджеру как ConflatingConsumer: в потоке чтения WebSocket обновление
+    только замещает предыдущее по ключу (пара, раздел). Поток клиента забирает пачку
+    не чаще max_rate раз в секунду и отправляет по каждой паре дельту от последней
+    отправленной версии (get_changes), поэтому медленный клиент не накапливает очередь.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, ws_manager, pairs: Iterable[str], dumps: Callable[[object], str],
+                 max_rate: Optional[float] = None, heartbeat: Optional[float] = None):
+        """
+        Args:
+            ws_manager: PairWebSocketManager
+            pairs: Пары потока (BTC_USDT)
+            dumps: Сериализация в JSON (app.json.dumps - понимает CompactOrderBook)
+            max_rate: Максимум отправок в секунду (по умолчанию из DataLimits)
+            heartbeat: Интервал keep-alive комментариев в секундах
+        """
+        self.ws_manager = ws_manager
+        self.pairs = [pair.upper() for pair in pairs][:DataLimits.SSE_MAX_PAIRS]
+        self.dumps = dumps
+        self.heartbeat = heartbeat or DataLimits.SSE_HEARTBEAT_SECONDS
+        self.sent = 0
+        self.consumer = ConflatingConsumer(f"sse-{next(self._ids)}", pairs=self.pairs,
+                                           max_rate=max_rate or DataLimits.SSE_MAX_UPDATES_PER_SECOND)
+        # Последняя отправленная клиенту версия и счетчик сделок по парам
+        self._versions: Dict[str, int] = {}
+        self._trades_seq: Dict[str, Optional[int]] = {}
+
+    @property
+    def conflated(self) -> int:
+        """Обновления, замещенные более новыми до отправки"""
+        return self.consumer.dropped
+
+    def open(self):
+        # Пары потока удерживаются в реестре подписок, пока клиент подключен
+        self.ws_manager.subscriptions.acquire(self.consumer.name, self.pairs)
+        self.ws_manager.add_consumer(self.consumer)
+        # Первое событие по каждой паре - полный снимок
+        for pair in self.pairs:
+            self.consumer.offer((pair, 'snapshot'), None)
+
+    def close(self):
+        self.ws_manager.remove_consumer(self.consumer)
+        self.ws_manager.subscriptions.release_consumer(self.consumer.name)
+
+    def _event(self, pair: str) -> Optional[str]:
+        """Сформировать SSE событие с изменениями пары после последней отправки"""
+        changes = self.ws_manager.get_changes(pair, self._versions.get(pair, -1), self._trades_seq.get(pair))
+        if changes is None or changes.get('unchanged'):
+            return None
+        data = changes.get('data') or {}
+        self._versions[pair] = changes['version']
+        if 'trades_seq' in data:
+            self._trades_seq[pair] = data['trades_seq']
+        payload = dict(changes, success=True, pair=pair)
+        return f"event: market\ndata: {self.dumps(payload)}\n\n"
+
+    def events(self) -> Iterator[str]:
+        """Генератор SSE кадров; завершается при close() или отключении клиента"""
+        self.open()
+        try:
+            yield f"retry: 3000\nevent: hello\ndata: {self.dumps({'pairs': self.pairs})}\n\n"
+            while not self.consumer.closed:
+                batch = self.consumer.drain(timeout=self.heartbeat)
+                if not batch:
+                    if not self.consumer.closed:
+                        yield ": keep-alive\n\n"
+                    continue
+                # Несколько разделов одной пары - одно событие
+                for pair in dict.fromkeys(pair for pair, _ in batch):
+                    event = self._event(pair)
+                    if event is not None:
+                        self.sent += 1
+                        yield event
+        finally:
+            # GeneratorExit при отключении клиента тоже попадает сюда
+            self.close()
+            logger.debug(f"SSE поток {self.pairs} закрыт: отправлено {self.sent}, схлопнуто {self.conflated}")
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный заменитель Gate.io WebSocket v4 для нагрузочных тестов без сети
+
+Сервер понимает протокол Gate.io v4 (subscribe/unsubscribe, spot.ping, обновления
+event=update) для каналов spot.tickers, spot.order_book, spot.order_book_update,
+spot.trades и spot.book_ticker и генерирует синтетические данные моделью пары
+synthetic_market.SyntheticPair: цена - геометрическое броуновское движение, стакан -
+уровни вокруг цены с согласованными диффами, сделки - по лучшим ценам. На том же порту отвечает REST GET /api/v4/spot/order_book (снимок с id для
+синхронизации инкрементального стакана).
+
+Использование:
+    python mock_gateio_server.py                                    # ws://127.0.0.1:8765/ws/v4/
+    python mock_gateio_server.py --port 9000 --book-rate 50 --trade-rate 10 --seed 1
+
+Подключение менеджера:
+    init_websocket_manager(None, None, ws_url='ws://127.0.0.1:8765/ws/v4/',
+                           rest_host='http://127.0.0.1:8765')
+    или DataLimits.WS_MARKET_URL / DataLimits.WS_MARKET_REST_HOST для всего приложения.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import math
+import queue
+import random
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic_market import SECONDS_PER_YEAR, SyntheticPair, synthetic_pairs
+
+logger = logging.getLogger(__name__)
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_OP_TEXT, _OP_BINARY, _OP_CLOSE, _OP_PING, _OP_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+# Каналы, по которым пара получает стакан (его состояние ведется только для них)
+_BOOK_CHANNELS = ("spot.order_book", "spot.order_book_update", "spot.book_ticker")
+CHANNELS = ("spot.tickers", "spot.trades") + _BOOK_CHANNELS
+
+
+def _encode_frame(opcode: int, payload: bytes) -> bytes:
+    """Кадр сервера (без маски)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    length = len(payload)
+    if not length:
+        return payload
+    key = int.from_bytes((mask * (length // 4 + 1))[:length], 'big')
+    return (int.from_bytes(payload, 'big') ^ key).to_bytes(length, 'big')
+
+
+class _Connection:
+    """Соединение клиента: кадры отправляет отдельный поток из очереди"""
+
+    def __init__(self, sock, address, max_pending: int):
+        self.sock = sock
+        self.address = address
+        self.max_pending = max_pending
+        self.closed = False
+        self.sent = 0
+        # {канал: {пара: аргументы подписки после пары}}
+        self.channels: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name=f"mock-ws-{address[1]}", daemon=True)
+        self._writer.start()
+
+    def send_text(self, text: str):
+        self.send_frame(_encode_frame(_OP_TEXT, text.encode('utf-8')))
+
+    def send_frame(self, frame: bytes):
+        if self.closed:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            # Клиент не успевает читать - биржа в таком случае рвет соединение
+            logger.warning(f"Клиент {self.address} отстал на {self.max_pending} кадров, соединение закрыто")
+            self.close()
+            return
+        self._queue.put(frame)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._queue.put(None)
+
+    def _write_loop(self):
+        get, get_nowait = self._queue.get, self._queue.get_nowait
+        try:
+            while True:
+                # Накопившиеся кадры уходят одним sendall
+                frames = [get()]
+                try:
+                    while len(frames) < 512 and frames[-1] is not None:
+                        frames.append(get_nowait())
+                except queue.Empty:
+                    pass
+                done = frames[-1] is None
+                if done:
+                    frames.pop()
+                self.sock.sendall(b''.join(frames))
+                self.sent += len(frames)
+                if done:
+                    break
+        except OSError:
+            pass
+        finally:
+            self.closed = True
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Разбор HTTP запроса: WebSocket upgrade или REST снимок стакана"""
+
+    def handle(self):
+        mock: 'MockGateIOServer' = self.server.mock
+        request_line = self.rfile.readline(65537).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = self.rfile.readline(65537)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2:
+            return
+        if headers.get('upgrade', '').lower() == 'websocket':
+            self._websocket(mock, headers)
+        else:
+            self._rest(mock, request_line[1])
+
+    def _rest(self, mock: 'MockGateIOServer', target: str):
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path.rstrip('/') == '/api/v4/spot/order_book' and params.get('currency_pair'):
+            status, body = 200, mock.order_book_snapshot(params['currency_pair'], int(params.get('limit', 10)))
+        else:
+            status, body = 404, {'label': 'NOT_FOUND', 'message': f'{url.path} не поддерживается'}
+        payload = json.dumps(body).encode('utf-8')
+        self.wfile.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                         f"Connection: close\r\n\r\n".encode('latin-1') + payload)
+
+    def _websocket(self, mock: 'MockGateIOServer', headers: Dict[str, str]):
+        accept = base64.b64encode(hashlib.sha1((headers.get('sec-websocket-key', '') + _WS_GUID)
+                                               .encode('latin-1')).digest()).decode('latin-1')
+        self.wfile.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('latin-1'))
+        connection = _Connection(self.connection, self.client_address, mock.max_pending)
+        mock._connected(connection)
+        try:
+            self._read_loop(mock, connection)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Клиент {self.client_address}: {e}")
+        finally:
+            mock._disconnected(connection)
+            connection.close()
+
+    def _read_loop(self, mock: 'MockGateIOServer', connection: _Connection):
+        read = self.rfile.read
+        fragments: List[bytes] = []
+        while not connection.closed:
+            header = read(2)
+            if len(header) < 2:
+                return
+            first, second = header
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', read(8))[0]
+            mask = read(4) if second & 0x80 else b''
+            payload = read(length)
+            if mask:
+                payload = _unmask(payload, mask)
+            if opcode == _OP_CLOSE:
+                connection.send_frame(_encode_frame(_OP_CLOSE, payload[:2]))
+                return
+            if opcode == _OP_PING:
+                connection.send_frame(_encode_frame(_OP_PONG, payload))
+                continue
+            if opcode == _OP_PONG:
+                continue
+            fragments.append(payload)
+            if first & 0x80:
+                message, fragments = b''.join(fragments), []
+                mock._on_message(connection, message)
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Сотни соединений и запросов снимков при старте нагрузки
+    request_queue_size = 1024
+
+
+class MockGateIOServer:
+    """
+    Синтетическая биржа: общий рынок пар и рассылка обновлений подписчикам
+
+    Рынок пары создается при первой подписке (цена из seed), поэтому подходят и
+    настоящие имена пар, и synthetic_pairs(). Поток рынка раз в tick секунд двигает
+    цены подписанных пар и выпускает события с заданными частотами (на пару в
+    секунду); каждое событие кодируется один раз и раздается всем подписчикам.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, ticker_rate: float = 1.0,
+                 book_rate: float = 10.0, trade_rate: float = 2.0, depth: int = 50,
+                 volatility: float = 0.8, tick: float = 0.05, seed: Optional[int] = None,
+                 max_pending: int = 100000):
+        """
+        Args:
+            host, port: Адрес сервера (port=0 - свободный порт, см. address)
+            ticker_rate: Обновлений тикера на пару в секунду
+            book_rate: Изменений стакана (диффов spot.order_book_update) на пару в секунду
+            trade_rate: Сделок на пару в секунду
+            depth: Уровней стакана на сторону
+            volatility: Годовая волатильность логарифма цены (0.8 = 80%)
+            tick: Период генерации в секундах (снимки spot.order_book - не чаще)
+            seed: Зерно генератора (одинаковые цены и стаканы при одинаковых подписках)
+            max_pending: Максимум неотправленных кадров клиента до разрыва соединения
+        """
+        self.ticker_rate = ticker_rate
+        self.book_rate = book_rate
+        self.trade_rate = trade_rate
+        self.depth = depth
+        self.sigma = volatility / math.sqrt(SECONDS_PER_YEAR)
+        self.tick = tick
+        self.max_pending = max_pending
+        self._random = random.Random(seed)
+        self._pairs: Dict[str, SyntheticPair] = {}
+        # Накопленная дробная часть числа событий: {пара: {вид: остаток}}
+        self._credits: Dict[str, Dict[str, float]] = {}
+        # {пара: {канал: {соединение: аргументы подписки}}}
+        self._subscribers: Dict[str, Dict[str, Dict[_Connection, Tuple[str, ...]]]] = {}
+        self._connections: List[_Connection] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.events = 0
+        self._server = _ThreadingServer((host, port), _Handler)
+        self._server.mock = self
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    @property
+    def ws_url(self) -> str:
+        host, port = self.address
+        return f"ws://{host}:{port}/ws/v4/"
+
+    @property
+    def rest_host(self) -> str:
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockGateIOServer':
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name="mock-gateio-accept", daemon=True),
+            threading.Thread(target=self._market_loop, name="mock-gateio-market", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Заменитель Gate.io WebSocket: {self.ws_url} (REST {self.rest_host})")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'connections': len(self._connections),
+                'pairs': len(self._subscribers),
+                'events': self.events,
+                'sent': sum(connection.sent for connection in self._connections)
+            }
+
+    # ------------------------------------------------------------------
+    # Протокол
+    # ------------------------------------------------------------------
+
+    def _connected(self, connection: _Connection):
+        with self._lock:
+            self._connections.append(connection)
+
+    def _disconnected(self, connection: _Connection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+            for channel, pairs in list(connection.channels.items()):
+                for pair in list(pairs):
+                    self._unsubscribe(connection, channel, pair)
+
+    def _on_message(self, connection: _Connection, message: bytes):
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(request, dict):
+            return
+        now = time.time()
+        channel = request.get('channel', '')
+        event = request.get('event', '')
+        reply = {"time": int(now), "time_ms": int(now * 1000), "id": request.get('id'), "channel": channel}
+        if channel == "spot.ping":
+            reply.update(channel="spot.pong", event="", result=None)
+        elif event in ('subscribe', 'unsubscribe') and channel in CHANNELS:
+            payload = [str(item) for item in request.get('payload') or []]
+            # Стакан: [пара, аргументы...]; остальные каналы - список пар
+            if channel in ("spot.order_book", "spot.order_book_update"):
+                entries = [(payload[0].upper(), tuple(payload[1:]))] if payload else []
+            else:
+                entries = [(pair.upper(), ()) for pair in payload]
+            with self._lock:
+                for pair, args in entries:
+                    if event == 'subscribe':
+                        self._subscribe(connection, channel, pair, args)
+                    else:
+                        self._unsubscribe(connection, channel, pair)
+            reply.update(event=event, payload=payload, result={"status": "success"})
+        else:
+            reply.update(event=event, error={"code": 2, "message": f"unknown channel {channel}"}, result=None)
+        connection.send_text(json.dumps(reply))
+
+    def _subscribe(self, connection: _Connection, channel: str, pair: str, args: Tuple[str, ...]):
+        """Подписать соединение (вызывать под блокировкой)"""
+        self._pair(pair)
+        self._subscribers.setdefault(pair, {}).setdefault(channel, {})[connection] = args
+        connection.channels.setdefault(channel, {})[pair] = args
+
+    def _unsubscribe(self, connection: _Connection, channel: str, pair: str):
+        """Отписать соединение (вызывать под блокировкой)"""
+        connection.channels.get(channel, {}).pop(pair, None)
+        channels = self._subscribers.get(pair)
+        if channels is None:
+            return
+        subscribers = channels.get(channel)
+        if subscribers is not None:
+            subscribers.pop(connection, None)
+            if not subscribers:
+                del channels[channel]
+        if not channels:
+            del self._subscribers[pair]
+
+    def order_book_snapshot(self, pair: str, limit: int) -> Dict[str, Any]:
+        """REST снимок стакана в формате GET /spot/order_book?with_id=true"""
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            state = self._pair(pair.upper())
+            if state.best is None:
+                state.book_update(self._random, self.depth)
+            bids, asks = state.levels(limit)
+            return {'id': state.update_id, 'current': now_ms, 'update': now_ms, 'bids': bids, 'asks': asks}
+
+    # ------------------------------------------------------------------
+    # Синтетический рынок
+    # ------------------------------------------------------------------
+
+    def _pair(self, pair: str) -> SyntheticPair:
+        """Рынок пары (вызывать под блокировкой)"""
+        state = self._pairs.get(pair)
+        if state is None:
+            price = 10.0 ** self._random.uniform(-3, 4)
+            state = self._pairs[pair] = SyntheticPair(pair, price, time.time())
+        return state
+
+    def _due(self, pair: str, kind: str, rate: float, dt: float) -> int:
+        """Сколько событий с частотой rate пришлось на интервал dt"""
+        credits = self._credits.setdefault(pair, {})
+        credit = credits.get(kind, 0.0) + rate * dt
+        count = int(credit)
+        credits[kind] = credit - count
+        return count
+
+    def _market_loop(self):
+        last = time.monotonic()
+        while not self._stop.wait(self.tick):
+            now = time.monotonic()
+            dt, last = now - last, now
+            try:
+                wall = time.time()
+                with self._lock:
+                    frames = self._generate(dt, wall)
+                # Кодирование и рассылка - вне блокировки (подписки и снимки не ждут)
+                head = f'{{"time":{int(wall)},"time_ms":{int(wall * 1000)},"channel":"'
+                for channel, result, connections in frames:
+                    frame = _encode_frame(_OP_TEXT, (f'{head}{channel}","event":"update","result":'
+                                                     f'{json.dumps(result)}}}').encode('utf-8'))
+                    for connection in connections:
+                        connection.send_frame(frame)
+                self.events += len(frames)
+            except Exception as e:
+                logger.error(f"Ошибка генерации рынка: {e}")
+
+    def _generate(self, dt: float, now: float) -> List[Tuple[str, Dict[str, Any], List[_Connection]]]:
+        """
+        Один шаг рынка всех подписанных пар (вызывать под блокировкой)
+
+        Returns:
+            События: (канал, result, подписчики)
+        """
+        events = []
+        rng, depth = self._random, self.depth
+        for pair, channels in self._subscribers.items():
+            state = self._pairs[pair]
+            state.move(now, 0.0, self.sigma, rng.gauss)
+            frames: List[Tuple[str, Any, Dict[_Connection, Tuple[str, ...]]]] = []
+
+            if any(channel in channels for channel in _BOOK_CHANNELS):
+                moves = self._due(pair, 'book', self.book_rate, dt)
+                updates = channels.get("spot.order_book_update")
+                for _ in range(moves):
+                    first_id = state.update_id + 1
+                    changes = state.book_update(rng, depth)
+                    if updates:
+                        frames.append(("spot.order_book_update", state.book_update_result(now, first_id, changes),
+                                       updates))
+                if moves:
+                    if "spot.book_ticker" in channels:
+                        frames.append(("spot.book_ticker", state.book_ticker_result(now), channels["spot.book_ticker"]))
+                    if "spot.order_book" in channels:
+                        self._book_snapshots(state, now, channels["spot.order_book"], frames)
+
+            if "spot.trades" in channels:
+                for _ in range(self._due(pair, 'trades', self.trade_rate, dt)):
+                    trade = state.trade(rng, depth)
+                    frames.append(("spot.trades", state.trade_result(now, *trade), channels["spot.trades"]))
+            if "spot.tickers" in channels:
+                if self._due(pair, 'tickers', self.ticker_rate, dt):
+                    if "spot.trades" not in channels:
+                        state.last = state.price
+                    frames.append(("spot.tickers", state.ticker_result(), channels["spot.tickers"]))
+
+            events.extend((channel, result, list(subscribers)) for channel, result, subscribers in frames)
+        return events
+
+    def _book_snapshots(self, state: SyntheticPair, now: float, subscribers: Dict[_Connection, Tuple[str, ...]],
+                        frames: List):
+        """Снимки spot.order_book: один кадр на каждую запрошенную глубину"""
+        by_level: Dict[int, Dict[_Connection, Tuple[str, ...]]] = {}
+        for connection, args in subscribers.items():
+            level = int(args[0]) if args and args[0].isdigit() else 20
+            by_level.setdefault(level, {})[connection] = args
+        for level, group in by_level.items():
+            bids, asks = state.levels(level)
+            frames.append(("spot.order_book", {
+                "t": int(now * 1000), "lastUpdateId": state.update_id, "s": state.pair, "bids": bids, "asks": asks
+            }, group))
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'host': '127.0.0.1', 'port': 8765, 'ticker-rate': 1.0, 'book-rate': 10.0,
+               'trade-rate': 2.0, 'depth': 50, 'volatility': 0.8, 'tick': 0.05, 'seed': None}
+    while args:
+        name = args.pop(0).lstrip('-')
+        if name not in options or not args:
+            print(__doc__)
+            print(f"Параметры: {', '.join('--' + option for option in options)}")
+            sys.exit(1)
+        default = options[name]
+        value = args.pop(0)
+        options[name] = type(default)(value) if default is not None else int(value)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = MockGateIOServer(options['host'], options['port'], ticker_rate=options['ticker-rate'],
+                              book_rate=options['book-rate'], trade_rate=options['trade-rate'],
+                              depth=options['depth'], volatility=options['volatility'],
+                              tick=options['tick'], seed=options['seed']).start()
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[MOCK] {server.stats()}")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+"""
+Order Book Module
+Локальный стакан Gate.io, поддерживаемый инкрементальными обновлениями spot.order_book_update
+"""
+
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from decimal import Decimal
+from itertools import accumulate
+from operator import mul
+from typing import Callable, Dict, Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _render(value: float) -> str:
+    """Число в строку без экспоненты (формат Gate.io)"""
+    text = repr(value)
+    if 'e' in text or 'E' in text:
+        text = format(Decimal(text), 'f')
+    return text[:-2] if text.endswith('.0') else text
+
+
+class CompactOrderBook:
+    """
+    Компактный стакан для кэша: параллельные массивы array('d') цен и объемов
+
+    Строки [[цена, объем], ...] формируются только при JSON сериализации (to_json)
+    или при обращении в стиле словаря ob['asks'] для обратной совместимости.
+    Массивы совместимы с numpy.frombuffer без копирования.
+
+    Аналитика считается при создании (то есть при применении обновления стакана):
+    mid, spread_bps, microprice, imbalance по IMBALANCE_LEVELS лучшим уровням и
+    накопленные объемы и суммы по уровням от лучшей цены (*_cum_sizes, *_cum_notional).
+    to_json() отдает ее вместе с уровнями, поэтому ни читатели кэша, ни браузер
+    не пересчитывают ее на каждый запрос.
+    """
+
+    # Лучших уровней каждой стороны в дисбалансе объемов
+    IMBALANCE_LEVELS = 5
+    # Ключи to_json(): уровни и аналитика
+    JSON_KEYS = frozenset(('asks', 'bids', 'mid', 'spread_bps', 'microprice', 'imbalance', 'ask_cum_sizes',
+                           'ask_cum_notional', 'bid_cum_sizes', 'bid_cum_notional'))
+
+    __slots__ = ('ask_prices', 'ask_sizes', 'bid_prices', 'bid_sizes', 'mid', 'spread_bps', 'microprice',
+                 'imbalance', 'ask_cum_sizes', 'ask_cum_notional', 'bid_cum_sizes', 'bid_cum_notional',
+                 '_rendered')
+
+    def __init__(self, ask_prices: Iterable[float] = (), ask_sizes: Iterable[float] = (),
+                 bid_prices: Iterable[float] = (), bid_sizes: Iterable[float] = ()):
+        """
+        Args:
+            ask_prices, ask_sizes: asks от лучшей (минимальной) цены
+            bid_prices, bid_sizes: bids от лучшей (максимальной) цены
+        """
+        self.ask_prices = array('d', ask_prices)
+        self.ask_sizes = array('d', ask_sizes)
+        self.bid_prices = array('d', bid_prices)
+        self.bid_sizes = array('d', bid_sizes)
+        self._rendered: Optional[Dict[str, Any]] = None
+        self._compute_top()
+        self._compute_cumulative()
+
+    def _compute_top(self):
+        """Mid, спред в б.п., микроцена и дисбаланс объемов лучших уровней"""
+        ask_sizes, bid_sizes = self.ask_sizes, self.bid_sizes
+        if ask_sizes and bid_sizes:
+            ask, bid = self.ask_prices[0], self.bid_prices[0]
+            self.mid = (ask + bid) / 2
+            self.spread_bps = (ask - bid) / self.mid * 10000 if self.mid > 0 else 0.0
+            # Микроцена: лучшие цены, взвешенные объемом противоположной стороны
+            top = ask_sizes[0] + bid_sizes[0]
+            self.microprice = (ask * bid_sizes[0] + bid * ask_sizes[0]) / top if top > 0 else self.mid
+        else:
+            self.mid = self.spread_bps = self.microprice = 0.0
+        levels = self.IMBALANCE_LEVELS
+        ask_depth = sum(ask_sizes[:levels])
+        bid_depth = sum(bid_sizes[:levels])
+        depth = ask_depth + bid_depth
+        # От -1 (только продавцы) до +1 (только покупатели)
+        self.imbalance = (bid_depth - ask_depth) / depth if depth > 0 else 0.0
+
+    def _compute_cumulative(self):
+        """Накопленные объемы и суммы (цена * объем) по уровням от лучшей цены"""
+        self.ask_cum_sizes = array('d', accumulate(self.ask_sizes))
+        self.ask_cum_notional = array('d', accumulate(map(mul, self.ask_prices, self.ask_sizes)))
+        self.bid_cum_sizes = array('d', accumulate(self.bid_sizes))
+        self.bid_cum_notional = array('d', accumulate(map(mul, self.bid_prices, self.bid_sizes)))
+
+    def analytics(self) -> Dict[str, Any]:
+        """Аналитика стакана для ответов API (без пересчета)"""
+        return {
+            'mid': self.mid,
+            'spread_bps': self.spread_bps,
+            'microprice': self.microprice,
+            'imbalance': self.imbalance,
+            'ask_cum_sizes': self.ask_cum_sizes.tolist(),
+            'ask_cum_notional': self.ask_cum_notional.tolist(),
+            'bid_cum_sizes': self.bid_cum_sizes.tolist(),
+            'bid_cum_notional': self.bid_cum_notional.tolist()
+        }
+
+    @classmethod
+    def from_levels(cls, asks: Iterable, bids: Iterable, limit: int = 0) -> 'CompactOrderBook':
+        """Разобрать уровни Gate.io [[цена_str, объем_str], ...] один раз при получении"""
+        asks = list(asks)[:limit] if limit else list(asks)
+        bids = list(bids)[:limit] if limit else list(bids)
+        return cls(
+            (float(level[0]) for level in asks), (float(level[1]) for level in asks),
+            (float(level[0]) for level in bids), (float(level[1]) for level in bids)
+        )
+
+    @property
+    def best_ask(self) -> float:
+        return self.ask_prices[0] if self.ask_prices else 0.0
+
+    @property
+    def best_bid(self) -> float:
+        return self.bid_prices[0] if self.bid_prices else 0.0
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Стакан для кэша и клиентов (кэшируется)
+
+        Returns:
+            Уровни в формате Gate.io {'asks': [[цена, объем]], 'bids': [...]} и аналитика analytics()
+        """
+        rendered = self._rendered
+        if rendered is None:
+            rendered = {
+                'asks': [[_render(p), _render(a)] for p, a in zip(self.ask_prices, self.ask_sizes)],
+                'bids': [[_render(p), _render(a)] for p, a in zip(self.bid_prices, self.bid_sizes)]
+            }
+            rendered.update(self.analytics())
+            self._rendered = rendered
+        return rendered
+
+    def levels_json(self) -> Dict[str, List[List[str]]]:
+        """Только уровни в формате Gate.io {'asks': [[цена, объем]], 'bids': [...]}"""
+        rendered = self.to_json()
+        return {'asks': rendered['asks'], 'bids': rendered['bids']}
+
+    # Доступ в стиле словаря для кода, работающего со старым форматом кэша
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.to_json().get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.to_json()[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.JSON_KEYS
+
+    def __bool__(self) -> bool:
+        return bool(self.ask_prices) or bool(self.bid_prices)
+
+    def __repr__(self) -> str:
+        return f"CompactOrderBook(asks={len(self.ask_prices)}, bids={len(self.bid_prices)})"
+
+
+class OrderBookSide:
+    """Одна сторона стакана: отсортированные цены + уровни {цена: объем}"""
+
+    def __init__(self, descending: bool):
+        """
+        Args:
+            descending: True для bids (лучшая цена - максимальная)
+        """
+        self.descending = descending
+        self.prices: List[float] = []  # по возрастанию
+        self.levels: Dict[float, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def clear(self):
+        self.prices = []
+        self.levels = {}
+
+    def set_level(self, price_str: str, amount_str: str):
+        """Установить объем уровня; нулевой объем удаляет уровень"""
+        price, amount = float(price_str), float(amount_str)
+        if amount == 0:
+            if self.levels.pop(price, None) is not None:
+                del self.prices[bisect_left(self.prices, price)]
+            return
+        if price not in self.levels:
+            insort(self.prices, price)
+        self.levels[price] = amount
+
+    def trim(self, max_levels: int):
+        """Отбросить худшие уровни сверх лимита"""
+        excess = len(self.prices) - max_levels
+        if excess <= 0:
+            return
+        if self.descending:
+            dropped, self.prices = self.prices[:excess], self.prices[excess:]
+        else:
+            dropped, self.prices = self.prices[-excess:], self.prices[:-excess]
+        for price in dropped:
+            del self.levels[price]
+
+    def top(self, limit: int) -> List[float]:
+        """Лучшие цены, от лучшей к худшей (limit=0 - все)"""
+        if self.descending:
+            return self.prices[:-limit - 1:-1] if limit else self.prices[::-1]
+        return self.prices[:limit] if limit else self.prices[:]
+
+
+class IncrementalOrderBook:
+    """
+    Локальный стакан пары по диффам spot.order_book_update
+
+    Порядок синхронизации (документация Gate.io v4):
+    1. Подписаться на обновления и буферизовать их
+    2. Получить снимок REST /spot/order_book?with_id=true (id = baseID)
+    3. Отбросить обновления с u < baseID + 1
+    4. Первое применяемое обновление должно удовлетворять U <= baseID + 1 <= u
+    5. Каждое следующее - U == предыдущий u + 1, иначе пересинхронизация
+    """
+
+    BUFFER_LIMIT = 1000          # Максимум обновлений в буфере на время пересинхронизации
+    RESYNC_MIN_INTERVAL = 1.0    # Минимальный интервал между запросами снимка (сек)
+
+    def __init__(self, currency_pair: str, snapshot_loader: Callable[[str], Dict[str, Any]],
+                 max_levels: int = 1000, on_snapshot: Optional[Callable[['IncrementalOrderBook'], None]] = None,
+                 background_resync: bool = True):
+        """
+        Args:
+            currency_pair: Торговая пара
+            snapshot_loader: Функция загрузки REST снимка {'id', 'asks', 'bids'} для пары
+            max_levels: Максимум хранимых уровней на сторону
+            on_snapshot: Вызывается после применения снимка (в потоке пересинхронизации)
+            background_resync: Загружать снимок в отдельном потоке; False - сразу в вызывающем
+                потоке и без ограничения частоты (воспроизведение записи, загрузчик без сети)
+        """
+        self.currency_pair = currency_pair.upper()
+        self.snapshot_loader = snapshot_loader
+        self.max_levels = max_levels
+        self.on_snapshot = on_snapshot
+        self.background_resync = background_resync
+        self.asks = OrderBookSide(descending=False)
+        self.bids = OrderBookSide(descending=True)
+        self.last_update_id: Optional[int] = None
+        self.is_synced = False
+        self.resync_count = 0
+        self.update_time_ms: Optional[int] = None
+        self._buffer: deque = deque(maxlen=self.BUFFER_LIMIT)
+        self._resyncing = False
+        self._last_resync_at = 0.0
+        self._lock = threading.Lock()
+
+    def apply_snapshot(self, snapshot: Dict[str, Any]):
+        """Заменить стакан REST снимком и применить накопленные обновления"""
+        with self._lock:
+            self.asks.clear()
+            self.bids.clear()
+            for price, amount in snapshot.get('asks', []):
+                self.asks.set_level(price, amount)
+            for price, amount in snapshot.get('bids', []):
+                self.bids.set_level(price, amount)
+            self.last_update_id = int(snapshot['id'])
+            self.update_time_ms = snapshot.get('update')
+            self.is_synced = True
+
+            buffered = list(self._buffer)
+            self._buffer.clear()
+            for index, update in enumerate(buffered):
+                self._apply_locked(update)
+                if not self.is_synced:
+                    # Снимок устарел относительно буфера - ждем следующей пересинхронизации
+                    self._buffer.extend(buffered[index:])
+                    break
+            self._trim_locked()
+
+    def apply_update(self, update: Dict[str, Any]) -> bool:
+        """
+        Применить дифф spot.order_book_update
+
+        Returns:
+            True, если стакан изменился и синхронизирован
+        """
+        with self._lock:
+            if not self.is_synced:
+                self._buffer.append(update)
+                need_resync = not self._resyncing
+            else:
+                if self._apply_locked(update):
+                    self._trim_locked()
+                    return True
+                if self.is_synced:
+                    return False
+                self._buffer.append(update)
+                need_resync = not self._resyncing
+        if need_resync:
+            self.request_resync()
+        return False
+
+    def _apply_locked(self, update: Dict[str, Any]) -> bool:
+        """Проверить последовательность и применить дифф (под self._lock)"""
+        first_id, last_id = int(update['U']), int(update['u'])
+        expected = self.last_update_id + 1
+
+        if last_id < expected:
+            return False  # устаревшее обновление, уже учтено в снимке
+        if first_id > expected:
+            logger.warning(f"Разрыв последовательности стакана {self.currency_pair}: "
+                           f"ожидался {expected}, получен U={first_id}")
+            self.is_synced = False
+            return False
+
+        for price, amount in update.get('a', []):
+            self.asks.set_level(price, amount)
+        for price, amount in update.get('b', []):
+            self.bids.set_level(price, amount)
+        self.last_update_id = last_id
+        self.update_time_ms = update.get('t', self.update_time_ms)
+        return True
+
+    def _trim_locked(self):
+        self.asks.trim(self.max_levels)
+        self.bids.trim(self.max_levels)
+
+    def invalidate(self):
+        """Сбросить синхронизацию (например, после переподключения) и загрузить новый снимок"""
+        with self._lock:
+            self.is_synced = False
+            self._buffer.clear()
+            self._last_resync_at = 0.0
+        self.request_resync()
+
+    def request_resync(self):
+        """Запустить загрузку снимка в фоне (не блокирует поток чтения WebSocket)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._resyncing or (self.background_resync and now - self._last_resync_at < self.RESYNC_MIN_INTERVAL):
+                return
+            self._resyncing = True
+            self._last_resync_at = now
+            self.is_synced = False
+        if self.background_resync:
+            threading.Thread(target=self._resync_worker, daemon=True).start()
+        else:
+            self._resync_worker()
+
+    def _resync_worker(self):
+        try:
+            snapshot = self.snapshot_loader(self.currency_pair)
+            if not isinstance(snapshot, dict) or 'id' not in snapshot:
+                raise ValueError(f"снимок без id: {snapshot}")
+            self.apply_snapshot(snapshot)
+            self.resync_count += 1
+            logger.info(f"Стакан {self.currency_pair} синхронизирован (id={self.last_update_id})")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки снимка стакана {self.currency_pair}: {e}")
+        finally:
+            with self._lock:
+                self._resyncing = False
+        if self.is_synced and self.on_snapshot:
+            self.on_snapshot(self)
+
+    def to_compact(self, limit: int = 0) -> CompactOrderBook:
+        """Верх стакана для кэша (limit=0 - все уровни)"""
+        with self._lock:
+            ask_prices = self.asks.top(limit)
+            bid_prices = self.bids.top(limit)
+            return CompactOrderBook(
+                ask_prices, [self.asks.levels[price] for price in ask_prices],
+                bid_prices, [self.bids.levels[price] for price in bid_prices]
+            )
+
+    def to_dict(self, limit: int = 0) -> Dict[str, Any]:
+        """Стакан в формате Gate.io {'asks': [[цена, объем]], 'bids': [...]} (limit=0 - все уровни)"""
+        return self.to_compact(limit).levels_json()
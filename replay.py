@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Воспроизведение записанных кадров Gate.io WebSocket в PairWebSocketManager без сети
+
+Кадры проходят тот же путь, что и живые: GateIOWebSocket._on_message -> разбор ->
+обработчики тикера/стакана/сделок менеджера -> кэш, потребители, метрики. Поэтому
+запись дает повторяемый бенчмарк кэша, автотрейдера и HTTP эндпоинтов.
+
+Использование:
+    python replay.py captures/capture-20240101.jsonl.gz           # максимальная скорость
+    python replay.py capture.jsonl.xz --speed 1                   # реальное время
+    python replay.py a.jsonl.gz b.jsonl.gz --speed 10             # в 10 раз быстрее
+"""
+
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from capture import iter_capture
+from feed_metrics import FeedMetrics, LatencyHistogram
+from gateio_websocket import GateIOWebSocket, PairWebSocketManager, set_websocket_manager
+from subscriptions import TIER_FULL, TIER_TICKER, TIER_TOP
+
+# Каналы, по которым определяется уровень подписки пары в записи
+_FULL_CHANNELS = ("spot.order_book_update", "spot.order_book", "spot.trades")
+
+
+class ReplayWebSocket(GateIOWebSocket):
+    """Клиент без сети: подписки только регистрируют маршруты, кадры подает воспроизведение"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.auto_reconnect = False
+
+    def connect(self):
+        self.connected.set()
+
+    def disconnect(self):
+        self._closing = True
+
+
+class ReplayPairWebSocketManager(PairWebSocketManager):
+    """
+    Менеджер для воспроизведения: клиенты без сети, снимок стакана без REST
+
+    REST снимки в записи отсутствуют, поэтому локальный стакан начинается пустым с id
+    перед первым диффом пары и наполняется диффами (или снимок дает snapshot_loader,
+    например синтетический рынок). Кадры разбираются и снимок
+    загружается в потоке воспроизведения (без пула разбора и фоновой загрузки),
+    поэтому результат не зависит от планирования потоков.
+    """
+
+    client_class = ReplayWebSocket
+    background_resync = False
+
+    def __init__(self, snapshot_loader: Optional[Callable[[str], Dict[str, Any]]] = None, **kwargs):
+        """
+        Args:
+            snapshot_loader: Источник снимков стакана вместо пустого снимка перед первым диффом
+            kwargs: Параметры PairWebSocketManager
+        """
+        super().__init__(None, None, "replay://capture", dispatch_workers=0, **kwargs)
+        self.snapshot_loader = snapshot_loader
+        # Первый номер (U) текущего диффа стакана по парам - якорь для снимка
+        self.book_anchors: Dict[str, int] = {}
+
+    def _load_orderbook_snapshot(self, pair_formatted: str) -> Dict[str, Any]:
+        if self.snapshot_loader is not None:
+            return self.snapshot_loader(pair_formatted)
+        anchor = self.book_anchors.get(pair_formatted)
+        if anchor is None:
+            raise ValueError(f"нет диффов стакана {pair_formatted} для начала воспроизведения")
+        return {'id': anchor - 1, 'asks': [], 'bids': []}
+
+
+class _Frame:
+    """Кадр записи с предварительно извлеченными полями (вне измеряемого цикла)"""
+
+    __slots__ = ('ts', 'text', 'pair', 'book_first_id')
+
+    def __init__(self, ts: Optional[float], text: str, pair: Optional[str], book_first_id: Optional[int]):
+        self.ts = ts
+        self.text = text
+        self.pair = pair
+        self.book_first_id = book_first_id
+
+
+class CaptureReplayer:
+    """
+    Воспроизведение записи в менеджер на скорости 1x, Nx или максимальной
+
+    Файлы читаются и разбираются заранее (распаковка не входит в замер). Пары и их
+    уровни подписки (по каналам, встреченным в записи) создаются до начала отсчета.
+    По итогам run() возвращает пропускную способность, отставание от расписания
+    и задержки этапов (разбор, обработчики) по каналам.
+    """
+
+    def __init__(self, frames: Iterable[Tuple[Optional[float], str]], speed: float = 0.0,
+                 manager: Optional[ReplayPairWebSocketManager] = None, install: bool = False):
+        """
+        Args:
+            frames: (время получения, кадр) в порядке записи
+            speed: Множитель скорости (1 - реальное время, 10 - в 10 раз быстрее, 0 - без пауз)
+            manager: Менеджер для воспроизведения (по умолчанию новый, без сети)
+            install: Сделать менеджер глобальным (get_websocket_manager) для HTTP эндпоинтов
+        """
+        self.speed = speed
+        self.frames: List[_Frame] = []
+        self.pair_channels: Dict[str, set] = {}
+        self.metrics = FeedMetrics()
+        self._prepare(frames)
+        if manager is None:
+            incremental = any("spot.order_book_update" in channels for channels in self.pair_channels.values())
+            manager = ReplayPairWebSocketManager(incremental_orderbook=incremental)
+        self.manager = manager
+        self._open_pairs()
+        if install:
+            set_websocket_manager(manager)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str], **kwargs) -> 'CaptureReplayer':
+        """Воспроизведение файлов записи (по порядку аргументов)"""
+        def frames():
+            for path in paths:
+                yield from iter_capture(path)
+        return cls(frames(), **kwargs)
+
+    def _prepare(self, frames: Iterable[Tuple[Optional[float], str]]):
+        """Определить пару, канал и номер диффа стакана каждого кадра"""
+        for ts, text in frames:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                continue
+            pair = book_first_id = None
+            if isinstance(data, dict) and data.get('event') == 'update':
+                channel = data.get('channel', '')
+                result = data.get('result')
+                pair = GateIOWebSocket._extract_pair(result)
+                if pair:
+                    self.pair_channels.setdefault(pair, set()).add(channel)
+                if channel == "spot.order_book_update" and isinstance(result, dict) and 'U' in result:
+                    book_first_id = int(result['U'])
+            self.frames.append(_Frame(ts, text, pair, book_first_id))
+
+    def _open_pairs(self):
+        """Подписать пары записи на уровень по их каналам (без сети)"""
+        tiers: Dict[str, List[str]] = {}
+        for pair, channels in self.pair_channels.items():
+            if any(channel in channels for channel in _FULL_CHANNELS):
+                tier = TIER_FULL
+            elif "spot.book_ticker" in channels:
+                tier = TIER_TOP
+            else:
+                tier = TIER_TICKER
+            tiers.setdefault(tier, []).append(pair)
+        for tier, pairs in tiers.items():
+            self.manager.create_connections(sorted(pairs), tier)
+        for ws_client in {id(client): client for client in self.manager.connections.values()}.values():
+            ws_client.metrics = self.metrics
+
+    def run(self) -> Dict[str, Any]:
+        """Подать все кадры и вернуть отчет"""
+        manager = self.manager
+        clients = manager.connections
+        anchors = manager.book_anchors
+        pace = self.speed and self.speed > 0
+        lag = LatencyHistogram()
+        first_ts = next((frame.ts for frame in self.frames if frame.ts is not None), None)
+        delivered = 0
+        started = time.perf_counter()
+        for frame in self.frames:
+            if pace and frame.ts is not None and first_ts is not None:
+                due = started + (frame.ts - first_ts) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag.record(-delay * 1000)
+            client = clients.get(frame.pair) if frame.pair else None
+            if client is None:
+                # Служебные кадры без пары - через любой клиент (pong, подтверждения)
+                client = next(iter(clients.values()), None)
+                if client is None:
+                    continue
+            if frame.book_first_id is not None:
+                anchors[frame.pair] = frame.book_first_id
+            client._on_message(None, frame.text)
+            delivered += 1
+        elapsed = time.perf_counter() - started
+        return self._report(delivered, elapsed, first_ts, lag)
+
+    def _report(self, delivered: int, elapsed: float, first_ts: Optional[float],
+                lag: LatencyHistogram) -> Dict[str, Any]:
+        last_ts = next((frame.ts for frame in reversed(self.frames) if frame.ts is not None), None)
+        snapshot = self.metrics.snapshot()
+        stages = ('decode_ms', 'apply_ms', 'receive_to_applied_ms')
+        return {
+            'frames': delivered,
+            'pairs': len(self.pair_channels),
+            'speed': self.speed or 'max',
+            'elapsed_s': round(elapsed, 3),
+            'capture_span_s': round(last_ts - first_ts, 3) if first_ts is not None and last_ts is not None else None,
+            'messages_per_sec': round(delivered / elapsed, 1) if elapsed > 0 else None,
+            'schedule_lag_ms': lag.to_dict() if self.speed else None,
+            'stages': {
+                channel: {stage: {key: series[stage][key] for key in ('mean', 'p50', 'p99', 'max')}
+                          for stage in stages}
+                for channel, series in snapshot['channels'].items()
+            },
+            'orderbooks': {pair: book.last_update_id for pair, book in self.manager.order_books.items()}
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    print("=" * 80)
+    print(f"ВОСПРОИЗВЕДЕНИЕ: {report['frames']} кадров, {report['pairs']} пар, скорость {report['speed']}")
+    print("=" * 80)
+    print(f"Время: {report['elapsed_s']} с (запись: {report['capture_span_s']} с), "
+          f"{report['messages_per_sec']} кадров/с")
+    if report['schedule_lag_ms'] and report['schedule_lag_ms']['count']:
+        lag = report['schedule_lag_ms']
+        print(f"Отставание от расписания: p50 {lag['p50']} мс, p99 {lag['p99']} мс, max {lag['max']} мс")
+    print(f"{'канал':<26}{'разбор p50/p99':>18}{'обработчики p50/p99':>24}{'всего p50/p99':>18}")
+    for channel, stages in sorted(report['stages'].items()):
+        decode, apply, total = stages['decode_ms'], stages['apply_ms'], stages['receive_to_applied_ms']
+        print(f"{channel:<26}{decode['p50']!s:>9}/{decode['p99']!s:<8}{apply['p50']!s:>14}/{apply['p99']!s:<9}"
+              f"{total['p50']!s:>9}/{total['p99']!s:<8}")
+
+
+def main():
+    args = sys.argv[1:]
+    speed = 0.0
+    if '--speed' in args:
+        index = args.index('--speed')
+        speed = float(args[index + 1])
+        del args[index:index + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    replayer = CaptureReplayer.from_files(args, speed=speed)
+    print_report(replayer.run())
+
+
+if __name__ == '__main__':
+    main()
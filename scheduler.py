@@ -0,0 +1,149 @@
+"""
+Scheduler Module
+Общий планировщик таймеров процесса (heartbeat, проверки устаревания, переподключения)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """Запланированный вызов; cancel() снимает его (и все будущие повторы)"""
+
+    __slots__ = ('when', 'interval', 'callback', 'args', 'name', 'cancelled')
+
+    def __init__(self, when: float, interval: Optional[float], callback: Callable, args: tuple, name: str):
+        self.when = when
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerScheduler:
+    """
+    Таймеры на куче в одном потоке
+
+    Вместо потока на каждое соединение, который просыпается раз в несколько секунд,
+    все таймеры процесса обслуживает один поток. Обратные вызовы выполняются в нем,
+    поэтому должны быть короткими (отправка ping, проверка времени, постановка задачи).
+    Опоздание срабатывания относительно плана копится в статистике (jitter).
+    """
+
+    LATENESS_SAMPLES = 1000  # Последние опоздания для перцентилей
+
+    def __init__(self, name: str = "timer-scheduler"):
+        self.name = name
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.fired = 0
+        self.errors = 0
+        self._lateness: deque = deque(maxlen=self.LATENESS_SAMPLES)
+        self._max_lateness = 0.0
+
+    def call_later(self, delay: float, callback: Callable, *args: Any, name: str = "") -> TimerHandle:
+        """Однократный вызов через delay секунд"""
+        return self._schedule(TimerHandle(time.monotonic() + max(0.0, delay), None, callback, args, name))
+
+    def call_every(self, interval: float, callback: Callable, *args: Any, name: str = "",
+                   first_delay: Optional[float] = None) -> TimerHandle:
+        """Периодический вызов каждые interval секунд (первый - через first_delay или interval)"""
+        delay = interval if first_delay is None else first_delay
+        return self._schedule(TimerHandle(time.monotonic() + max(0.0, delay), interval, callback, args, name))
+
+    def _schedule(self, handle: TimerHandle) -> TimerHandle:
+        with self._cond:
+            heapq.heappush(self._heap, (handle.when, next(self._counter), handle))
+            self._ensure_thread()
+            # Будим поток, только если новый таймер стал ближайшим
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    # Снятые таймеры выбрасываем с вершины, не дожидаясь их срока
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._stopped:
+                    return
+                when, _, handle = heapq.heappop(self._heap)
+                if handle.interval is not None:
+                    # Следующий срок от плана, а не от факта - опоздания не накапливаются
+                    handle.when = max(when + handle.interval, now)
+                    heapq.heappush(self._heap, (handle.when, next(self._counter), handle))
+
+            lateness = now - when
+            self._lateness.append(lateness)
+            if lateness > self._max_lateness:
+                self._max_lateness = lateness
+            self.fired += 1
+            try:
+                handle.callback(*handle.args)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка таймера {handle.name or handle.callback}: {e}")
+
+    def stop(self):
+        """Остановить поток (таймеры остаются в куче до следующего запуска)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Число таймеров, срабатываний и опоздания срабатывания в миллисекундах"""
+        samples = sorted(self._lateness)
+        def percentile(q: float) -> float:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3) if samples else 0.0
+        with self._cond:
+            timers = sum(1 for _, _, handle in self._heap if not handle.cancelled)
+        return {
+            'timers': timers,
+            'fired': self.fired,
+            'errors': self.errors,
+            'lateness_ms': {
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'max': round(self._max_lateness * 1000, 3)
+            }
+        }
+
+
+# Глобальный планировщик процесса
+_scheduler: Optional[TimerScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> TimerScheduler:
+    """Получить общий планировщик (создается при первом обращении)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TimerScheduler()
+        return _scheduler
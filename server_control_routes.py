@@ -377,7 +377,11 @@ class ServerControlRoutes:
                 "low_24h": 0.0,
                 "bid": 0.0,
                 "ask": 0.0,
-                "spread": 0.0
+                "spread": 0.0,
+                "mid": 0.0,
+                "spread_bps": 0.0,
+                "microprice": 0.0,
+                "imbalance": 0.0
             }
             
             if pair_data and pair_data.get('ticker'):
@@ -389,17 +393,19 @@ class ServerControlRoutes:
                     indicators['high_24h'] = float(ticker.get('high_24h', 0))
                     indicators['low_24h'] = float(ticker.get('low_24h', 0))
                     
-                    if pair_data.get('orderbook'):
-                        ob = pair_data['orderbook']
-                        if ob.get('asks') and ob.get('bids'):
-                            try:
-                                ask = float(ob['asks'][0][0])
-                                bid = float(ob['bids'][0][0])
-                                indicators['ask'] = ask
-                                indicators['bid'] = bid
-                                indicators['spread'] = ((ask - bid) / bid * 100) if bid > 0 else 0
-                            except (IndexError, ValueError, TypeError):
-                                pass
+                    ob = pair_data.get('orderbook')
+                    if ob:
+                        # Кэш хранит стакан в CompactOrderBook - аналитика посчитана при обновлении стакана
+                        ask = ob.best_ask
+                        bid = ob.best_bid
+                        if ask > 0 and bid > 0:
+                            indicators['ask'] = ask
+                            indicators['bid'] = bid
+                            indicators['spread'] = (ask - bid) / bid * 100
+                            indicators['mid'] = ob.mid
+                            indicators['spread_bps'] = ob.spread_bps
+                            indicators['microprice'] = ob.microprice
+                        indicators['imbalance'] = ob.imbalance
                 except (ValueError, TypeError):
                     pass
             
@@ -275,34 +275,122 @@ async function subscribeToPairData(base,quote){
     setNetworkConnectionState('error');
   }
 }
-async function loadMarketData(forceRefresh=false){
-  try{
-    const forceParam = forceRefresh ? '&force=1' : '';
-    const r=await fetch(`/api/pair/data?base_currency=${currentBaseCurrency}&quote_currency=${currentQuoteCurrency}${forceParam}`);
-    const d=await r.json();
-    if(!d.success){ logDbg('loadMarketData fail '+(d.error||'')); return; }
-    // Данные всегда в d.data
-    const ob=d.data?.orderbook;
-    const ticker=d.data?.ticker;
-    if(ob && ob.asks && ob.bids) { 
-      updateOrderBook(ob); 
-      logDbg(`orderbook updated: ${ob.asks.length} asks, ${ob.bids.length} bids`);
-    } else {
-      logDbg('orderbook missing or empty');
-    }
-    if(ticker){
-      const last=parseFloat(ticker.last||ticker.last_price||ticker.close||ticker.price||0);
-      const priceStr=formatPrice(last);
-      const cp=$('currentPrice'); if(cp) cp.textContent=priceStr;
-      // Цена в заголовке "Рынок и стакан" с точностью 2 знака после запятой
-      const pp=$('currentPairPrice'); 
-      if(pp) pp.textContent='$'+(isNaN(last) ? '0.00' : last.toLocaleString('en-US', {minimumFractionDigits:2, maximumFractionDigits:2}));
+// Последние полученные данные пары: версия и счетчик сделок для условных запросов (since)
+let marketDataState={pair:null,version:null,tradesSeq:null,data:null};
+const MARKET_TRADES_LIMIT=50;
+// Слить ответ /api/pair/data с сохраненными данными; возвращает только изменившиеся разделы
+function applyMarketDataResponse(d, pair){
+  const st=marketDataState;
+  if(d.delta && st.pair===pair && st.data){
+    const delta=d.data||{};
+    if(delta.ticker) st.data.ticker=delta.ticker;
+    if(delta.orderbook) st.data.orderbook=delta.orderbook;
+    if(delta.trades) st.data.trades=delta.trades;
+    if(delta.trades_new) st.data.trades=delta.trades_new.concat(st.data.trades||[]).slice(0,MARKET_TRADES_LIMIT);
+    if(delta.trades_seq!=null) st.tradesSeq=delta.trades_seq;
+  }else{
+    const data=d.data||{};
+    marketDataState={pair, version:null, tradesSeq:data.trades_seq??null, data};
+  }
+  marketDataState.version=(d.version==null)?null:d.version;
+  return d.data||{};
+}
+// Поток рыночных данных (SSE): пока он открыт, опрос /api/pair/data не выполняется
+let marketStream=null, marketStreamPair=null, marketStreamLive=false;
+function openMarketStream(){
+  if(typeof EventSource==='undefined' || !currentBaseCurrency) return;
+  const pair=`${currentBaseCurrency}_${currentQuoteCurrency}`;
+  if(marketStream && marketStreamPair===pair) return;
+  if(marketStream) marketStream.close();
+  marketStreamPair=pair; marketStreamLive=false;
+  const es=new EventSource(`/api/stream/market?pairs=${pair}`);
+  es.addEventListener('market', ev=>{
+    let d; try{ d=JSON.parse(ev.data); }catch(e){ return; }
+    if(d.pair!==`${currentBaseCurrency}_${currentQuoteCurrency}`) return;
+    marketStreamLive=true;
+    renderMarketData(d, d.pair);
+  });
+  // Браузер переподключится сам (первым событием придет полный снимок), до этого работает опрос
+  es.onerror=()=>{ marketStreamLive=false; };
+  marketStream=es;
+}
+function isMarketStreamLive(){
+  return marketStreamLive && marketStreamPair===`${currentBaseCurrency}_${currentQuoteCurrency}`;
+}
+// Разделы, зависящие от цены, обновляются по цене из потока, а не по таймерам:
+// эквивалент баланса считается на месте, таблица безубыточности - не чаще BREAKEVEN_STREAM_MIN_MS
+const BREAKEVEN_STREAM_MIN_MS=3000;
+// Остатки счета в поток не входят (приватный REST) - пока поток жив, сверяем их реже
+const BALANCES_STREAM_REFRESH_MS=60000;
+let streamPrice=null, breakEvenLoadedAt=0, breakEvenTimer=null, balancesLoadedAt=0;
+let pairBalanceState=null;
+function onStreamPrice(last){
+  if(!isFinite(last) || last<=0 || last===streamPrice) return;
+  streamPrice=last;
+  renderBaseEquivalent(last);
+  if(breakEvenTimer) return;
+  const wait=Math.max(0, breakEvenLoadedAt+BREAKEVEN_STREAM_MIN_MS-Date.now());
+  breakEvenTimer=setTimeout(()=>{ breakEvenTimer=null; loadBreakEvenTable(); }, wait);
+}
+function renderBaseEquivalent(price){
+  const st=pairBalanceState;
+  if(!st || st.pair!==`${currentBaseCurrency}_${currentQuoteCurrency}`) return;
+  const eq=st.base*price;
+  const baseUsdEl=document.getElementById('baseBalanceUSD');
+  const inlineEl=document.getElementById('quoteBalanceInline');
+  if(baseUsdEl) baseUsdEl.textContent=`≈ $${eq.toFixed(2)}`;
+  if(inlineEl) inlineEl.textContent=`Баланс: ${st.base.toFixed(8)} ${currentBaseCurrency} ≈ $${eq.toFixed(2)}`;
+}
+// Отрисовать ответ /api/pair/data или событие потока (полный снимок или дельта)
+function renderMarketData(d, pair){
+  if(d.unchanged) return;
+  // Полный ответ или дельта - рисуем только пришедшие разделы
+  const changed=applyMarketDataResponse(d, pair);
+  const ob=changed.orderbook;
+  const ticker=changed.ticker;
+  if(ob && ob.asks && ob.bids) { 
+    updateOrderBook(ob); 
+    logDbg(`orderbook updated: ${ob.asks.length} asks, ${ob.bids.length} bids`);
+  } else if(!d.delta) {
+    logDbg('orderbook missing or empty');
+  }
+  if(ticker){
+    const last=parseFloat(ticker.last||ticker.last_price||ticker.close||ticker.price||0);
+    const priceStr=formatPrice(last);
+    const cp=$('currentPrice'); if(cp) cp.textContent=priceStr;
+    // Цена в заголовке "Рынок и стакан" с точностью 2 знака после запятой
+    const pp=$('currentPairPrice'); 
+    if(pp) pp.textContent='$'+(isNaN(last) ? '0.00' : last.toLocaleString('en-US', {minimumFractionDigits:2, maximumFractionDigits:2}));
+    // Спред по тикеру - только пока нет стакана с посчитанным сервером spread_bps
+    const book=marketDataState.data&&marketDataState.data.orderbook;
+    if(!(book&&book.mid>0)){
       const sell=parseFloat(ticker.lowest_ask||ticker.ask||0);
       const bid=parseFloat(ticker.highest_bid||ticker.bid||0);
       const spread=(isFinite(sell)&&isFinite(bid)&&sell>0)?((sell-bid)/sell*100):null;
       const sv=$('spreadValue'); if(sv) sv.textContent=spread==null?'-':spread.toFixed(3)+'%';
-      updateTradeIndicators({price:last});
     }
+    updateTradeIndicators({price:last});
+    if(isMarketStreamLive()) onStreamPrice(last);
+  }
+}
+async function loadMarketData(forceRefresh=false){
+  try{
+    const pair=`${currentBaseCurrency}_${currentQuoteCurrency}`;
+    openMarketStream();
+    // Данные текущей пары приходят потоком - опрос не нужен
+    if(!forceRefresh && marketStreamLive && marketStreamPair===pair) return;
+    const forceParam = forceRefresh ? '&force=1' : '';
+    const st=marketDataState;
+    let sinceParam='';
+    if(!forceRefresh && st.pair===pair && st.version!=null){
+      sinceParam=`&since=${st.version}`+(st.tradesSeq!=null?`&trades_seq=${st.tradesSeq}`:'');
+    }
+    const r=await fetch(`/api/pair/data?base_currency=${currentBaseCurrency}&quote_currency=${currentQuoteCurrency}${forceParam}${sinceParam}`);
+    const d=await r.json();
+    if(!d.success){ logDbg('loadMarketData fail '+(d.error||'')); return; }
+    // Пара сменилась, пока шел запрос - ответ устарел
+    if(pair!==`${currentBaseCurrency}_${currentQuoteCurrency}`) return;
+    renderMarketData(d, pair);
     loadPerBaseIndicators();
   }catch(e){ logDbg('loadMarketData exc '+e) }
 }
@@ -335,6 +423,18 @@ function updateHeaderQuoteBalance(balance){
   }
 }
 
+// Накопленные объемы от лучшей цены - только для стакана REST fallback (без серверной аналитики)
+function cumulativeSizes(levels){
+  let sum=0;
+  return levels.map(r=>sum+=r[1]);
+}
+function orderBookRow(r, cum){
+  const p=r[0], a=r[1], t=p*a;
+  const div=document.createElement('div');
+  div.className='orderbook-row';
+  div.innerHTML=`<div class='price'>${formatPrice(p)}</div><div class='amount'>${a.toFixed(6)}</div><div class='total'>${t.toFixed(6)}</div><div class='cumulative'>${(cum||0).toFixed(4)}</div>`;
+  return div;
+}
 function updateOrderBook(ob){
   try{
     if(!ob||!Array.isArray(ob.asks)||!Array.isArray(ob.bids)) return;
@@ -343,55 +443,30 @@ function updateOrderBook(ob){
     if(asksEl) asksEl.innerHTML='';
     if(bidsEl) bidsEl.innerHTML='';
 
-    // Нормализуем и фильтруем данные
-    const asksAll = ob.asks.map(r=>[parseFloat(r[0]), parseFloat(r[1])]).filter(r=>isFinite(r[0])&&isFinite(r[1]));
-    const bidsAll = ob.bids.map(r=>[parseFloat(r[0]), parseFloat(r[1])]).filter(r=>isFinite(r[0])&&isFinite(r[1]));
-    if(!asksAll.length && !bidsAll.length) return;
-
-    // Центральная цена (mid) = среднее между лучшим бидом и лучшим аском
-    const bestAsk = asksAll.length ? Math.min.apply(null, asksAll.map(r=>r[0])) : NaN;
-    const bestBid = bidsAll.length ? Math.max.apply(null, bidsAll.map(r=>r[0])) : NaN;
-    let mid = NaN;
-    if(isFinite(bestAsk) && isFinite(bestBid)) mid = (bestAsk + bestBid)/2;
-    else if(isFinite(bestAsk)) mid = bestAsk; else if(isFinite(bestBid)) mid = bestBid;
+    // Уровни приходят от лучшей цены, накопленные объемы и спред посчитаны сервером
+    // при обновлении стакана (ask_cum_sizes, bid_cum_sizes, spread_bps, imbalance)
+    const asks = ob.asks.map(r=>[parseFloat(r[0]), parseFloat(r[1])]);
+    const bids = ob.bids.map(r=>[parseFloat(r[0]), parseFloat(r[1])]);
+    if(!asks.length && !bids.length) return;
+    const asksCum = Array.isArray(ob.ask_cum_sizes) ? ob.ask_cum_sizes : cumulativeSizes(asks);
+    const bidsCum = Array.isArray(ob.bid_cum_sizes) ? ob.bid_cum_sizes : cumulativeSizes(bids);
 
-    // Сортируем по близости к центральной цене (минимальная разница первее)
-    const asksSorted = isFinite(mid)
-      ? asksAll.slice().sort((a,b)=>Math.abs(a[0]-mid)-Math.abs(b[0]-mid))
-      : asksAll.slice().sort((a,b)=>a[0]-b[0]);
-    const bidsSorted = isFinite(mid)
-      ? bidsAll.slice().sort((a,b)=>Math.abs(a[0]-mid)-Math.abs(b[0]-mid))
-      : bidsAll.slice().sort((a,b)=>b[0]-a[0]);
-
-    // Кумулятивы: для асков снизу вверх, для бидов сверху вниз
-    // Asks: разворачиваем массив, чтобы лучшие цены (ближе к спреду) были ВНИЗУ списка
-    // (так они окажутся ближе к центральной линии спреда)
-    const asksReversed = asksSorted.slice().reverse();
-    const asksCum = [];
-    let cumA = 0;
-    for(let i = asksReversed.length - 1; i >= 0; i--) {
-      cumA += asksReversed[i][1];
-      asksCum[i] = cumA;
+    // Asks: лучшие цены ВНИЗУ списка (ближе к центральной линии спреда)
+    for(let i = asks.length - 1; i >= 0; i--) {
+      if(asksEl) asksEl.appendChild(orderBookRow(asks[i], asksCum[i]));
     }
-    asksReversed.forEach((r, idx) => {
-      const p=r[0], a=r[1], t=p*a;
-      const div=document.createElement('div');
-      div.className='orderbook-row';
-      div.innerHTML=`<div class='price'>${formatPrice(p)}</div><div class='amount'>${a.toFixed(6)}</div><div class='total'>${t.toFixed(6)}</div><div class='cumulative'>${(asksCum[idx]||0).toFixed(4)}</div>`;
-      if(asksEl) asksEl.appendChild(div);
+    bids.forEach((r, i) => {
+      if(bidsEl) bidsEl.appendChild(orderBookRow(r, bidsCum[i]));
     });
 
-    let cumB=0;
-    bidsSorted.forEach(r=>{
-      const p=r[0], a=r[1], t=p*a; cumB+=a;
-      const div=document.createElement('div');
-      div.className='orderbook-row';
-      div.innerHTML=`<div class='price'>${formatPrice(p)}</div><div class='amount'>${a.toFixed(6)}</div><div class='total'>${t.toFixed(6)}</div><div class='cumulative'>${cumB.toFixed(4)}</div>`;
-      if(bidsEl) bidsEl.appendChild(div);
-    });
+    if(ob.mid>0){
+      const sv=$('spreadValue'); if(sv) sv.textContent=(ob.spread_bps/100).toFixed(3)+'%';
+      const iv=$('obImbalance');
+      if(iv){ iv.textContent=(ob.imbalance*100).toFixed(1)+'%'; iv.title=`Микроцена: ${formatPrice(ob.microprice)}`; }
+    }
     
     // Прокрутка к лучшим ценам:
-    // Для asks: лучшие цены теперь ВНИЗУ списка (после reverse), прокручиваем вниз так, чтобы они были видны
+    // Для asks: лучшие цены ВНИЗУ списка, прокручиваем вниз так, чтобы они были видны
     // Для bids: лучшие цены ВВЕРХУ списка, оставляем прокрутку в начале
     if(asksEl && asksEl.scrollHeight > asksEl.clientHeight){
       // Прокручиваем так, чтобы последние ~10 строк (лучшие цены) были видны
@@ -423,7 +498,9 @@ async function loadPairBalances(){
       let quoteAvail = parseFloat(d.balances?.quote?.available||'0');
       const baseEq=d.base_equivalent||0;
       // Если данных нет (source=empty) — показываем прочерки
+      balancesLoadedAt=Date.now();
       if(source==='empty'){
+        pairBalanceState=null;
         if(baseBalEl) baseBalEl.textContent = '-'; else {}
         if(baseUsdEl) baseUsdEl.textContent = '≈ $-';
         if(quoteBalEl) quoteBalEl.textContent = '-';
@@ -438,6 +515,7 @@ async function loadPairBalances(){
       if(quoteSymEl) quoteSymEl.textContent=currentQuoteCurrency;
       if(inlineEl) inlineEl.textContent=`Баланс: ${(isFinite(baseAvail)?baseAvail:0).toFixed(8)} ${currentBaseCurrency} ≈ $${(isFinite(baseEq)?baseEq:0).toFixed(2)}`;
       updateHeaderQuoteBalance(quoteAvail);
+      pairBalanceState={pair:`${currentBaseCurrency}_${currentQuoteCurrency}`, base:isFinite(baseAvail)?baseAvail:0};
     }
   }catch(e){ logDbg('loadPairBalances err '+e) }
 }
@@ -506,6 +584,7 @@ function renderBreakEvenTable(tableData){
 async function loadBreakEvenTable(){
   console.log('[BREAKEVEN] === НАЧАЛО ЗАГРУЗКИ ТАБЛИЦЫ ===');
   console.log('[BREAKEVEN] currentBaseCurrency =', currentBaseCurrency);
+  breakEvenLoadedAt=Date.now();
   
   try{
     // Проверяем, что базовая валюта установлена
@@ -1008,9 +1087,12 @@ async function initApp(){
     
     console.log('[INIT] Инициализация завершена, запуск интервалов');
     setInterval(loadMarketData,5000);
-    setInterval(loadPairBalances,15000);
-    setInterval(loadBreakEvenTable,6000);
-    setInterval(loadPerBaseIndicators,7000);
+    // Пока поток жив, таймеры - только страховка: цена и индикаторы приходят событиями
+    setInterval(()=>{
+      if(!isMarketStreamLive() || Date.now()-balancesLoadedAt>=BALANCES_STREAM_REFRESH_MS) loadPairBalances();
+    },15000);
+    setInterval(()=>{ if(!isMarketStreamLive()) loadBreakEvenTable(); },6000);
+    setInterval(()=>{ if(!isMarketStreamLive()) loadPerBaseIndicators(); },7000);
     setInterval(loadTradingPermissions,20000);
   }catch(e){
     console.error('[INIT] Ошибка инициализации:', e);
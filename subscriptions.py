@@ -0,0 +1,425 @@
+"""
+Subscriptions Module
+Реестр подписок на пары со счетчиками ссылок по потребителям, уровнями подписки
+и отложенной отпиской
+"""
+
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from data_limits import DataLimits
+from scheduler import TimerHandle, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Уровни подписки пары по возрастанию объема данных
+TIER_TICKER = 'ticker'  # только тикер (цена, объем за сутки)
+TIER_TOP = 'top'        # тикер + лучшие цены стакана (spot.book_ticker)
+TIER_FULL = 'full'      # тикер + стакан + сделки
+TIERS = (TIER_TICKER, TIER_TOP, TIER_FULL)
+
+
+def tier_rank(tier: str) -> int:
+    """Порядковый номер уровня (ValueError для неизвестного)"""
+    try:
+        return TIERS.index(tier)
+    except ValueError:
+        raise ValueError(f"Неизвестный уровень подписки: {tier} (доступны: {', '.join(TIERS)})")
+
+
+class _Subscription:
+    """Учет одной пары: удержания и аренды потребителей, уровень, ожидающая отписка"""
+
+    __slots__ = ('refs', 'tiers', 'leases', 'tier', 'idle_since', 'timer')
+
+    def __init__(self):
+        self.refs: Dict[str, int] = {}
+        # Уровень удержания по потребителям (номер в TIERS)
+        self.tiers: Dict[str, int] = {}
+        # Аренды: {потребитель: (окончание monotonic, номер уровня)}
+        self.leases: Dict[str, Tuple[float, int]] = {}
+        self.tier: Optional[int] = None
+        self.idle_since: Optional[float] = None
+        self.timer: Optional[TimerHandle] = None
+
+    def keep_until(self, grace: float) -> float:
+        """Момент (monotonic), до которого пару нужно держать без удержаний"""
+        idle_until = self.idle_since + grace if self.idle_since is not None else 0.0
+        return max([idle_until, *(expires for expires, _ in self.leases.values())])
+
+    def wanted_tier(self, now: float) -> Optional[int]:
+        """Наибольший уровень среди удержаний и действующих аренд (None - никому не нужна)"""
+        ranks = list(self.tiers.values())
+        ranks.extend(rank for expires, rank in self.leases.values() if expires > now)
+        return max(ranks) if ranks else None
+
+
+class SubscriptionRegistry:
+    """
+    Общий реестр подписок всех потребителей (UI, watchlist, SSE, автотрейдер)
+
+    Потребитель либо удерживает пару (acquire/release, счетчик ссылок на потребителя),
+    либо арендует ее на срок (lease) - для клиентов, которые не сообщают об уходе
+    (опрос /api/pair/data). Пара открывается при первом интересе, а закрывается
+    только через grace секунд после ухода последнего потребителя и окончания аренд:
+    переключение пар в UI и переподписки не вызывают цепочек отписка/подписка.
+
+    Каждый потребитель указывает нужный уровень (TIERS); пара подписана на наибольший
+    из них. Уровень повышается сразу, а понижается, когда уходит потребитель более
+    высокого уровня (release или окончание аренды).
+
+    Срок пары отслеживает таймер общего планировщика: он только отмечает пару, а
+    пересмотр и отписка (закрытие сокета может ждать секунды) выполняются в потоке
+    реестра, не задерживая heartbeat и переподключения. Набор нужных пар публикуется
+    неизменяемым frozenset, поэтому needed() читается без блокировки (в том числе
+    из очистки кэша менеджера под его собственной блокировкой).
+
+    Решения (уровень пары, отписка) принимаются под блокировкой реестра, а вызовы
+    open_pairs/close_pair выполняются после ее снятия: менеджер берет свою блокировку
+    внутри них, а status() менеджера читает snapshot() реестра - порядок блокировок
+    не может замкнуться. Вызовы делает один поток за раз (_reconcile), по текущему
+    состоянию пар, поэтому отписка и повторная подписка той же пары не перемешиваются.
+    Уровень пары считается примененным только после успешного open_pairs; после ошибки
+    подписка повторяется через OPEN_RETRY_DELAY секунд.
+    """
+
+    # Повтор неудавшейся подписки через столько секунд
+    OPEN_RETRY_DELAY = 5.0
+    # Отметка _applied пары, подписка которой завершилась ошибкой
+    _OPEN_FAILED = -1
+
+    def __init__(self, open_pairs: Callable[[List[str], str], Any], close_pair: Callable[[str], Any],
+                 grace: Optional[float] = None):
+        """
+        Args:
+            open_pairs: Подписать пары на уровень (новые пары подписывает, у подписанных меняет уровень)
+            close_pair: Отписать пару
+            grace: Задержка отписки в секундах (по умолчанию DataLimits.WS_SUBSCRIPTION_GRACE_SECONDS)
+        """
+        self.open_pairs = open_pairs
+        self.close_pair = close_pair
+        self.grace = DataLimits.WS_SUBSCRIPTION_GRACE_SECONDS if grace is None else grace
+        self._entries: Dict[str, _Subscription] = {}
+        self._needed: FrozenSet[str] = frozenset()
+        # Блокировка только состояния реестра - open_pairs/close_pair вызываются вне ее
+        self._lock = threading.RLock()
+        # Пары, ждущие вызова open_pairs/close_pair: {пара: передать open_pairs без смены уровня}
+        self._dirty: Dict[str, bool] = {}
+        # Уровень, с которым пара последний раз передана open_pairs (пара открыта реестром)
+        self._applied: Dict[str, int] = {}
+        self._reconciling = False
+        # Пары с истекшим сроком, отмеченные таймером, и поток их пересмотра
+        self._due: set = set()
+        self._due_event = threading.Event()
+        self._review_thread: Optional[threading.Thread] = None
+        self.opened = 0
+        self.closed = 0
+        self.revived = 0
+        self.tier_changes = 0
+
+    @staticmethod
+    def _normalize(pairs: Iterable[str]) -> List[str]:
+        if isinstance(pairs, str):
+            pairs = [pairs]
+        return list(dict.fromkeys(str(pair).upper() for pair in pairs if pair))
+
+    def _entry(self, pair: str) -> _Subscription:
+        """Запись пары (вызывать под блокировкой); снимает ожидающую отписку"""
+        entry = self._entries.get(pair)
+        if entry is None:
+            entry = self._entries[pair] = _Subscription()
+            self._needed = self._needed | {pair}
+            self.opened += 1
+        elif entry.timer is not None and entry.idle_since is not None:
+            self.revived += 1
+        entry.idle_since = None
+        return entry
+
+    def _apply(self, pairs: List[str], force: bool = False):
+        """
+        Пересчитать нужный уровень пар и отметить их для _reconcile (вызывать под блокировкой)
+
+        Args:
+            pairs: Пары реестра
+            force: Передать пары open_pairs, даже если уровень не менялся
+                   (менеджер досоздаст соединения, закрытые в обход реестра)
+        """
+        now = time.monotonic()
+        for pair in pairs:
+            entry = self._entries.get(pair)
+            if entry is None:
+                continue
+            rank = entry.wanted_tier(now)
+            if rank is None:
+                # Никому не нужна - уровень сохраняется до отписки
+                continue
+            if rank != entry.tier:
+                if entry.tier is not None:
+                    self.tier_changes += 1
+                    logger.info(f"Уровень подписки {pair}: {TIERS[entry.tier]} -> {TIERS[rank]}")
+                entry.tier = rank
+            elif not force:
+                continue
+            self._dirty[pair] = force or self._dirty.get(pair, False)
+
+    def _reconcile(self):
+        """
+        Привести подписки менеджера к решениям реестра (вызывать без блокировки реестра)
+
+        Если вызовы уже выполняет другой поток, он же обработает и новые отметки.
+        Каждая пара берется в текущем состоянии, поэтому устаревшие решения не применяются.
+        """
+        with self._lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+        try:
+            while True:
+                groups: Dict[int, List[str]] = {}
+                closing: List[str] = []
+                with self._lock:
+                    if not self._dirty:
+                        self._reconciling = False
+                        return
+                    dirty, self._dirty = self._dirty, {}
+                    for pair, force in dirty.items():
+                        entry = self._entries.get(pair)
+                        if entry is None:
+                            if self._applied.pop(pair, None) is not None:
+                                closing.append(pair)
+                        elif entry.tier is not None and (force or self._applied.get(pair) != entry.tier):
+                            groups.setdefault(entry.tier, []).append(pair)
+                failed: List[str] = []
+                for rank, group in groups.items():
+                    try:
+                        self.open_pairs(group, TIERS[rank])
+                    except Exception as e:
+                        logger.error(f"Ошибка подписки на {', '.join(group)}: {e}")
+                        failed.extend(group)
+                        continue
+                    # Уровень пары считается примененным только после успешной подписки
+                    with self._lock:
+                        for pair in group:
+                            self._applied[pair] = rank
+                if failed:
+                    with self._lock:
+                        for pair in failed:
+                            # Состояние неизвестно (подписка могла пройти частично): пара
+                            # закроется при уходе потребителей, а до тех пор - повтор
+                            self._applied[pair] = self._OPEN_FAILED
+                    get_scheduler().call_later(self.OPEN_RETRY_DELAY, self._mark_retry, failed,
+                                               name="subscription-retry")
+                for pair in closing:
+                    try:
+                        self.close_pair(pair)
+                    except Exception as e:
+                        logger.error(f"Ошибка отписки от {pair}: {e}")
+                    else:
+                        logger.info(f"Отписка от {pair}: потребителей не осталось {self.grace:g} с")
+        except BaseException:
+            with self._lock:
+                self._reconciling = False
+            raise
+
+    def acquire(self, consumer: str, pairs: Iterable[str], tier: str = TIER_FULL) -> List[str]:
+        """
+        Удерживать пары от имени потребителя (+1 ссылка на каждую)
+
+        Args:
+            consumer: Имя потребителя
+            pairs: Торговые пары
+            tier: Нужный потребителю уровень (повторное удержание может его повысить)
+
+        Returns:
+            Нормализованный список пар
+        """
+        rank = tier_rank(tier)
+        pairs = self._normalize(pairs)
+        if not pairs:
+            return pairs
+        with self._lock:
+            for pair in pairs:
+                entry = self._entry(pair)
+                entry.refs[consumer] = entry.refs.get(consumer, 0) + 1
+                entry.tiers[consumer] = max(rank, entry.tiers.get(consumer, 0))
+            self._apply(pairs, force=True)
+        self._reconcile()
+        return pairs
+
+    def release(self, consumer: str, pairs: Iterable[str], all_refs: bool = False):
+        """
+        Снять удержание потребителя (-1 ссылка или все его ссылки и аренда при all_refs)
+
+        Пара без удержаний отписывается через grace секунд, если ее не удержат снова;
+        если пара нужна другим потребителям, ее уровень понижается до их уровня.
+        """
+        changed = []
+        with self._lock:
+            for pair in self._normalize(pairs):
+                entry = self._entries.get(pair)
+                if entry is None:
+                    continue
+                if all_refs and entry.leases.pop(consumer, None) is not None:
+                    changed.append(pair)
+                if consumer not in entry.refs:
+                    continue
+                count = 0 if all_refs else entry.refs[consumer] - 1
+                if count > 0:
+                    entry.refs[consumer] = count
+                    continue
+                del entry.refs[consumer]
+                del entry.tiers[consumer]
+                changed.append(pair)
+                if not entry.refs:
+                    entry.idle_since = time.monotonic()
+                    self._schedule_review(pair, entry)
+            self._apply(changed)
+        self._reconcile()
+
+    def release_consumer(self, consumer: str):
+        """Снять все удержания и аренды потребителя (например, при закрытии SSE потока)"""
+        with self._lock:
+            pairs = [pair for pair, entry in self._entries.items()
+                     if consumer in entry.refs or consumer in entry.leases]
+        self.release(consumer, pairs, all_refs=True)
+
+    def lease(self, consumer: str, pairs: Iterable[str], ttl: Optional[float] = None,
+              tier: str = TIER_FULL) -> List[str]:
+        """
+        Арендовать пары на ttl секунд (по умолчанию grace); повтор продлевает аренду
+
+        Продление - запись срока в словарь, без перепланирования таймера: таймер
+        при срабатывании сам перепланируется на новый срок.
+        """
+        rank = tier_rank(tier)
+        pairs = self._normalize(pairs)
+        if not pairs:
+            return pairs
+        now = time.monotonic()
+        expires = now + (self.grace if ttl is None else ttl)
+        with self._lock:
+            for pair in pairs:
+                entry = self._entries.get(pair)
+                if entry is None:
+                    entry = self._entry(pair)
+                    entry.idle_since = now
+                previous = entry.leases.get(consumer)
+                entry.leases[consumer] = (max(expires, previous[0]) if previous else expires,
+                                          max(rank, previous[1]) if previous else rank)
+                if entry.timer is None:
+                    self._schedule_review(pair, entry)
+            self._apply(pairs, force=True)
+        self._reconcile()
+        return pairs
+
+    def _schedule_review(self, pair: str, entry: _Subscription):
+        """Запланировать пересмотр пары: окончание аренд и grace (вызывать под блокировкой)"""
+        if entry.timer is not None:
+            entry.timer.cancel()
+            entry.timer = None
+        times = [expires for expires, _ in entry.leases.values()]
+        if not entry.refs:
+            times.append(entry.keep_until(self.grace))
+        if times:
+            entry.timer = get_scheduler().call_later(min(times) - time.monotonic(), self._mark_due, pair,
+                                                     name=f"subscription-{pair}")
+
+    def _mark_due(self, pair: str):
+        """Таймер пары (поток планировщика): только отметить пару для пересмотра"""
+        with self._lock:
+            self._due.add(pair)
+            self._start_review_thread()
+        self._due_event.set()
+
+    def _mark_retry(self, pairs: List[str]):
+        """Таймер повтора (поток планировщика): вернуть пары в _dirty, подписку повторит поток пересмотра"""
+        with self._lock:
+            for pair in pairs:
+                if pair in self._entries:
+                    self._dirty.setdefault(pair, False)
+            self._start_review_thread()
+        self._due_event.set()
+
+    def _start_review_thread(self):
+        """Запустить поток пересмотра, если он еще не работает (вызывать под блокировкой)"""
+        if self._review_thread is None or not self._review_thread.is_alive():
+            self._review_thread = threading.Thread(target=self._review_loop, name="subscription-review",
+                                                   daemon=True)
+            self._review_thread.start()
+
+    def _review_loop(self):
+        """Поток пересмотра: истекшие аренды, понижение уровня и отписка вне планировщика"""
+        while True:
+            self._due_event.wait()
+            self._due_event.clear()
+            with self._lock:
+                due, self._due = self._due, set()
+            for pair in sorted(due):
+                try:
+                    self._review(pair)
+                except Exception as e:
+                    logger.error(f"Ошибка пересмотра подписки {pair}: {e}")
+            # Повторы неудавшихся подписок (без пар с истекшим сроком)
+            self._reconcile()
+
+    def _review(self, pair: str):
+        """Пересмотр пары: снять истекшие аренды, понизить уровень или закрыть никому не нужную пару"""
+        with self._lock:
+            entry = self._entries.get(pair)
+            if entry is None:
+                return
+            entry.timer = None
+            now = time.monotonic()
+            entry.leases = {consumer: lease for consumer, lease in entry.leases.items() if lease[0] > now}
+            if entry.refs or entry.keep_until(self.grace) > now:
+                self._apply([pair])
+                self._schedule_review(pair, entry)
+            else:
+                del self._entries[pair]
+                self._needed = self._needed - {pair}
+                self.closed += 1
+                self._dirty[pair] = False
+        self._reconcile()
+
+    def needed(self, pair: str) -> bool:
+        """Пара удерживается или ожидает отписки реестром (без блокировки)"""
+        return pair in self._needed
+
+    def pairs(self, consumer: Optional[str] = None) -> List[str]:
+        """Пары реестра (consumer - только удерживаемые этим потребителем)"""
+        with self._lock:
+            return sorted(pair for pair, entry in self._entries.items()
+                          if consumer is None or consumer in entry.refs)
+
+    def tier(self, pair: str) -> Optional[str]:
+        """Текущий уровень подписки пары (None - пары нет в реестре)"""
+        entry = self._entries.get(pair.upper())
+        return TIERS[entry.tier] if entry is not None and entry.tier is not None else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние реестра для эндпоинта: ссылки, уровни и аренды по парам, ожидающие отписки"""
+        now = time.monotonic()
+        with self._lock:
+            pairs = {}
+            for pair, entry in sorted(self._entries.items()):
+                leases = {consumer: {'expires_in': round(expires - now, 1), 'tier': TIERS[rank]}
+                          for consumer, (expires, rank) in entry.leases.items() if expires > now}
+                pairs[pair] = {
+                    'tier': TIERS[entry.tier] if entry.tier is not None else None,
+                    'refs': dict(entry.refs),
+                    'tiers': {consumer: TIERS[rank] for consumer, rank in entry.tiers.items()},
+                    'total': sum(entry.refs.values()),
+                    'leases': leases,
+                    'teardown_in': (round(max(0.0, entry.keep_until(self.grace) - now), 1)
+                                    if not entry.refs else None)
+                }
+            return {
+                'grace_seconds': self.grace,
+                'pairs': pairs,
+                'opened': self.opened,
+                'closed': self.closed,
+                'revived': self.revived,
+                'tier_changes': self.tier_changes
+            }
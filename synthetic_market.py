@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Синтетический рынок многих пар для бенчмарков и проверки поведения без сети
+
+Цена пары - геометрическое броуновское движение, события (сделки, диффы стакана,
+тикеры) приходят пуассоновскими потоками, стакан - непрерывные уровни вокруг цены,
+каждый дифф согласован с предыдущим. При одинаковом seed поток событий одинаков.
+
+Генератор работает в модельном времени и не ждет: события выдаются так быстро, как
+их забирают. Замер на 1000 пар (CPython 3.11, без numpy): сырые события (events)
+150-210 тыс./с, result в формате Gate.io (frames) около 70 тыс./с, готовые JSON кадры
+(messages, собираются по шаблонам пары без json.dumps) 65-80 тыс./с. Сотни тысяч кадров
+в секунду на чистом Python недостижимы: потолок задает сама генерация событий (ГБД и
+в среднем 6 уровней на дифф), а подстановка чисел в %-шаблоны и кэш строк цен уровней
+на замере медленнее f-строк. Цель сознательно снижена до частоты выше потребителя:
+менеджер пар принимает 15-20 тыс. событий в секунду, поэтому узким местом остается он.
+
+Использование:
+    python synthetic_market.py                                  # 1000 пар, 500000 событий
+    python synthetic_market.py --pairs 5000 --events 1000000 --seed 1
+"""
+
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Секунд в году (крипторынок работает круглосуточно) - для годовой волатильности
+SECONDS_PER_YEAR = 365 * 86400
+
+# Пара в JSON кадре (как GateIOWebSocket._PAIR_PATTERN)
+_PAIR_PATTERN = re.compile(r'"(?:currency_pair|s)"\s*:\s*"([^"]+)"')
+
+# Виды событий
+TRADE, BOOK, TICKER = 0, 1, 2
+
+_log, _exp, _sqrt = math.log, math.exp, math.sqrt
+
+
+def synthetic_pairs(count: int, quote: str = 'USDT') -> List[str]:
+    """Имена синтетических пар для нагрузки: SYN0000_USDT, SYN0001_USDT, ..."""
+    return [f"SYN{index:04d}_{quote}" for index in range(count)]
+
+
+class SyntheticPair:
+    """
+    Рынок одной пары: цена, стакан по индексам шага цены, суточная статистика
+
+    Стакан - depth соседних шагов цены с каждой стороны без пропусков: при сдвиге
+    цены меняются только уровни на краях, а лучшие цены известны без поиска
+    (лучший бид - индекс best, лучший аск - best + 1).
+    """
+
+    __slots__ = ('pair', 'price', 'tick', 'decimals', 'time', 'open', 'high', 'low', 'last',
+                 'base_volume', 'quote_volume', 'bids', 'asks', 'best', 'update_id', 'trade_id',
+                 'price_format', 'level_format', 'pair_json')
+
+    def __init__(self, pair: str, price: float, at: float = 0.0):
+        self.pair = pair
+        self.price = price
+        # Шаг цены - 5 значащих цифр
+        self.decimals = max(0, 4 - int(math.floor(math.log10(price))))
+        self.tick = 10.0 ** -self.decimals
+        # Шаблоны формата пары: цена, уровень стакана в JSON, имя пары в JSON
+        self.price_format = f"%.{self.decimals}f"
+        self.level_format = f'["%.{self.decimals}f","%.4f"]'
+        self.pair_json = json.dumps(pair)
+        self.time = at
+        self.open = self.high = self.low = self.last = price
+        self.base_volume = self.quote_volume = 0.0
+        # Уровни стакана: {индекс цены (цена / tick): объем}
+        self.bids: Dict[int, float] = {}
+        self.asks: Dict[int, float] = {}
+        self.best: Optional[int] = None
+        self.update_id = 0
+        self.trade_id = 0
+
+    def fmt(self, index: int) -> str:
+        return self.price_format % (index * self.tick)
+
+    def move(self, at: float, drift: float, sigma: float, gauss: Callable[[float, float], float]):
+        """
+        Точный шаг ГБД до момента at
+
+        Args:
+            at: Модельное время (сек)
+            drift, sigma: Снос и волатильность в долях за секунду
+            gauss: Нормальный генератор (random.Random.gauss)
+        """
+        dt = at - self.time
+        if dt > 0:
+            self.price *= math.exp((drift - 0.5 * sigma * sigma) * dt + sigma * math.sqrt(dt) * gauss(0.0, 1.0))
+            self.time = at
+
+    def book_update(self, rng: random.Random, depth: int) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """
+        Сдвинуть стакан за ценой и изменить объем случайного уровня каждой стороны
+
+        Первый вызов (и скачок цены больше глубины) строит весь стакан заново.
+
+        Returns:
+            Изменения (bids, asks): {индекс: новый объем, 0 - уровень удален}
+        """
+        rnd = rng.random
+        bids, asks = self.bids, self.asks
+        bid_changes: Dict[int, float] = {}
+        ask_changes: Dict[int, float] = {}
+        best = math.ceil(self.price / self.tick) - 1
+        old = self.best
+        # Объем уровня - экспоненциальный со средним 10, не меньше 0.0001 (иначе "0" удалит уровень)
+        if best != old:
+            if old is None or abs(best - old) >= depth:
+                for index in bids:
+                    bid_changes[index] = 0.0
+                for index in asks:
+                    ask_changes[index] = 0.0
+                bids.clear()
+                asks.clear()
+                for index in range(best - depth + 1, best + 1):
+                    bids[index] = bid_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+                for index in range(best + 1, best + depth + 1):
+                    asks[index] = ask_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+            elif best > old:
+                # Цена выросла: аски (old, best] становятся бидами, края сдвигаются вверх
+                for index in range(old + 1, best + 1):
+                    del asks[index]
+                    ask_changes[index] = 0.0
+                    bids[index] = bid_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+                for index in range(old - depth + 1, best - depth + 1):
+                    del bids[index]
+                    bid_changes[index] = 0.0
+                for index in range(old + depth + 1, best + depth + 1):
+                    asks[index] = ask_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+            else:
+                # Цена упала: биды (best, old] становятся асками, края сдвигаются вниз
+                for index in range(best + 1, old + 1):
+                    del bids[index]
+                    bid_changes[index] = 0.0
+                    asks[index] = ask_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+                for index in range(best + depth + 1, old + depth + 1):
+                    del asks[index]
+                    ask_changes[index] = 0.0
+                for index in range(best - depth + 1, old - depth + 1):
+                    bids[index] = bid_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+            self.best = best
+        index = best - int(rnd() * depth)
+        bids[index] = bid_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+        index = best + 1 + int(rnd() * depth)
+        asks[index] = ask_changes[index] = 0.0001 - 10.0 * _log(1.0 - rnd())
+        self.update_id += 1
+        return bid_changes, ask_changes
+
+    def trade(self, rng: random.Random, depth: int) -> Tuple[str, float, float]:
+        """Сделка по лучшей цене случайной стороны; Returns: (side, price, amount)"""
+        if self.best is None:
+            self.book_update(rng, depth)
+        side = 'buy' if rng.random() < 0.5 else 'sell'
+        price = (self.best + 1 if side == 'buy' else self.best) * self.tick
+        amount = 0.0001 - _log(1.0 - rng.random())
+        self.trade_id += 1
+        self.last = price
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.base_volume += amount
+        self.quote_volume += amount * price
+        return side, price, amount
+
+    # ------------------------------------------------------------------
+    # Результаты в формате Gate.io v4
+    # ------------------------------------------------------------------
+
+    def ticker_result(self) -> Dict[str, Any]:
+        price_format = self.price_format
+        best = self.best
+        return {
+            "currency_pair": self.pair,
+            "last": price_format % self.last,
+            "lowest_ask": price_format % ((best + 1) * self.tick if best is not None else self.price),
+            "highest_bid": price_format % (best * self.tick if best is not None else self.price),
+            "change_percentage": "%.2f" % ((self.last / self.open - 1) * 100),
+            "base_volume": "%.4f" % self.base_volume,
+            "quote_volume": "%.4f" % self.quote_volume,
+            "high_24h": price_format % self.high,
+            "low_24h": price_format % self.low
+        }
+
+    def trade_result(self, at: float, side: str, price: float, amount: float) -> Dict[str, Any]:
+        return {
+            "id": self.trade_id,
+            "create_time": int(at),
+            "create_time_ms": "%.3f" % (at * 1000),
+            "side": side,
+            "currency_pair": self.pair,
+            "amount": "%.4f" % amount,
+            "price": self.price_format % price,
+            "range": f"{self.trade_id}-{self.trade_id}"
+        }
+
+    def book_update_result(self, at: float, first_id: int, changes: Tuple[Dict[int, float], Dict[int, float]]
+                           ) -> Dict[str, Any]:
+        price_format, tick = self.price_format, self.tick
+        bids, asks = changes
+        return {
+            "t": int(at * 1000), "e": "depthUpdate", "E": int(at), "s": self.pair,
+            "U": first_id, "u": self.update_id,
+            "b": [[price_format % (index * tick), "%.4f" % size] for index, size in bids.items()],
+            "a": [[price_format % (index * tick), "%.4f" % size] for index, size in asks.items()]
+        }
+
+    def book_ticker_result(self, at: float) -> Dict[str, Any]:
+        best = self.best
+        return {
+            "t": int(at * 1000), "u": self.update_id, "s": self.pair,
+            "b": self.fmt(best), "B": "%.4f" % self.bids[best],
+            "a": self.fmt(best + 1), "A": "%.4f" % self.asks[best + 1]
+        }
+
+    # ------------------------------------------------------------------
+    # Готовые JSON кадры (те же поля, что у *_result + json.dumps, без словарей)
+    # ------------------------------------------------------------------
+
+    def ticker_message(self, at: float) -> str:
+        price_format = self.price_format
+        best = self.best
+        ask = (best + 1) * self.tick if best is not None else self.price
+        bid = best * self.tick if best is not None else self.price
+        return (f'{{"time":{int(at)},"time_ms":{int(at * 1000)},"channel":"spot.tickers","event":"update",'
+                f'"result":{{"currency_pair":{self.pair_json},"last":"{price_format % self.last}",'
+                f'"lowest_ask":"{price_format % ask}","highest_bid":"{price_format % bid}",'
+                f'"change_percentage":"{(self.last / self.open - 1) * 100:.2f}",'
+                f'"base_volume":"{self.base_volume:.4f}","quote_volume":"{self.quote_volume:.4f}",'
+                f'"high_24h":"{price_format % self.high}","low_24h":"{price_format % self.low}"}}}}')
+
+    def trade_message(self, at: float, side: str, price: float, amount: float) -> str:
+        trade_id = self.trade_id
+        return (f'{{"time":{int(at)},"time_ms":{int(at * 1000)},"channel":"spot.trades","event":"update",'
+                f'"result":{{"id":{trade_id},"create_time":{int(at)},"create_time_ms":"{at * 1000:.3f}",'
+                f'"side":"{side}","currency_pair":{self.pair_json},"amount":"{amount:.4f}",'
+                f'"price":"{self.price_format % price}","range":"{trade_id}-{trade_id}"}}}}')
+
+    def book_update_message(self, at: float, first_id: int,
+                            changes: Tuple[Dict[int, float], Dict[int, float]]) -> str:
+        level_format, tick = self.level_format, self.tick
+        bids, asks = changes
+        bid_levels = ",".join([level_format % (index * tick, size) for index, size in bids.items()])
+        ask_levels = ",".join([level_format % (index * tick, size) for index, size in asks.items()])
+        return (f'{{"time":{int(at)},"time_ms":{int(at * 1000)},"channel":"spot.order_book_update",'
+                f'"event":"update","result":{{"t":{int(at * 1000)},"e":"depthUpdate","E":{int(at)},'
+                f'"s":{self.pair_json},"U":{first_id},"u":{self.update_id},'
+                f'"b":[{bid_levels}],"a":[{ask_levels}]}}}}')
+
+    def levels(self, limit: int) -> Tuple[List[List[str]], List[List[str]]]:
+        """Верх стакана (bids по убыванию, asks по возрастанию) в формате [[цена, объем]]"""
+        bids = [[self.fmt(index), f"{self.bids[index]:.4f}"] for index in sorted(self.bids, reverse=True)[:limit]]
+        asks = [[self.fmt(index), f"{self.asks[index]:.4f}"] for index in sorted(self.asks)[:limit]]
+        return bids, asks
+
+
+class SyntheticMarket:
+    """
+    Воспроизводимый поток событий многих пар
+
+    События всех пар - один пуассоновский поток с интенсивностью
+    пары * (trade_rate + book_rate + ticker_rate): пара и вид события выбираются
+    одним равномерным числом, поэтому у каждой пары свои независимые пуассоновские
+    потоки сделок, диффов и тикеров. Цена пары сдвигается по ГБД только при ее
+    событии (точно для любого интервала), стакан строится при первом диффе.
+    """
+
+    def __init__(self, pairs: Union[int, Iterable[str]] = 100, seed: Optional[int] = None,
+                 prices: Optional[Dict[str, float]] = None, volatility: float = 0.8, drift: float = 0.0,
+                 trade_rate: float = 5.0, book_rate: float = 10.0, ticker_rate: float = 1.0,
+                 depth: int = 20, start_time: Optional[float] = None):
+        """
+        Args:
+            pairs: Количество синтетических пар (synthetic_pairs) или список пар
+            seed: Зерно генератора (одинаковый поток событий)
+            prices: Начальные цены пар (остальные - случайные от 0.001 до 10000)
+            volatility: Годовая волатильность логарифма цены (0.8 = 80%)
+            drift: Годовой снос
+            trade_rate, book_rate, ticker_rate: Событий на пару в секунду модельного времени
+            depth: Уровней стакана на сторону
+            start_time: Начало модельного времени (по умолчанию текущее время)
+        """
+        self.seed = seed
+        self.trade_rate = trade_rate
+        self.book_rate = book_rate
+        self.ticker_rate = ticker_rate
+        self.depth = depth
+        self.sigma = volatility / math.sqrt(SECONDS_PER_YEAR)
+        self.drift = drift / SECONDS_PER_YEAR
+        self.now = time.time() if start_time is None else start_time
+        self.generated = 0
+        self._random = random.Random(seed)
+        self.pairs: Dict[str, SyntheticPair] = {}
+        names = synthetic_pairs(pairs) if isinstance(pairs, int) else pairs
+        for pair in names:
+            self.add_pair(pair, (prices or {}).get(pair))
+
+    def add_pair(self, pair: str, price: Optional[float] = None) -> SyntheticPair:
+        """Добавить пару (существующая возвращается как есть)"""
+        pair = pair.upper()
+        state = self.pairs.get(pair)
+        if state is None:
+            if price is None:
+                price = 10.0 ** self._random.uniform(-3, 4)
+            state = self.pairs[pair] = SyntheticPair(pair, price, self.now)
+        return state
+
+    def price(self, pair: str) -> float:
+        """Цена пары на текущий модельный момент (неизвестная пара добавляется)"""
+        state = self.add_pair(pair)
+        state.move(self.now, self.drift, self.sigma, self._random.gauss)
+        return state.price
+
+    def order_book_snapshot(self, pair: str, limit: int = 100) -> Dict[str, Any]:
+        """Снимок стакана в формате REST GET /spot/order_book?with_id=true"""
+        state = self.add_pair(pair)
+        if state.best is None:
+            state.book_update(self._random, self.depth)
+        bids, asks = state.levels(limit)
+        now_ms = int(self.now * 1000)
+        return {'id': state.update_id, 'current': now_ms, 'update': now_ms, 'bids': bids, 'asks': asks}
+
+    def events(self, count: Optional[int] = None, duration: Optional[float] = None
+               ) -> Iterator[Tuple[float, int, SyntheticPair, Any]]:
+        """
+        Сырые события: (модельное время, вид, пара, данные)
+
+        Данные: TRADE - (side, price, amount), BOOK - изменения (bids, asks), TICKER - None.
+        Поток заканчивается после count событий или duration секунд модельного времени.
+        """
+        if count is None and duration is None:
+            raise ValueError("нужен count или duration")
+        pairs = list(self.pairs.values())
+        per_pair = self.trade_rate + self.book_rate + self.ticker_rate
+        if not pairs or per_pair <= 0:
+            return
+        count_pairs = len(pairs)
+        total_rate = count_pairs * per_pair
+        trade_share = self.trade_rate / per_pair
+        book_share = trade_share + self.book_rate / per_pair
+        rng = self._random
+        rnd, gauss = rng.random, rng.gauss
+        sigma, depth = self.sigma, self.depth
+        # Снос логарифма цены (поправка Ито) - один раз на поток
+        log_drift = self.drift - 0.5 * sigma * sigma
+        mean_gap = 1.0 / total_rate
+        end = self.now + duration if duration is not None else math.inf
+        remaining = initial = count if count is not None else -1
+        at = self.now
+        try:
+            while remaining:
+                at -= mean_gap * _log(1.0 - rnd())
+                if at > end:
+                    at = end
+                    return
+                # Целая часть - пара, дробная (тоже равномерная) - вид события
+                point = rnd() * count_pairs
+                index = int(point)
+                share = point - index
+                state = pairs[index]
+                # Точный шаг ГБД с прошлого события пары (как SyntheticPair.move)
+                dt = at - state.time
+                if dt > 0:
+                    state.price *= _exp(log_drift * dt + sigma * _sqrt(dt) * gauss(0.0, 1.0))
+                    state.time = at
+                remaining -= 1
+                if share < trade_share:
+                    yield at, TRADE, state, state.trade(rng, depth)
+                elif share < book_share:
+                    yield at, BOOK, state, state.book_update(rng, depth)
+                else:
+                    yield at, TICKER, state, None
+        finally:
+            # Состояние фиксируется и при досрочном закрытии генератора
+            self.generated += initial - remaining
+            self.now = at
+
+    def frames(self, count: Optional[int] = None, duration: Optional[float] = None
+               ) -> Iterator[Tuple[float, str, Dict[str, Any]]]:
+        """События в формате Gate.io: (модельное время, канал, result) - около 70 тыс./с на 1000 пар"""
+        for at, kind, state, data in self.events(count, duration):
+            if kind == TRADE:
+                yield at, "spot.trades", state.trade_result(at, *data)
+            elif kind == BOOK:
+                # Один сдвиг - один номер: U == u
+                yield at, "spot.order_book_update", state.book_update_result(at, state.update_id, data)
+            else:
+                yield at, "spot.tickers", state.ticker_result()
+
+    def messages(self, count: Optional[int] = None, duration: Optional[float] = None
+                 ) -> Iterator[Tuple[float, str]]:
+        """
+        Кадры WebSocket: (модельное время, JSON кадр) - формат записи capture.py
+
+        Кадр совпадает с json.dumps кадра из frames(), но собирается строкой по шаблонам
+        пары (65-80 тыс./с на 1000 пар против примерно 36 тыс./с через json.dumps).
+        """
+        # Кадр собирается сразу строкой по шаблонам пары - без словаря result и json.dumps
+        for at, kind, state, data in self.events(count, duration):
+            if kind == TRADE:
+                yield at, state.trade_message(at, *data)
+            elif kind == BOOK:
+                yield at, state.book_update_message(at, state.update_id, data)
+            else:
+                yield at, state.ticker_message(at)
+
+    def create_manager(self, **kwargs):
+        """
+        Менеджер пар без сети, подписанный на все пары рынка (снимки стакана - из рынка)
+
+        Args:
+            kwargs: Параметры ReplayPairWebSocketManager (incremental_orderbook, ...)
+        """
+        from replay import ReplayPairWebSocketManager
+        manager = ReplayPairWebSocketManager(snapshot_loader=self.order_book_snapshot, **kwargs)
+        # Через реестр: потребители с более низким уровнем (автотрейдер) не понизят подписку
+        manager.subscriptions.acquire('synthetic', list(self.pairs))
+        return manager
+
+    def drive(self, manager, count: Optional[int] = None, duration: Optional[float] = None,
+              wire: bool = False) -> Dict[str, Any]:
+        """
+        Подать события в менеджер без пауз
+
+        Args:
+            manager: Менеджер из create_manager() (пары рынка подписаны)
+            count, duration: Сколько событий или модельных секунд
+            wire: Подавать JSON кадры через _on_message (с разбором), иначе result сразу в маршруты
+
+        Returns:
+            Количество событий, время и частота (событий в секунду)
+        """
+        clients = manager.connections
+        delivered = 0
+        started = time.perf_counter()
+        if wire:
+            for at, message in self.messages(count, duration):
+                clients[_PAIR_PATTERN.search(message).group(1)]._on_message(None, message)
+                delivered += 1
+        else:
+            for at, channel, result in self.frames(count, duration):
+                clients[result.get('currency_pair') or result['s']]._dispatch(channel, result)
+                delivered += 1
+        elapsed = time.perf_counter() - started
+        return {
+            'events': delivered,
+            'elapsed_s': round(elapsed, 3),
+            'events_per_sec': round(delivered / elapsed, 1) if elapsed > 0 else None
+        }
+
+
+def _measure(label: str, func: Callable[[], int], note: str = ''):
+    started = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<46}{count:>10} за {elapsed:7.3f} с = {count / elapsed:>12,.0f} /с{note}")
+
+
+def _trade_rounds(market: 'SyntheticMarket', manager, seed: Optional[int], bases: List[str], rounds: int):
+    """Проходы автотрейдера по базам рынка с подачей событий в менеджер между проходами"""
+    from autotrader import AutoTrader
+    from state_manager import StateManager
+    with tempfile.TemporaryDirectory() as directory:
+        state = StateManager(os.path.join(directory, 'state.json'))
+        state.set_auto_trade_enabled(True)
+        for base in bases:
+            state.set_trading_permission(base, True)
+        trader = AutoTrader(lambda: None, manager, state, market=market, seed=seed)
+        trader.running = True
+        # Журнал сделок режима SIM в stdout не нужен в замере
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(rounds):
+                market.drive(manager, len(bases) * 10)
+                trader.run_once()
+        trader.running = False
+    return trader
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'pairs': 1000, 'events': 500000, 'seed': 1}
+    while args:
+        name = args.pop(0).lstrip('-')
+        if name not in options or not args:
+            print(__doc__)
+            sys.exit(1)
+        options[name] = int(args.pop(0))
+    pairs, events, seed = options['pairs'], options['events'], options['seed']
+
+    print("=" * 80)
+    print(f"СИНТЕТИЧЕСКИЙ РЫНОК: {pairs} пар, {events} событий, seed={seed}")
+    print("=" * 80)
+    _measure("Сырые события", lambda: sum(1 for _ in SyntheticMarket(pairs, seed).events(events)))
+    _measure("События в формате Gate.io", lambda: sum(1 for _ in SyntheticMarket(pairs, seed).frames(events)))
+    _measure("JSON кадры", lambda: sum(1 for _ in SyntheticMarket(pairs, seed).messages(events)))
+
+    # gateio_websocket при импорте включает INFO - в замере нужны только предупреждения
+    import gateio_websocket  # noqa: F401
+    logging.getLogger().setLevel(logging.WARNING)
+    market = SyntheticMarket(pairs, seed)
+    manager = market.create_manager()
+    _measure("PairWebSocketManager (result в маршруты)", lambda: market.drive(manager, events)['events'])
+    _measure("PairWebSocketManager (JSON кадры)", lambda: market.drive(manager, events // 5, wire=True)['events'])
+
+    bases = [pair.split('_')[0] for pair in list(market.pairs)[:200]]
+    rounds = 20
+    trader = None
+
+    def trade_rounds():
+        nonlocal trader
+        trader = _trade_rounds(market, manager, seed, bases, rounds)
+        return rounds * len(bases)
+
+    _measure("AutoTrader.run_once (базы, с подачей событий)", trade_rounds)
+    print(f"{'':<46}сделок {trader.stats['successful_trades']}, прибыль {trader.stats['total_profit']:.4f}")
+
+    from breakeven_calculator import calculate_breakeven_table
+    params = {'steps': 16, 'start_volume': 3.0, 'pprof': 0.6, 'kprof': 0.02, 'target_r': 3.65,
+              'geom_multiplier': 2.0, 'rebuy_mode': 'geometric'}
+    _measure("calculate_breakeven_table по ценам рынка",
+             lambda: sum(1 for at, kind, state, _ in market.events(events // 10)
+                         if calculate_breakeven_table(params, state.price)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Тест записи сырых кадров WebSocket в сжатые файлы
+"""
+
+import sys
+import os
+import gzip
+import json
+import lzma
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import capture
+from capture import CaptureRecorder
+from gateio_websocket import GateIOWebSocket
+
+DAY = 1700000000.0  # 2023-11-14 UTC
+
+
+def test_frames_are_written_per_day_and_appended(tmp_path):
+    """Кадры пишутся в файл своих суток; повторный запуск дописывает тот же файл"""
+    recorder = CaptureRecorder(str(tmp_path), 'gzip', flush_interval=0.01).start()
+    recorder.record('{"channel":"spot.tickers","event":"update"}', DAY)
+    recorder.record(b'{"channel":"spot.pong"}', DAY + 86400)
+    recorder.stop()
+
+    first = tmp_path / 'capture-20231114.jsonl.gz'
+    assert sorted(os.listdir(tmp_path)) == ['capture-20231114.jsonl.gz', 'capture-20231115.jsonl.gz']
+    with gzip.open(first, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [
+            {'ts': DAY, 'frame': '{"channel":"spot.tickers","event":"update"}'}]
+
+    recorder = CaptureRecorder(str(tmp_path), 'gzip', flush_interval=0.01).start()
+    recorder.record('second', DAY + 1)
+    recorder.stop()
+    with gzip.open(first, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)['frame'] for line in f][-1] == 'second'
+
+
+def test_bounded_queue_and_rotation(tmp_path):
+    """Очередь ограничена (лишние кадры отбрасываются), большой файл сменяется следующим"""
+    recorder = CaptureRecorder(str(tmp_path), 'lzma', max_pending=3, rotate_bytes=1)
+    for index in range(5):
+        recorder.record(f'frame-{index}', DAY)
+    assert recorder.dropped == 2 and recorder.stats()['pending'] == 3
+
+    recorder.start()
+    recorder.stop()
+    recorder = CaptureRecorder(str(tmp_path), 'lzma', rotate_bytes=1, flush_interval=0.01).start()
+    recorder.record('next', DAY)
+    recorder.stop()
+    assert sorted(os.listdir(tmp_path)) == ['capture-20231114-1.jsonl.xz', 'capture-20231114.jsonl.xz']
+    with lzma.open(tmp_path / 'capture-20231114.jsonl.xz', 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)['frame'] for line in f] == ['frame-0', 'frame-1', 'frame-2']
+
+
+def test_websocket_records_raw_frames_when_enabled(tmp_path, monkeypatch):
+    """Включенная запись получает каждый кадр соединения, включая служебные"""
+    recorder = CaptureRecorder(str(tmp_path))
+    monkeypatch.setattr(capture, '_recorder', recorder)
+    client = GateIOWebSocket()
+    client._on_message(None, '{"time":1,"channel":"spot.pong","event":"","result":null}')
+    assert recorder.recorded == 1 and recorder._pending[0][1].startswith('{"time":1')
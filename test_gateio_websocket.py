@@ -0,0 +1,415 @@
+"""
+Тест маршрутизации обновлений Gate.io WebSocket (без сетевых подключений)
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websocket
+
+from data_limits import DataLimits
+from feed_metrics import FeedMetrics
+import json_codec
+from gateio_websocket import GateIOWebSocket, PairWebSocketManager
+
+
+def _update(channel, result):
+    """Сформировать кадр обновления в формате Gate.io v4"""
+    return json.dumps({"time": 0, "channel": channel, "event": "update", "result": result})
+
+
+def test_routes_by_channel_and_pair():
+    """Обновления разных пар одного канала попадают в свои обработчики"""
+    client = GateIOWebSocket()
+    btc, eth = [], []
+    client.subscribe_ticker('btc_usdt', btc.append)
+    client.subscribe_ticker('ETH_USDT', eth.append)
+
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "1"}))
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "ETH_USDT", "last": "2"}))
+    client._on_message(None, _update("spot.order_book", {"s": "BTC_USDT", "asks": [], "bids": []}))
+
+    assert [d['last'] for d in btc] == ['1']
+    assert [d['last'] for d in eth] == ['2']
+
+
+def test_fan_out_wildcard_and_remove():
+    """Несколько потребителей одного потока, подписчик на все пары и отписка"""
+    client = GateIOWebSocket()
+    cache, recorder, everything = [], [], []
+    client.subscribe_trades('BTC_USDT', cache.append)
+    client.add_route("spot.trades", 'BTC_USDT', recorder.append)
+    client.add_route("spot.trades", GateIOWebSocket.ROUTE_WILDCARD, everything.append)
+
+    client._on_message(None, _update("spot.trades", {"currency_pair": "BTC_USDT", "id": 1}))
+    client._on_message(None, _update("spot.trades", {"currency_pair": "WLD_USDT", "id": 2}))
+    assert len(cache) == 1 and len(recorder) == 1
+    assert [d['id'] for d in everything] == [1, 2]
+
+    client.unsubscribe("spot.trades", 'BTC_USDT')
+    client._on_message(None, _update("spot.trades", {"currency_pair": "BTC_USDT", "id": 3}))
+    assert len(cache) == 1 and len(everything) == 3
+
+
+def test_multiplexed_manager_shares_connections(monkeypatch):
+    """Мультиплексный менеджер раскладывает пары по общим соединениям"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, pairs_per_connection=2)
+    manager.create_connections(['BTC_USDT', 'ETH_USDT', 'WLD_USDT'])
+
+    assert len(manager.shared_connections) == 2
+    assert manager.connections['BTC_USDT'] is manager.connections['ETH_USDT']
+
+    client = manager.connections['BTC_USDT']
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "ETH_USDT", "last": "5"}))
+    assert manager.get_data('ETH_USDT')['ticker']['last'] == '5'
+    assert manager.get_data('BTC_USDT')['ticker'] == {}
+
+    manager.close_connection('WLD_USDT')
+    assert len(manager.shared_connections) == 1
+
+
+def test_multiplexed_connection_batches_subscriptions_and_routes_by_pair(monkeypatch):
+    """Общее соединение: подписка каналом со списком пар, кадры каждой пары - только в ее кэш"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, pairs_per_connection=10, incremental_orderbook=False)
+    manager.create_connections(['btc_usdt', 'ETH_USDT'])
+    client = manager.connections['BTC_USDT']
+    assert manager.shared_connections == [client]
+
+    payloads = [(p['channel'], p['payload']) for p in client._resubscribe_payloads()]
+    assert ("spot.tickers", ['BTC_USDT', 'ETH_USDT']) in payloads
+    assert ("spot.trades", ['BTC_USDT', 'ETH_USDT']) in payloads
+    assert [p for c, p in payloads if c == "spot.order_book"] == [['BTC_USDT', '20', '100ms'],
+                                                                   ['ETH_USDT', '20', '100ms']]
+
+    client._on_message(None, _update("spot.trades", {"currency_pair": "ETH_USDT", "id": 7, "price": "2"}))
+    client._on_message(None, _update("spot.order_book", {"s": "BTC_USDT", "asks": [["101", "1"]],
+                                                         "bids": [["99", "2"]]}))
+    assert [t['id'] for t in manager.get_data('ETH_USDT')['trades']] == [7]
+    assert manager.get_data('BTC_USDT')['trades'] == ()
+    assert manager.get_data('BTC_USDT')['orderbook'].best_ask == 101.0
+    assert not manager.get_data('ETH_USDT')['orderbook']
+
+
+def test_trades_history_is_bounded_ring(monkeypatch):
+    """История сделок пары ограничена емкостью буфера, новые сделки первыми"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=False)
+    client = manager.create_connection('BTC_USDT')
+    capacity = DataLimits.MAX_TRADES_HISTORY
+
+    for trade_id in range(capacity + 5):
+        client._on_message(None, _update("spot.trades", {"currency_pair": "BTC_USDT", "id": trade_id}))
+
+    trades = manager.get_data('BTC_USDT')['trades']
+    assert len(trades) == capacity
+    assert [t['id'] for t in trades[:2]] == [capacity + 4, capacity + 3]
+
+    # Публикация не копирует историю, а опубликованный вид не меняется следующими сделками
+    for trade_id in range(capacity + 5, 3 * capacity):
+        client._on_message(None, _update("spot.trades", {"currency_pair": "BTC_USDT", "id": trade_id}))
+        assert manager._trades['BTC_USDT']._chain < 2 * capacity
+    assert [t['id'] for t in trades] == list(range(capacity + 4, 4, -1))
+    latest = manager.get_data('BTC_USDT')['trades']
+    assert latest._items is None and len(latest) == capacity
+    assert latest[0]['id'] == 3 * capacity - 1 and latest.to_json()[-1]['id'] == 2 * capacity
+
+
+def test_get_data_returns_immutable_versioned_snapshots(monkeypatch):
+    """Читатель получает неизменяемый снимок, обновление публикует новый объект"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True)
+    client = manager.create_connection('BTC_USDT')
+    before = manager.get_data('BTC_USDT')
+
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "1"}))
+    after = manager.get_data('BTC_USDT')
+
+    assert after is not before
+    assert before['ticker'] == {} and after['ticker']['last'] == '1'
+    assert after['version'] == before['version'] + 1
+    try:
+        after['ticker'] = {}
+        assert False, "снимок должен быть неизменяемым"
+    except TypeError:
+        pass
+    assert json.loads(json.dumps(after, default=lambda o: o.to_json()))['ticker']['last'] == '1'
+
+
+def test_wait_for_data_signals_first_update(monkeypatch):
+    """Создание соединения не блокирует, готовность пары - по первым данным"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True)
+    client = manager.create_connection('BTC_USDT')
+
+    assert manager.wait_for_data('BTC_USDT', timeout=0.01) is False
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "1"}))
+    assert manager.wait_for_data('BTC_USDT', timeout=0.01) is True
+    assert manager.wait_for_data('ETH_USDT', timeout=0.01) is False
+
+
+def test_pair_updates_use_per_pair_locks(monkeypatch):
+    """Обновления пары захватывают только её блокировку, не общую"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True)
+    client = manager.create_connections(['BTC_USDT', 'ETH_USDT'])['BTC_USDT']
+    global_before = manager.lock.acquisitions
+
+    with manager.lock:
+        # Общая блокировка занята (например, очисткой кэша) - обновление пары проходит
+        client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "7"}))
+    assert manager.get_data('BTC_USDT')['ticker']['last'] == '7'
+
+    stats = manager.lock_stats()
+    assert stats['global']['acquisitions'] == global_before + 1
+    assert stats['pairs']['BTC_USDT']['acquisitions'] == 1
+    assert stats['pairs']['ETH_USDT']['contended'] == 0
+
+
+def test_get_changes_returns_only_changed_sections(monkeypatch):
+    """Условный запрос since отдает unchanged или только измененные разделы и новые сделки"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True)
+    client = manager.create_connection('BTC_USDT')
+    client._on_message(None, _update("spot.trades", {"currency_pair": "BTC_USDT", "id": 1}))
+    seen = manager.get_data('BTC_USDT')
+
+    assert manager.get_changes('BTC_USDT', seen['version'], seen['trades_seq']) == {'version': seen['version'], 'unchanged': True}
+
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "3"}))
+    client._on_message(None, _update("spot.trades", {"currency_pair": "BTC_USDT", "id": 2}))
+    changes = manager.get_changes('BTC_USDT', seen['version'], seen['trades_seq'])
+
+    assert changes['delta'] is True and changes['version'] == seen['version'] + 2
+    assert set(changes['data']) == {'ticker', 'trades_new', 'trades_seq', 'last_update'}
+    assert [t['id'] for t in changes['data']['trades_new']] == [2]
+    # Версия не из текущего кэша - полный снимок
+    assert changes['version'] == manager.get_changes('BTC_USDT', 10 ** 6)['data']['version']
+    assert manager.get_changes('ETH_USDT', 0) is None
+
+
+def test_dispatch_pool_keeps_per_pair_order(monkeypatch):
+    """Кадры разбираются в пуле потоков, порядок обновлений каждой пары сохраняется"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, dispatch_workers=3)
+    client = manager.create_connections(['BTC_USDT', 'ETH_USDT'])['BTC_USDT']
+
+    for trade_id in range(200):
+        for pair in ('BTC_USDT', 'ETH_USDT'):
+            client._on_message(None, _update("spot.trades", {"currency_pair": pair, "id": trade_id}))
+
+    deadline = time.time() + 5
+    while sum(manager.dispatcher.stats()['processed']) < 400 and time.time() < deadline:
+        time.sleep(0.01)
+    for pair in ('BTC_USDT', 'ETH_USDT'):
+        ids = [t['id'] for t in manager.get_data(pair)['trades']]
+        assert ids == list(range(199, 199 - DataLimits.MAX_TRADES_HISTORY, -1))
+    assert sum(manager.dispatcher.stats()['processed']) == 400
+    manager.dispatcher.shutdown()
+
+
+def test_reconnects_with_backoff_and_batched_resubscribe(monkeypatch):
+    """После обрыва соединение восстанавливается, подписки отправляются пачкой по каналу"""
+    apps = []
+
+    class FakeApp:
+        def __init__(self, url, on_message, on_error, on_close, on_open):
+            self.on_open = on_open
+            self.sent = []
+            self.closed = threading.Event()
+            apps.append(self)
+
+        def send(self, message):
+            self.sent.append(json.loads(message))
+
+        def run_forever(self):
+            self.on_open(self)
+            if len(apps) > 1:
+                self.closed.wait(2)  # первое соединение "обрывается" сразу
+
+        def close(self):
+            self.closed.set()
+
+    monkeypatch.setattr(websocket, 'WebSocketApp', FakeApp)
+    client = GateIOWebSocket()
+    client.RECONNECT_BASE_DELAY = 0.01
+    reconnected = threading.Event()
+    client.on_reconnect = lambda ws_client: reconnected.set()
+    client.subscribe_pairs("spot.tickers", ['BTC_USDT', 'ETH_USDT'], lambda data: None)
+    client.subscribe_orderbook_updates('BTC_USDT', "100ms", lambda data: None)
+
+    client.connect()
+    assert reconnected.wait(2)
+    client.disconnect()
+
+    # Первое соединение оборвалось без данных - попытка не сброшена
+    assert client.reconnects == 1 and client.reconnect_attempts == 1
+    assert [(p['channel'], p['payload']) for p in apps[1].sent] == [
+        ("spot.tickers", ['BTC_USDT', 'ETH_USDT']),
+        ("spot.order_book_update", ['BTC_USDT', "100ms"])
+    ]
+    time.sleep(0.05)
+    assert len(apps) == 2  # после disconnect переподключения нет
+
+    delays = [client._backoff_delay(attempt) for attempt in range(12)]
+    assert 0.25 * client.RECONNECT_BASE_DELAY <= delays[0] <= client.RECONNECT_BASE_DELAY
+    assert max(delays) <= client.RECONNECT_MAX_DELAY
+
+
+def test_open_then_close_flap_keeps_backing_off(monkeypatch):
+    """Соединение, закрытое сервером сразу после открытия, не сбрасывает экспоненциальную задержку"""
+    apps = []
+    attempts = []
+
+    class FlappingApp:
+        def __init__(self, url, on_message, on_error, on_close, on_open):
+            self.on_open = on_open
+            apps.append(self)
+
+        def send(self, message):
+            pass
+
+        def run_forever(self):
+            self.on_open(self)  # сервер принимает соединение и сразу закрывает
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(websocket, 'WebSocketApp', FlappingApp)
+    client = GateIOWebSocket()
+    client.RECONNECT_BASE_DELAY = 0.005
+    backoff = client._backoff_delay
+    monkeypatch.setattr(client, '_backoff_delay', lambda attempt: attempts.append(attempt) or backoff(attempt))
+
+    client.connect()
+    deadline = time.monotonic() + 2
+    while len(apps) < 5 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    client.disconnect()
+    assert attempts[:4] == [0, 1, 2, 3]
+
+    # Первый кадр данных подтверждает рабочее соединение - счетчик сбрасывается
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "1"}))
+    assert client.reconnect_attempts == 0
+
+
+def test_stale_heartbeat_closes_socket_off_scheduler_thread():
+    """Закрытие зависшего сокета не блокирует поток планировщика"""
+    closed = threading.Event()
+
+    class DeadSocket:
+        def close(self, timeout=3):
+            time.sleep(0.5)  # ожидание ответного кадра на мертвом сокете
+            closed.set()
+
+    client = GateIOWebSocket()
+    client.ws = DeadSocket()
+    client.is_running = True
+    client.last_data_time = time.time()
+    client.last_frame_time = time.time() - client.STALE_AFTER - 1
+
+    started = time.monotonic()
+    client._heartbeat()
+    assert time.monotonic() - started < 0.1
+    assert client.stale and closed.wait(2)
+
+
+def test_heartbeat_ping_is_sent_off_scheduler_thread():
+    """Блокирующаяся отправка ping не задерживает таймер; повторный ping ждет первого"""
+    sending, unblock = threading.Event(), threading.Event()
+    senders = []
+
+    class BlockedSocket:
+        def send(self, message):
+            senders.append(threading.current_thread().name)
+            sending.set()
+            unblock.wait(2)
+
+    client = GateIOWebSocket()
+    client.ws = BlockedSocket()
+    client.is_running = True
+    client.last_data_time = client.last_frame_time = time.time() - client.PING_AFTER - 1
+
+    try:
+        started = time.monotonic()
+        client._heartbeat()
+        assert sending.wait(2)
+        client._heartbeat()
+        assert time.monotonic() - started < 0.5
+    finally:
+        unblock.set()
+    client._ping_thread.join(2)
+    assert senders == ['ws-ping']
+
+
+def test_feed_metrics_record_latency_per_channel_and_pair():
+    """Кадр обновления попадает в метрики канала и пары с задержкой от отметки биржи"""
+    metrics = FeedMetrics()
+    client = GateIOWebSocket()
+    client.metrics = metrics
+    client.subscribe_ticker('BTC_USDT', lambda data: None)
+
+    frame = json.dumps({"time_ms": int(time.time() * 1000) - 40, "channel": "spot.tickers",
+                        "event": "update", "result": {"currency_pair": "BTC_USDT", "last": "1"}})
+    client._on_message(None, frame)
+
+    snapshot = metrics.snapshot()
+    channel = snapshot['channels']['spot.tickers']
+    assert channel['messages'] == 1 and channel['bytes'] == len(frame)
+    assert channel['exchange_to_receive_ms']['min'] >= 30
+    assert channel['receive_to_applied_ms']['count'] == 1
+    assert snapshot['pairs']['BTC_USDT']['spot.tickers']['messages'] == 1
+    assert metrics.snapshot('ETH_USDT')['pairs'] == {}
+
+
+def test_control_frames_skip_decoding(monkeypatch):
+    """Pong и подтверждения подписки распознаются без разбора JSON, обновления разбираются"""
+    client = GateIOWebSocket()
+    decoded = []
+    client.decode = lambda message: decoded.append(message) or json.loads(message)
+    received = []
+    client.subscribe_ticker('BTC_USDT', received.append)
+
+    client._on_message(None, '{"time":1,"time_ms":1000,"channel":"spot.pong","event":"","result":null}')
+    client._on_message(None, '{"time":1,"channel":"spot.tickers","event":"subscribe","payload":["BTC_USDT"],'
+                             '"result":{"status":"success"}}')
+    assert decoded == []
+
+    client._on_message(None, '{"time":1,"channel":"spot.tickers","event":"subscribe","payload":["X"],'
+                             '"error":{"code":2,"message":"unknown currency pair"},"result":null}')
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "1"}))
+    assert len(decoded) == 2 and received == [{"currency_pair": "BTC_USDT", "last": "1"}]
+
+    assert json_codec.select_decoder('no_such_decoder')[0] in json_codec.DECODER_PREFERENCE
+    assert json_codec.select_decoder('json') == ('json', json.loads)
+
+
+def test_cleanup_evicts_least_recently_updated_pairs(monkeypatch):
+    """Очистка вытесняет давно не обновлявшиеся пары: сначала по TTL, затем сверх лимита"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True)
+    pairs = ['BTC_USDT', 'ETH_USDT', 'WLD_USDT', 'SOL_USDT']
+    client = manager.create_connections(pairs)['BTC_USDT']
+    for pair in ('WLD_USDT', 'BTC_USDT', 'ETH_USDT', 'SOL_USDT'):
+        client._on_message(None, _update("spot.tickers", {"currency_pair": pair, "last": "1"}))
+    # Клиентам API - время суток, возраст для вытеснения - по монотонным часам
+    assert abs(manager.get_data('BTC_USDT')['last_update'] - time.time()) < 60
+
+    # WLD обновлялась давно - истекает по TTL, BTC вытесняется лимитом в 2 пары
+    manager._recency['WLD_USDT'] = time.monotonic() - DataLimits.CACHE_TTL_SECONDS - 1
+    monkeypatch.setattr(DataLimits, 'MAX_CURRENCY_PAIRS_CACHE', 3)
+    manager._cleanup_old_cache()
+    assert list(manager._recency) == ['BTC_USDT', 'ETH_USDT', 'SOL_USDT']
+
+    monkeypatch.setattr(DataLimits, 'MAX_CURRENCY_PAIRS_CACHE', 2)
+    manager._cleanup_old_cache()
+    assert sorted(manager.data_cache) == ['ETH_USDT', 'SOL_USDT']
+    assert list(manager._recency) == ['ETH_USDT', 'SOL_USDT']
+    assert 'WLD_USDT' not in manager.connections and 'BTC_USDT' not in manager.connections
@@ -0,0 +1,69 @@
+"""
+Тест SSE потока рыночных данных с конфляцией (без сетевых подключений)
+"""
+
+import sys
+import os
+import json
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from conflation import ConflatingConsumer, UpdateConflator
+from gateio_websocket import GateIOWebSocket, PairWebSocketManager
+from market_stream import MarketStreamSubscriber
+
+
+def _update(channel, result):
+    """Сформировать кадр обновления в формате Gate.io v4"""
+    return json.dumps({"time": 0, "channel": channel, "event": "update", "result": result})
+
+
+def _payload(frame):
+    """Данные SSE события"""
+    return json.loads(frame.split("data: ", 1)[1])
+
+
+def test_stream_sends_snapshot_then_conflated_delta(monkeypatch):
+    """Первое событие - полный снимок, затем одна дельта с последним значением"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True)
+    client = manager.create_connections(['BTC_USDT', 'ETH_USDT'])['BTC_USDT']
+    subscriber = MarketStreamSubscriber(manager, ['btc_usdt'], lambda o: json.dumps(o, default=lambda v: v.to_json()),
+                                        max_rate=1000, heartbeat=0.05)
+    events = subscriber.events()
+
+    assert _payload(next(events)) == {'pairs': ['BTC_USDT']}
+    snapshot = _payload(next(events))
+    assert snapshot['pair'] == 'BTC_USDT' and 'delta' not in snapshot
+
+    for last in ('1', '2', '3'):
+        client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": last}))
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "ETH_USDT", "last": "9"}))
+
+    delta = _payload(next(events))
+    assert delta['delta'] is True and delta['data']['ticker']['last'] == '3'
+    assert subscriber.conflated == 2
+    assert next(events) == ": keep-alive\n\n"
+
+    events.close()
+    assert manager.conflator.consumers == ()
+
+
+def test_conflating_consumer_keeps_latest_and_counts_drops():
+    """Последнее значение на ключ, отброшенные обновления считаются, частота ограничена"""
+    consumer = ConflatingConsumer('test', max_rate=20)
+    conflator = UpdateConflator()
+    conflator.add_consumer(consumer)
+    for version in range(5):
+        conflator.offer('BTC_USDT', ('ticker', 'orderbook'), version)
+
+    assert consumer.drain(timeout=0.1) == {('BTC_USDT', 'ticker'): 4, ('BTC_USDT', 'orderbook'): 4}
+    assert consumer.stats()['dropped'] == 8
+
+    conflator.offer('BTC_USDT', ('ticker',), 5)
+    started = time.monotonic()
+    assert consumer.drain(timeout=1) == {('BTC_USDT', 'ticker'): 5}
+    assert time.monotonic() - started >= 0.04  # не чаще 20 пачек в секунду
+    assert consumer.drain(timeout=0.01) == {}
@@ -0,0 +1,63 @@
+"""
+Тест локального заменителя Gate.io WebSocket (loopback, без внешней сети)
+"""
+
+import sys
+import os
+import json
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websocket
+
+import gateio_websocket
+from gateio_websocket import init_websocket_manager
+from mock_gateio_server import MockGateIOServer, synthetic_pairs
+
+
+def test_protocol_subscribe_ping_and_updates():
+    """Сервер подтверждает подписку, отвечает на spot.ping и присылает обновления подписанных пар"""
+    server = MockGateIOServer(port=0, ticker_rate=50, seed=7).start()
+    try:
+        ws = websocket.create_connection(server.ws_url, timeout=5)
+        ws.send(json.dumps({"time": 1, "channel": "spot.ping"}))
+        assert json.loads(ws.recv())['channel'] == "spot.pong"
+
+        pairs = synthetic_pairs(2)
+        ws.send(json.dumps({"time": 1, "channel": "spot.tickers", "event": "subscribe", "payload": pairs}))
+        reply = json.loads(ws.recv())
+        assert reply['event'] == 'subscribe' and reply['result'] == {"status": "success"}
+
+        seen = set()
+        while seen != set(pairs):
+            update = json.loads(ws.recv())
+            assert update['event'] == 'update' and update['channel'] == "spot.tickers"
+            seen.add(update['result']['currency_pair'])
+        ws.close()
+    finally:
+        server.stop()
+
+
+def test_manager_syncs_incremental_books_from_mock(monkeypatch):
+    """Менеджер по URL заменителя получает тикеры, сделки и синхронизирует стакан по REST снимку"""
+    monkeypatch.setattr(gateio_websocket, 'ws_manager', None)
+    server = MockGateIOServer(port=0, ticker_rate=20, book_rate=50, trade_rate=20, seed=7).start()
+    manager = init_websocket_manager(None, None, ws_url=server.ws_url, rest_host=server.rest_host)
+    try:
+        pairs = synthetic_pairs(3)
+        manager.create_connections(pairs)
+        deadline = time.monotonic() + 10
+        while (not all(pair in manager.order_books and manager.order_books[pair].is_synced for pair in pairs)
+               and time.monotonic() < deadline):
+            time.sleep(0.05)
+        for pair in pairs:
+            assert manager.wait_for_data(pair, timeout=5)
+            book = manager.order_books[pair]
+            assert book.is_synced and book.last_update_id > 0
+            data = manager.get_data(pair)
+            assert 0 < data['orderbook'].best_bid < data['orderbook'].best_ask
+    finally:
+        manager.close_all()
+        server.stop()
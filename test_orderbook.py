@@ -0,0 +1,122 @@
+"""
+Тест локального стакана по инкрементальным обновлениям (без сети)
+"""
+
+import sys
+import os
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from orderbook import CompactOrderBook, IncrementalOrderBook
+
+
+SNAPSHOT = {
+    'id': 100,
+    'asks': [['101.5', '2'], ['101', '1']],
+    'bids': [['99', '3'], ['100', '1']]
+}
+
+
+def _diff(first_id, last_id, asks=None, bids=None):
+    return {'s': 'BTC_USDT', 'U': first_id, 'u': last_id, 'a': asks or [], 'b': bids or [], 't': 0}
+
+
+def _wait_synced(book, timeout=2.0):
+    deadline = time.time() + timeout
+    while not book.is_synced and time.time() < deadline:
+        time.sleep(0.01)
+    return book.is_synced
+
+
+def test_snapshot_sorted_levels_and_diffs():
+    """Снимок сортируется, диффы обновляют и удаляют уровни"""
+    book = IncrementalOrderBook('btc_usdt', lambda pair: SNAPSHOT)
+    book.apply_snapshot(SNAPSHOT)
+    assert book.to_dict() == {
+        'asks': [['101', '1'], ['101.5', '2']],
+        'bids': [['100', '1'], ['99', '3']]
+    }
+
+    assert book.apply_update(_diff(95, 100)) is False  # уже учтено в снимке
+    assert book.apply_update(_diff(99, 101, asks=[['101', '0'], ['100.5', '4']]))
+    assert book.apply_update(_diff(102, 102, bids=[['100.2', '1']]))
+    assert book.to_dict(1) == {'asks': [['100.5', '4']], 'bids': [['100.2', '1']]}
+    assert book.last_update_id == 102
+
+
+def test_gap_triggers_resync_from_snapshot():
+    """Разрыв номеров обновлений запускает загрузку нового снимка и применение буфера"""
+    loads = []
+
+    def loader(pair):
+        loads.append(pair)
+        return {'id': 110, 'asks': [['105', '1']], 'bids': [['95', '1']]}
+
+    book = IncrementalOrderBook('BTC_USDT', loader)
+    book.apply_snapshot(SNAPSHOT)
+
+    assert book.apply_update(_diff(105, 111, asks=[['106', '1']])) is False
+    assert _wait_synced(book)
+    assert loads == ['BTC_USDT']
+    # Буферизованный дифф 105..111 накрывает id снимка и применяется после него
+    assert book.last_update_id == 111
+    assert book.to_dict()['asks'] == [['105', '1'], ['106', '1']]
+
+
+def test_trim_keeps_best_levels():
+    """Лимит уровней отбрасывает худшие цены"""
+    book = IncrementalOrderBook('BTC_USDT', lambda pair: SNAPSHOT, max_levels=1)
+    book.apply_snapshot(SNAPSHOT)
+    assert book.to_dict() == {'asks': [['101', '1']], 'bids': [['100', '1']]}
+
+
+def test_compact_book_arrays_and_lazy_rendering():
+    """Компактный стакан: числа в массивах, строки Gate.io только при сериализации"""
+    ob = CompactOrderBook.from_levels([['0.00001234', '5'], ['2', '1'], ['3', '1']], [['1.5', '3']], limit=2)
+    assert ob.best_ask == 0.00001234 and ob.best_bid == 1.5
+    assert ob.ask_prices.typecode == 'd' and len(ob.ask_prices) == 2
+    assert ob._rendered is None
+    assert ob.levels_json() == {'asks': [['0.00001234', '5'], ['2', '1']], 'bids': [['1.5', '3']]}
+    assert ob['bids'][0][0] == '1.5' and 'imbalance' in ob
+    assert not CompactOrderBook() and CompactOrderBook().best_ask == 0.0
+
+
+def test_compact_book_analytics_computed_once():
+    """Аналитика и накопленные объемы считаются при создании стакана и отдаются в JSON"""
+    ob = CompactOrderBook.from_levels([['101', '1'], ['102', '3']], [['99', '3'], ['98', '1']])
+    assert ob.mid == 100.0
+    assert ob.spread_bps == 200.0
+    # Объем бида больше - микроцена ближе к аску
+    assert ob.microprice == (101 * 3 + 99 * 1) / 4
+    assert list(ob.ask_cum_sizes) == [1.0, 4.0] and list(ob.bid_cum_sizes) == [3.0, 4.0]
+    assert list(ob.ask_cum_notional) == [101.0, 407.0] and list(ob.bid_cum_notional) == [297.0, 395.0]
+    assert ob.imbalance == 0.0
+    assert ob.analytics()['bid_cum_sizes'] == [3.0, 4.0]
+    # Опубликованный раздел orderbook несет аналитику - клиент ее не пересчитывает
+    assert ob.to_json()['ask_cum_sizes'] == [1.0, 4.0] and ob.to_json()['spread_bps'] == 200.0
+
+    one_sided = CompactOrderBook.from_levels([], [['99', '2']])
+    assert one_sided.mid == one_sided.spread_bps == 0.0 and one_sided.imbalance == 1.0
+
+
+def test_manager_never_publishes_older_book_state(monkeypatch):
+    """Публикация, ждавшая блокировку пары, отдает текущий стакан, а не снятый до ожидания"""
+    import threading
+    from gateio_websocket import GateIOWebSocket, PairWebSocketManager
+
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, incremental_orderbook=True)
+    manager.create_connection('BTC_USDT')
+    book = manager.order_books['BTC_USDT']
+    book.apply_snapshot(SNAPSHOT)
+
+    with manager._pair_locks['BTC_USDT']:
+        # Публикация после загрузки снимка ждет, пока поток диффов держит пару
+        resync = threading.Thread(target=manager._publish_orderbook, args=(book,))
+        resync.start()
+        time.sleep(0.05)
+        assert book.apply_update(_diff(101, 101, asks=[['100.5', '4']]))
+    resync.join(2)
+    assert manager.get_data('BTC_USDT')['orderbook'].best_ask == 100.5
@@ -0,0 +1,48 @@
+"""
+Тест воспроизведения записи кадров в менеджер пар (без сетевых подключений)
+"""
+
+import sys
+import os
+import json
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from capture import CaptureRecorder
+from replay import CaptureReplayer
+
+DAY = 1700000000.0
+
+
+def _frame(channel, result, ts):
+    return json.dumps({"time": int(ts), "channel": channel, "event": "update", "result": result})
+
+
+def test_capture_replays_into_manager_cache(tmp_path):
+    """Записанные кадры восстанавливают кэш пар, стакан собирается из диффов без REST снимка"""
+    recorder = CaptureRecorder(str(tmp_path), 'gzip', flush_interval=0.01)
+    frames = [
+        _frame("spot.tickers", {"currency_pair": "BTC_USDT", "last": "100", "base_volume": "5"}, DAY),
+        _frame("spot.order_book_update", {"s": "BTC_USDT", "U": 10, "u": 11, "t": 1,
+                                          "b": [["99", "1"]], "a": [["101", "2"]]}, DAY + 0.01),
+        _frame("spot.order_book_update", {"s": "BTC_USDT", "U": 12, "u": 12, "t": 2,
+                                          "b": [["99.5", "3"]], "a": []}, DAY + 0.02),
+        _frame("spot.tickers", {"currency_pair": "ETH_USDT", "last": "10"}, DAY + 0.03),
+        '{"time":1,"channel":"spot.pong","event":"","result":null}',
+    ]
+    for index, frame in enumerate(frames):
+        recorder.record(frame, DAY + index * 0.01)
+    recorder.start()
+    recorder.stop()
+
+    replayer = CaptureReplayer.from_files([recorder.path], speed=0)
+    report = replayer.run()
+    manager = replayer.manager
+
+    assert report['frames'] == 5 and report['pairs'] == 2
+    assert manager.pair_tiers == {'BTC_USDT': 'full', 'ETH_USDT': 'ticker'}
+    assert report['orderbooks'] == {'BTC_USDT': 12}
+    assert manager.get_data('BTC_USDT')['orderbook'].best_bid == 99.5
+    assert manager.get_data('ETH_USDT')['ticker']['last'] == '10'
+    assert report['stages']['spot.order_book_update']['apply_ms']['mean'] is not None
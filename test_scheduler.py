@@ -0,0 +1,44 @@
+"""
+Тест общего планировщика таймеров
+"""
+
+import sys
+import os
+import time
+import threading
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scheduler import TimerScheduler
+
+
+def test_timers_fire_in_order_and_cancel():
+    """Таймеры срабатывают по сроку в одном потоке, снятые не вызываются"""
+    scheduler = TimerScheduler()
+    fired, threads = [], set()
+    done = threading.Event()
+
+    def record(name):
+        fired.append(name)
+        threads.add(threading.current_thread().name)
+
+    scheduler.call_later(0.03, record, 'late')
+    scheduler.call_later(0.01, record, 'early')
+    scheduler.call_later(0.02, record, 'cancelled').cancel()
+    ticker = scheduler.call_every(0.01, record, 'tick')
+    scheduler.call_later(0.06, done.set)
+
+    assert done.wait(2)
+    ticker.cancel()
+    ticks = fired.count('tick')
+    time.sleep(0.03)
+
+    assert [name for name in fired if name != 'tick'] == ['early', 'late']
+    assert 'cancelled' not in fired
+    assert ticks >= 3 and fired.count('tick') == ticks
+    assert threads == {scheduler.name}
+    stats = scheduler.stats()
+    assert stats['timers'] == 0 and stats['fired'] == len(fired) + 1
+    assert stats['lateness_ms']['max'] >= stats['lateness_ms']['p50'] >= 0
+    scheduler.stop()
@@ -0,0 +1,259 @@
+"""
+Тест реестра подписок со счетчиками ссылок и отложенной отпиской (без сетевых подключений)
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_limits import DataLimits
+from gateio_websocket import GateIOWebSocket, PairWebSocketManager
+from subscriptions import TIER_FULL, TIER_TICKER, TIER_TOP, SubscriptionRegistry
+
+
+def _wait(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_pair_closes_after_grace_when_last_consumer_leaves():
+    """Пара закрывается только после ухода всех потребителей и grace; возврат в grace отменяет отписку"""
+    opened, closed = [], []
+    registry = SubscriptionRegistry(lambda pairs, tier: opened.extend(pairs), closed.append, grace=0.05)
+
+    registry.acquire('watchlist', ['btc_usdt'])
+    registry.acquire('ui', ['BTC_USDT'])
+    registry.acquire('ui', ['BTC_USDT'])
+    assert registry.snapshot()['pairs']['BTC_USDT']['refs'] == {'watchlist': 1, 'ui': 2}
+
+    registry.release('ui', ['BTC_USDT'], all_refs=True)
+    registry.release('watchlist', ['BTC_USDT'])
+    assert registry.needed('BTC_USDT') and registry.snapshot()['pairs']['BTC_USDT']['teardown_in'] is not None
+
+    # Повторная подписка до истечения grace - без отписки и переподписки
+    registry.acquire('sse-1', ['BTC_USDT'])
+    time.sleep(0.1)
+    assert closed == [] and registry.revived == 1
+
+    registry.release_consumer('sse-1')
+    assert _wait(lambda: closed == ['BTC_USDT'])
+    assert not registry.needed('BTC_USDT') and registry.snapshot()['pairs'] == {}
+
+
+def test_lease_is_extended_by_repeated_requests():
+    """Аренда продлевается повторными запросами и истекает без них"""
+    closed = []
+    registry = SubscriptionRegistry(lambda pairs, tier: None, closed.append, grace=0.05)
+
+    for _ in range(4):
+        registry.lease('ui', ['ETH_USDT'])
+        time.sleep(0.03)
+    assert closed == []
+    assert _wait(lambda: closed == ['ETH_USDT'])
+
+
+def test_cleanup_keeps_pairs_needed_by_consumers(monkeypatch):
+    """Очистка кэша менеджера не вытесняет пары, удерживаемые в реестре"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    monkeypatch.setattr(DataLimits, 'MAX_CURRENCY_PAIRS_CACHE', 1)
+    manager = PairWebSocketManager(multiplex=True, subscription_grace=60)
+    manager.subscriptions.acquire('watchlist', ['BTC_USDT', 'ETH_USDT'])
+    manager.create_connection('WLD_USDT')
+    assert sorted(manager.connections) == ['BTC_USDT', 'ETH_USDT', 'WLD_USDT']
+
+    manager._cleanup_old_cache()
+    assert sorted(manager.data_cache) == ['BTC_USDT', 'ETH_USDT']
+    assert sorted(manager.connections) == ['BTC_USDT', 'ETH_USDT']
+
+
+def test_tier_follows_most_demanding_consumer(monkeypatch):
+    """Пара подписана на уровень самого требовательного потребителя; уход UI понижает уровень"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, subscription_grace=60)
+    registry = manager.subscriptions
+    client = manager.create_connection('ETH_USDT')
+
+    registry.acquire('watchlist', ['BTC_USDT'], tier=TIER_TICKER)
+    assert manager.pair_tiers['BTC_USDT'] == TIER_TICKER
+    assert set(client.subscriptions) >= {'spot.tickers_BTC_USDT'}
+    assert 'spot.trades_BTC_USDT' not in client.subscriptions
+
+    registry.lease('ui', ['BTC_USDT'], tier=TIER_FULL)
+    assert registry.tier('BTC_USDT') == TIER_FULL and 'spot.trades_BTC_USDT' in client.subscriptions
+    assert 'BTC_USDT' in manager.order_books
+
+    registry.acquire('sse-1', ['BTC_USDT'], tier=TIER_TOP)
+    registry.release('ui', ['BTC_USDT'], all_refs=True)
+    assert manager.pair_tiers['BTC_USDT'] == TIER_TOP
+    assert 'spot.book_ticker_BTC_USDT' in client.subscriptions
+    assert 'spot.trades_BTC_USDT' not in client.subscriptions and 'BTC_USDT' not in manager.order_books
+
+    client._dispatch("spot.book_ticker", {"s": "BTC_USDT", "b": "99", "B": "1", "a": "101", "A": "2"})
+    assert manager.get_data('BTC_USDT')['orderbook'].best_ask == 101.0
+
+    registry.release_consumer('sse-1')
+    assert manager.pair_tiers['BTC_USDT'] == TIER_TICKER
+    assert manager.get_data('BTC_USDT')['orderbook'].best_ask == 0
+
+
+def test_demotion_keeps_foreign_routes_and_clears_trades(monkeypatch):
+    """Понижение уровня снимает только обработчики менеджера и очищает сделки в кэше"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, subscription_grace=60)
+    registry = manager.subscriptions
+    registry.acquire('ui', ['BTC_USDT'], tier=TIER_FULL)
+    client = manager.connections['BTC_USDT']
+    recorded = []
+    manager.add_route("spot.trades", 'BTC_USDT', recorded.append)
+
+    client._dispatch("spot.trades", {"currency_pair": "BTC_USDT", "id": 1, "price": "100"})
+    assert [t['id'] for t in manager.get_data('BTC_USDT')['trades']] == [1] and len(recorded) == 1
+
+    registry.acquire('watchlist', ['BTC_USDT'], tier=TIER_TICKER)
+    registry.release('ui', ['BTC_USDT'])
+    assert manager.pair_tiers['BTC_USDT'] == TIER_TICKER
+    assert client.routes[("spot.trades", 'BTC_USDT')] == (recorded.append,)
+    # Сторонний потребитель канала остается подписан на бирже
+    assert "spot.trades_BTC_USDT" in client.subscriptions
+    assert "spot.order_book_update_BTC_USDT" not in client.subscriptions
+    assert manager.get_data('BTC_USDT')['trades'] == ()
+
+    # Запоздавшая сделка доходит до стороннего потребителя, но не в кэш менеджера
+    client._dispatch("spot.trades", {"currency_pair": "BTC_USDT", "id": 2, "price": "101"})
+    assert len(recorded) == 2 and manager.get_data('BTC_USDT')['trades'] == ()
+
+
+def test_release_on_shared_socket_keeps_foreign_routes(monkeypatch):
+    """Освобождение пары на общем соединении не снимает маршруты и подписки других потребителей"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, incremental_orderbook=False)
+    manager.create_connections(['BTC_USDT', 'ETH_USDT'])
+    client = manager.connections['BTC_USDT']
+    recorded = []
+    manager.add_route("spot.tickers", 'BTC_USDT', recorded.append)
+
+    manager.close_connection('BTC_USDT')
+    assert client is manager.connections['ETH_USDT']
+    assert client.routes[("spot.tickers", 'BTC_USDT')] == (recorded.append,)
+    assert "spot.tickers_BTC_USDT" in client.subscriptions
+    assert ("spot.trades", 'BTC_USDT') not in client.routes and "spot.trades_BTC_USDT" not in client.subscriptions
+
+
+def test_demotion_to_top_publishes_top_of_book_at_once(monkeypatch):
+    """Понижение full -> top сразу заменяет глубокий стакан в кэше лучшими ценами"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, incremental_orderbook=False)
+    manager.create_connections(['BTC_USDT'])
+    client = manager.connections['BTC_USDT']
+    client._dispatch("spot.order_book", {"s": "BTC_USDT", "asks": [["101", "1"], ["102", "2"]],
+                                         "bids": [["99", "3"], ["98", "4"]]})
+    assert len(manager.get_data('BTC_USDT')['orderbook'].ask_prices) == 2
+
+    assert manager.set_tier('BTC_USDT', TIER_TOP)
+    book = manager.get_data('BTC_USDT')['orderbook']
+    assert list(book.ask_prices) == [101.0] and list(book.bid_prices) == [99.0]
+    assert manager.set_tier('BTC_USDT', TIER_TICKER)
+    assert not manager.get_data('BTC_USDT')['orderbook']
+
+
+def test_concurrent_tier_changes_leave_channels_matching_tier(monkeypatch):
+    """Параллельные смены уровня одной пары не перемешивают подписки и отписки"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, incremental_orderbook=False)
+    manager.create_connections(['BTC_USDT'])
+    client = manager.connections['BTC_USDT']
+    unsubscribe = client.unsubscribe
+
+    def slow_unsubscribe(*args):
+        time.sleep(0.01)
+        return unsubscribe(*args)
+
+    client.unsubscribe = slow_unsubscribe
+    for tiers in ((TIER_TOP, TIER_TICKER), (TIER_FULL, TIER_TOP), (TIER_TICKER, TIER_FULL)):
+        threads = [threading.Thread(target=manager.set_tier, args=('BTC_USDT', tier)) for tier in tiers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+        channels = {channel for channel, pair in client.routes if pair == 'BTC_USDT'}
+        assert channels == set(manager._tier_channels(manager.pair_tiers['BTC_USDT']))
+        assert set(manager._pair_handlers['BTC_USDT']) == channels
+
+
+def test_failed_open_is_retried_and_closed_on_release():
+    """Ошибка подписки не считается открытой парой: подписка повторяется, а при уходе - отписка"""
+    calls, closed = [], []
+
+    def flaky_open(pairs, tier):
+        calls.append(list(pairs))
+        if len(calls) == 1:
+            raise ConnectionError("нет соединения")
+
+    registry = SubscriptionRegistry(flaky_open, closed.append, grace=0)
+    registry.OPEN_RETRY_DELAY = 0.02
+    registry.acquire('ui', ['BTC_USDT'])
+    assert _wait(lambda: len(calls) == 2)
+    time.sleep(0.1)
+    assert calls == [['BTC_USDT'], ['BTC_USDT']]
+
+    registry.release('ui', ['BTC_USDT'])
+    assert _wait(lambda: closed == ['BTC_USDT'])
+
+
+def test_status_during_slow_open_does_not_deadlock(monkeypatch):
+    """status() менеджера параллельно с долгой подпиской через реестр не блокирует потоки"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    manager = PairWebSocketManager(multiplex=True, subscription_grace=60)
+    registry = manager.subscriptions
+    ensure = registry.open_pairs
+    opening = threading.Event()
+
+    def slow_open(pairs, tier):
+        opening.set()
+        time.sleep(0.1)
+        ensure(pairs, tier)
+
+    registry.open_pairs = slow_open
+    lease = threading.Thread(target=registry.lease, args=('ui', ['BTC_USDT']), daemon=True)
+    lease.start()
+    assert opening.wait(2)
+    status = threading.Thread(target=manager.status, daemon=True)
+    status.start()
+    lease.join(2)
+    status.join(2)
+    assert not lease.is_alive() and not status.is_alive()
+    assert 'BTC_USDT' in manager.connections
+
+
+def test_slow_teardown_does_not_block_scheduler_or_leases():
+    """Долгая отписка идет вне потока планировщика и вне блокировки реестра"""
+    from scheduler import get_scheduler
+
+    closing, release_close = threading.Event(), threading.Event()
+    threads = []
+
+    def slow_close(pair):
+        threads.append(threading.current_thread().name)
+        closing.set()
+        release_close.wait(2)
+
+    registry = SubscriptionRegistry(lambda pairs, tier: None, slow_close, grace=0.01)
+    registry.acquire('ui', ['BTC_USDT'])
+    registry.release('ui', ['BTC_USDT'])
+    assert closing.wait(2)
+    try:
+        fired = threading.Event()
+        get_scheduler().call_later(0, fired.set)
+        assert fired.wait(0.5)
+        started = time.monotonic()
+        registry.lease('ui', ['ETH_USDT'])
+        assert time.monotonic() - started < 0.5 and registry.needed('ETH_USDT')
+    finally:
+        release_close.set()
+    assert threads == ['subscription-review']
@@ -0,0 +1,79 @@
+"""
+Тест синтетического рынка многих пар (без сетевых подключений)
+"""
+
+import sys
+import os
+import json
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_market import SyntheticMarket
+
+START = 1700000000.0
+
+
+def test_same_seed_gives_same_frames_and_consistent_diffs():
+    """Одинаковый seed - одинаковый поток; диффы, наложенные на снимок, дают текущий стакан"""
+    first = list(SyntheticMarket(20, seed=3, start_time=START).messages(3000))
+    second = list(SyntheticMarket(20, seed=3, start_time=START).messages(3000))
+    assert first == second
+    assert first != list(SyntheticMarket(20, seed=4, start_time=START).messages(3000))
+    # Кадры по шаблонам совпадают с result из frames()
+    frames = SyntheticMarket(20, seed=3, start_time=START).frames(3000)
+    for (at, message), (frame_at, channel, result) in zip(first, frames):
+        frame = json.loads(message)
+        assert at == frame_at and frame['channel'] == channel and frame['result'] == result
+
+    market = SyntheticMarket(5, seed=3, start_time=START)
+    pair = next(iter(market.pairs))
+    snapshot = market.order_book_snapshot(pair)
+    book = {'b': {price: size for price, size in snapshot['bids']},
+            'a': {price: size for price, size in snapshot['asks']}}
+    last_id = snapshot['id']
+    for at, channel, result in market.frames(5000):
+        if channel != "spot.order_book_update" or result['s'] != pair:
+            continue
+        assert result['U'] == last_id + 1
+        last_id = result['u']
+        for side in ('b', 'a'):
+            for price, size in result[side]:
+                if float(size) == 0:
+                    book[side].pop(price)
+                else:
+                    book[side][price] = size
+    bids, asks = market.pairs[pair].levels(100)
+    assert sorted(book['b'].items()) == sorted(map(tuple, bids))
+    assert sorted(book['a'].items()) == sorted(map(tuple, asks))
+    assert len(bids) == len(asks) == market.depth
+    assert float(bids[0][0]) < float(asks[0][0])
+
+
+def test_drive_fills_manager_cache_and_feeds_autotrader(tmp_path):
+    """События рынка синхронизируют стаканы менеджера, автотрейдер берет цены из кэша"""
+    from autotrader import AutoTrader
+    from state_manager import StateManager
+
+    market = SyntheticMarket(10, seed=5, start_time=START)
+    manager = market.create_manager()
+    report = market.drive(manager, 2000)
+    assert report['events'] == 2000
+
+    for pair, state in market.pairs.items():
+        book = manager.order_books[pair].to_compact()
+        bids, asks = state.levels(100)
+        assert list(book.bid_prices) == [float(price) for price, _ in bids]
+        assert list(book.ask_prices) == [float(price) for price, _ in asks]
+        assert manager.get_data(pair)['ticker']
+
+    state_manager = StateManager(str(tmp_path / 'state.json'))
+    state_manager.set_auto_trade_enabled(True)
+    base = next(iter(market.pairs)).split('_')[0]
+    state_manager.set_trading_permission(base, True)
+    trader = AutoTrader(lambda: None, manager, state_manager, market=market, seed=5)
+    trader.running = True
+    trader.run_once()
+    trader.running = False
+    last = float(manager.get_data(f"{base}_USDT")['ticker']['last'])
+    assert trader.stats['per_base'][base]['last_price'] == last
@@ -0,0 +1,51 @@
+"""
+Тест кэша watchlist, наполняемого событиями менеджера (без сетевых подключений)
+"""
+
+import sys
+import os
+import json
+import time
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+import gateio_websocket
+from gateio_websocket import GateIOWebSocket, init_websocket_manager
+from websocket_routes import WebSocketRoutes
+
+
+def _update(channel, result):
+    """Сформировать кадр обновления в формате Gate.io v4"""
+    return json.dumps({"time": 0, "channel": channel, "event": "update", "result": result})
+
+
+def test_watchlist_cache_follows_manager_updates(monkeypatch):
+    """Обновления пар watchlist попадают в кэш без опроса; новый менеджер подхватывается сам"""
+    monkeypatch.setattr(GateIOWebSocket, 'connect', lambda self: None)
+    monkeypatch.setattr(gateio_websocket, 'ws_manager', None)
+    monkeypatch.setattr(gateio_websocket, '_manager_listeners', [])
+    routes = WebSocketRoutes(Flask(__name__), None, lambda: 'work')
+
+    manager = init_websocket_manager(None, None)
+    routes._add_pairs_to_watchlist(['btc_usdt'])
+    assert manager.subscriptions.pairs('watchlist') == ['BTC_USDT']
+
+    client = manager.connections['BTC_USDT']
+    client._on_message(None, _update("spot.tickers", {"currency_pair": "BTC_USDT", "last": "7"}))
+    deadline = time.monotonic() + 2
+    while 'BTC_USDT' not in routes.multi_pairs_cache and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert routes.multi_pairs_cache['BTC_USDT']['data']['ticker']['last'] == '7'
+
+    # Переключение сети: старый потребитель отключен, пары удерживаются в новом менеджере
+    consumer = routes._watchlist_consumer
+    manager = init_websocket_manager(None, None)
+    assert consumer.closed and routes._watchlist_consumer in manager.conflator.consumers
+    assert manager.subscriptions.pairs('watchlist') == ['BTC_USDT']
+
+    routes._remove_pairs_from_watchlist(['BTC_USDT'])
+    assert 'BTC_USDT' not in routes.multi_pairs_cache
+    assert routes._watchlist_consumer.pairs == frozenset()
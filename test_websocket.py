@@ -5,6 +5,7 @@
 
 import websocket
 import json
+import sys
 import time
 import threading
 
@@ -67,9 +68,11 @@ def on_pong(ws, data):
     print(f"🏓 Pong получен: {data}")
 
 if __name__ == "__main__":
+    # URL можно передать аргументом, например локальный mock_gateio_server.py: ws://127.0.0.1:8765/ws/v4/
+    url = sys.argv[1] if len(sys.argv) > 1 else "wss://api.gateio.ws/ws/v4/"
     print("🚀 Запуск тестового WebSocket клиента для Gate.io")
     print("📊 Тестируемая пара: WLD_USDT")
-    print(f"🔗 URL: wss://api.gateio.ws/ws/v4/")
+    print(f"🔗 URL: {url}")
     print("⏱️  Ожидание данных в течение 30 секунд...\n")
     
     # Включаем отладку
@@ -77,7 +80,7 @@ if __name__ == "__main__":
     
     # Создаем WebSocket
     ws = websocket.WebSocketApp(
-        "wss://api.gateio.ws/ws/v4/",
+        url,
         on_message=on_message,
         on_error=on_error,
         on_close=on_close,
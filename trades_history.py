@@ -0,0 +1,143 @@
+"""
+Trades History Module
+Кольцевой буфер последних сделок пары для WebSocket кэша
+"""
+
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from data_limits import DataLimits
+
+# Звено истории: (сделка, звено более старой сделки) или None
+_Cell = Optional[Tuple[Dict[str, Any], Any]]
+
+
+def _walk(cell: _Cell) -> Iterator[Dict[str, Any]]:
+    """Сделки цепочки от звена к более старым"""
+    while cell is not None:
+        trade, cell = cell
+        yield trade
+
+
+class TradesView:
+    """
+    Неизменяемая история сделок на момент публикации (новые первыми)
+
+    Ссылается на звено цепочки буфера и число видимых сделок - создание O(1), а звенья
+    после публикации не меняются, поэтому читатели обходят историю без блокировок.
+    Кортеж сделок строится при первом обращении по индексу или сериализации и кэшируется.
+    """
+
+    __slots__ = ('_head', '_length', '_items')
+
+    def __init__(self, head: _Cell = None, length: int = 0):
+        self._head = head
+        self._length = length
+        self._items: Optional[Tuple[Dict[str, Any], ...]] = None
+
+    def _tuple(self) -> Tuple[Dict[str, Any], ...]:
+        items = self._items
+        if items is None:
+            items = self._items = tuple(islice(_walk(self._head), self._length))
+        return items
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self._items is not None:
+            return iter(self._items)
+        return islice(_walk(self._head), self._length)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and self._items is None and not index.start and index.step is None \
+                and index.stop is not None and index.stop >= 0:
+            # Новые сделки для дельты клиенту - обход только первых звеньев
+            return tuple(islice(_walk(self._head), min(index.stop, self._length)))
+        return self._tuple()[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TradesView, tuple, list)):
+            return self._tuple() == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return list(self._tuple())
+
+    def __repr__(self) -> str:
+        return f"TradesView({self._length})"
+
+
+class TradesRingBuffer:
+    """
+    Последние сделки пары фиксированной емкости (новые первыми)
+
+    Сделки хранятся неизменяемой цепочкой звеньев от новой к старым: добавление - O(1),
+    снимок для публикации (snapshot) - O(1) без копирования истории. Звенья старше емкости
+    не видны снимкам; когда цепочка вдвое длиннее емкости, она пересобирается из
+    последних сделок (O(емкость) раз на емкость добавлений - в среднем O(1)).
+    Счетчик sequence растет на каждую добавленную сделку - по разнице счетчиков
+    клиент получает только новые сделки (см. PairWebSocketManager.get_changes).
+    """
+
+    __slots__ = ('_head', '_chain', '_capacity', 'sequence')
+
+    def __init__(self, capacity: int = DataLimits.MAX_TRADES_HISTORY):
+        self._capacity = max(1, capacity)
+        self._head: _Cell = None
+        # Длина цепочки, включая звенья старше емкости
+        self._chain = 0
+        self.sequence = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def push(self, trade: Dict[str, Any]):
+        """Добавить новую сделку"""
+        self._head = (trade, self._head)
+        self._chain += 1
+        self.sequence += 1
+        if self._chain >= 2 * self._capacity:
+            self._rebuild(islice(_walk(self._head), self._capacity))
+
+    def replace(self, trades: Iterable[Dict[str, Any]]):
+        """Заменить историю списком сделок (новые первыми)"""
+        self._rebuild(islice(trades, self._capacity))
+        # Разница больше емкости - у клиента нет общей части истории, он возьмет список целиком
+        self.sequence += self._capacity + 1
+
+    def _rebuild(self, trades: Iterable[Dict[str, Any]]):
+        """Новая цепочка из сделок (новые первыми); опубликованные снимки сохраняют старую"""
+        trades = list(trades)
+        head: _Cell = None
+        for trade in reversed(trades):
+            head = (trade, head)
+        self._head = head
+        self._chain = len(trades)
+
+    def __len__(self) -> int:
+        return min(self._chain, self._capacity)
+
+    def latest(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Последние limit сделок (без копирования самих сделок)"""
+        count = len(self) if limit is None else min(limit, len(self))
+        return list(islice(_walk(self._head), count))
+
+    def snapshot(self) -> TradesView:
+        """Неизменяемый вид истории для публикации читателям - O(1)"""
+        return TradesView(self._head, len(self))
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return self.latest()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return islice(_walk(self._head), len(self))
+
+    def __getitem__(self, index):
+        return self.snapshot()[index]
+
+    def __repr__(self) -> str:
+        return f"TradesRingBuffer({len(self)}/{self.capacity})"
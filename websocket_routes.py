@@ -4,13 +4,18 @@ WebSocket Routes Module
 """
 
 import time
-from flask import request, jsonify
-from threading import Thread
-from typing import List, Set, Dict
+from flask import Response, request, jsonify, stream_with_context
+from typing import Any, List, Optional, Set, Dict, Tuple
 
+from capture import get_active_recorder, start_capture, stop_capture
 from config import Config
+from conflation import ConflatingConsumer
+from data_limits import DataLimits
 from gate_api_client import GateAPIClient
-from gateio_websocket import get_websocket_manager
+from feed_metrics import get_feed_metrics
+from gateio_websocket import add_manager_listener, get_websocket_manager
+from market_stream import MarketStreamSubscriber
+from subscriptions import TIER_FULL, TIER_TICKER
 from trading_engine import AccountManager
 
 
@@ -35,12 +40,17 @@ class WebSocketRoutes:
         self.multi_pairs_cache: Dict = {}
         self.pair_info_cache: Dict = {}
         self.pair_info_cache_ttl: int = 3600  # 1 час
+        # Активная пара UI: полный уровень подписки, при переключении прежняя понижается
+        self.active_pair: Optional[str] = None
+        # Потребитель обновлений менеджера, который наполняет multi_pairs_cache
+        self._watchlist_consumer: Optional[ConflatingConsumer] = None
+        self._watchlist_manager = None
         
         # Регистрация всех маршрутов
         self._register_routes()
         
-        # Запуск фонового потока обновления пар
-        self._start_pairs_updater()
+        # Кэш watchlist наполняется событиями каждого нового менеджера, без опроса
+        add_manager_listener(self._attach_watchlist_feed)
     
     def _register_routes(self):
         """Регистрация всех WebSocket маршрутов"""
@@ -50,6 +60,10 @@ class WebSocketRoutes:
         self.app.add_url_rule('/api/pair/unsubscribe', 'unsubscribe_pair', self.unsubscribe_pair, methods=['POST'])
         self.app.add_url_rule('/api/pair/balances', 'get_pair_balances', self.get_pair_balances, methods=['GET'])
         self.app.add_url_rule('/api/pair/info', 'get_pair_info', self.get_pair_info, methods=['GET'])
+        self.app.add_url_rule('/api/stream/market', 'stream_market', self.stream_market, methods=['GET'])
+        self.app.add_url_rule('/api/ws/metrics', 'ws_metrics', self.ws_metrics, methods=['GET'])
+        self.app.add_url_rule('/api/ws/subscriptions', 'ws_subscriptions', self.ws_subscriptions, methods=['GET'])
+        self.app.add_url_rule('/api/ws/capture', 'ws_capture', self.ws_capture, methods=['GET', 'POST'])
         
         # Multi-pairs watcher
         self.app.add_url_rule('/api/pairs/watchlist', 'api_get_watchlist', self.api_get_watchlist, methods=['GET'])
@@ -83,7 +97,12 @@ class WebSocketRoutes:
             if not ws_manager:
                 return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
             
-            ws_manager.create_connection(currency_pair)
+            # UI не сообщает об уходе с пары - аренда продлевается запросами данных пары
+            ws_manager.subscriptions.lease('ui', [currency_pair], tier=TIER_FULL)
+            previous, self.active_pair = self.active_pair, currency_pair.upper()
+            if previous and previous != self.active_pair:
+                # Переключение базы: прежняя пара остается на уровне других потребителей (watchlist - тикер)
+                ws_manager.subscriptions.release('ui', [previous], all_refs=True)
             return jsonify({"success": True, "pair": currency_pair, "message": f"Подписка на {currency_pair} создана"})
         except Exception as e:
             return jsonify({"success": False, "error": str(e)})
@@ -94,20 +113,29 @@ class WebSocketRoutes:
             base_currency = request.args.get('base_currency', 'BTC')
             quote_currency = request.args.get('quote_currency', 'USDT')
             force_refresh = request.args.get('force', '0') == '1'
+            # Условный запрос: since - версия данных у клиента, trades_seq - счетчик сделок из того же ответа
+            since = request.args.get('since', type=int)
+            trades_seq = request.args.get('trades_seq', type=int)
             currency_pair = f"{base_currency}_{quote_currency}"
             
             ws_manager = get_websocket_manager()
             data = None
             
             if ws_manager:
+                # Продлеваем аренду пары для UI (подписка создается, если ее еще нет)
+                ws_manager.subscriptions.lease('ui', [currency_pair])
                 data = ws_manager.get_data(currency_pair)
-                # Если force=1 или данных нет, создаём новое соединение
+                # Если force=1 или данных нет, ждём данные новой подписки
                 if data is None or force_refresh:
-                    print(f"[PAIR_DATA] Creating/refreshing connection for {currency_pair} (force={force_refresh})")
-                    ws_manager.create_connection(currency_pair)
-                    # Ждём немного, чтобы получить первые данные
-                    time.sleep(0.5)
+                    print(f"[PAIR_DATA] Waiting for data of {currency_pair} (force={force_refresh})")
+                    # Ждём первые данные (не дольше 0.5 с), соединение открывается в фоне
+                    ws_manager.wait_for_data(currency_pair, timeout=0.5)
                     data = ws_manager.get_data(currency_pair)
+                elif since is not None:
+                    # Только изменившиеся разделы (или unchanged) вместо полного снимка
+                    changes = ws_manager.get_changes(currency_pair, since, trades_seq)
+                    if changes is not None:
+                        return jsonify({'success': True, 'pair': currency_pair, **changes})
             
             if not data:
                 # REST fallback: используем основной API даже в тестовом режиме для рыночных данных
@@ -131,10 +159,78 @@ class WebSocketRoutes:
                     print(f"[ERROR] Failed to load real market data for {currency_pair}: {rest_err}")
                     return jsonify({'success': False, 'error': f'Не удалось загрузить данные рынка: {str(rest_err)}'})
             
-            return jsonify({'success': True, 'pair': currency_pair, 'data': data})
+            return jsonify({'success': True, 'pair': currency_pair, 'version': data.get('version'), 'data': data})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)})
     
+    def stream_market(self):
+        """SSE поток рыночных данных: полный снимок пары, затем дельты (не чаще rate в секунду)"""
+        try:
+            pairs_param = request.args.get('pairs', '')
+            if pairs_param:
+                pairs = [p.strip().upper() for p in pairs_param.split(',') if p.strip()]
+            else:
+                base_currency = request.args.get('base_currency', 'BTC')
+                quote_currency = request.args.get('quote_currency', 'USDT')
+                pairs = [f"{base_currency}_{quote_currency}".upper()]
+            rate = request.args.get('rate', type=float)
+            
+            ws_manager = get_websocket_manager()
+            if not ws_manager:
+                return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
+            
+            # Подписки на пары удерживает сам подписчик на время потока
+            # Клиент не может запросить частоту выше серверного лимита
+            max_rate = min(rate, DataLimits.SSE_MAX_UPDATES_PER_SECOND) if rate and rate > 0 else None
+            subscriber = MarketStreamSubscriber(ws_manager, pairs, self.app.json.dumps, max_rate=max_rate)
+            return Response(
+                stream_with_context(subscriber.events()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)})
+    
+    def ws_metrics(self):
+        """Метрики потока: задержки биржа -> получение -> кэш, частоты кадров, состояние менеджера"""
+        try:
+            pair = request.args.get('pair')
+            ws_manager = get_websocket_manager()
+            return jsonify({
+                "success": True,
+                "feed": get_feed_metrics().snapshot(pair),
+                "manager": ws_manager.status() if ws_manager else None
+            })
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)})
+    
+    def ws_subscriptions(self):
+        """Реестр подписок: потребители и счетчики ссылок по парам, ожидающие отписки"""
+        try:
+            ws_manager = get_websocket_manager()
+            if not ws_manager:
+                return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
+            return jsonify({"success": True, **ws_manager.subscriptions.snapshot()})
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)})
+    
+    def ws_capture(self):
+        """Запись сырых кадров WebSocket: GET - состояние, POST {"action": "start"|"stop", "compression"}"""
+        try:
+            if request.method == 'POST':
+                payload = request.get_json(silent=True) or {}
+                action = payload.get('action')
+                if action == 'start':
+                    recorder = start_capture(compression=payload.get('compression'))
+                    return jsonify({"success": True, **recorder.stats()})
+                if action == 'stop':
+                    return jsonify({"success": True, "stopped": stop_capture()})
+                return jsonify({"success": False, "error": "action: start | stop"}), 400
+            recorder = get_active_recorder()
+            return jsonify({"success": True, **(recorder.stats() if recorder else {"running": False})})
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)})
+    
     def unsubscribe_pair(self):
         """Отписаться от данных торговой пары"""
         try:
@@ -147,8 +243,8 @@ class WebSocketRoutes:
             if not ws_manager:
                 return jsonify({"success": False, "error": "WebSocket менеджер не инициализирован"})
             
-            # Закрыть соединение для пары
-            ws_manager.close_connection(currency_pair)
+            # UI больше не нужна пара; отписка - через grace, если пара не нужна другим
+            ws_manager.subscriptions.release('ui', [currency_pair], all_refs=True)
             
             return jsonify({
                 "success": True,
@@ -340,20 +436,31 @@ class WebSocketRoutes:
             if default_pairs:
                 for pair in default_pairs:
                     self.watched_pairs.add(pair)
+            ws = get_websocket_manager()
+            if ws:
+                self._update_watchlist_feed(ws)
         except Exception as e:
             print(f"[WATCHLIST] Ошибка инициализации: {e}")
     
+    def _sync_watchlist_subscriptions(self, ws):
+        """Привести удержания потребителя 'watchlist' в реестре подписок к составу watchlist"""
+        held = set(ws.subscriptions.pairs('watchlist'))
+        watched = set(self.watched_pairs)
+        # Пакетная подписка: в мультиплексном режиме одно сообщение на соединение
+        # Watchlist показывает только цену - достаточно тикера
+        ws.subscriptions.acquire('watchlist', sorted(watched - held), tier=TIER_TICKER)
+        ws.subscriptions.release('watchlist', sorted(held - watched), all_refs=True)
+    
     def _add_pairs_to_watchlist(self, pairs: List[str]):
         """Добавить пары в watchlist"""
         ws = get_websocket_manager()
-        for p in (pairs or []):
-            pair = str(p).upper()
-            self.watched_pairs.add(pair)
-            try:
-                if ws:
-                    ws.create_connection(pair)
-            except Exception:
-                pass
+        new_pairs = [str(p).upper() for p in (pairs or [])]
+        self.watched_pairs.update(new_pairs)
+        try:
+            if ws:
+                self._update_watchlist_feed(ws)
+        except Exception:
+            pass
     
     def _remove_pairs_from_watchlist(self, pairs: List[str]):
         """Удалить пары из watchlist"""
@@ -361,36 +468,43 @@ class WebSocketRoutes:
         for p in (pairs or []):
             pair = str(p).upper()
             self.watched_pairs.discard(pair)
-            try:
-                if ws:
-                    ws.close_connection(pair)
-            except Exception:
-                pass
+            self.multi_pairs_cache.pop(pair, None)
+        try:
+            if ws:
+                # Пара закрывается реестром, только если она не нужна UI, SSE или автотрейдеру
+                self._update_watchlist_feed(ws)
+        except Exception:
+            pass
     
-    def _start_pairs_updater(self):
-        """Запуск фонового потока обновления пар"""
-        def updater_loop():
-            while True:
-                try:
-                    ws = get_websocket_manager()
-                    if ws:
-                        for pair in list(self.watched_pairs):
-                            try:
-                                # гарантируем наличие соединения
-                                ws.create_connection(pair)
-                                data = ws.get_data(pair)
-                                if data is not None:
-                                    self.multi_pairs_cache[pair] = {"ts": time.time(), "data": data}
-                            except Exception:
-                                # игнорируем точечные ошибки по конкретной паре
-                                pass
-                    time.sleep(1.0)
-                except Exception:
-                    # защитный блок, чтобы поток не падал
-                    time.sleep(1.0)
-        
-        updater_thread = Thread(target=updater_loop, daemon=True)
-        updater_thread.start()
+    def _attach_watchlist_feed(self, ws):
+        """Подключить кэш watchlist к новому менеджеру (вызывается при его создании)"""
+        consumer = self._watchlist_consumer
+        if self._watchlist_manager is not None and consumer is not None:
+            self._watchlist_manager.remove_consumer(consumer)
+        # Одна доставка на пару и раздел с последним снимком - без очереди и без опроса
+        consumer = ConflatingConsumer('watchlist', handler=self._on_watchlist_update, pairs=self.watched_pairs)
+        self._watchlist_consumer = consumer
+        self._watchlist_manager = ws
+        ws.add_consumer(consumer)
+        consumer.start()
+        self._update_watchlist_feed(ws)
+    
+    def _update_watchlist_feed(self, ws):
+        """Применить состав watchlist: подписки в реестре, фильтр потребителя, уже известные данные"""
+        self._sync_watchlist_subscriptions(ws)
+        consumer = self._watchlist_consumer
+        if consumer is not None and self._watchlist_manager is ws:
+            consumer.set_pairs(self.watched_pairs)
+        for pair in list(self.watched_pairs):
+            data = ws.get_data(pair)
+            if data is not None and data.get('last_update') is not None:
+                self.multi_pairs_cache[pair] = {"ts": time.time(), "data": data}
+    
+    def _on_watchlist_update(self, key: Tuple[str, str], data: Any):
+        """Новый снимок пары из менеджера (поток доставки потребителя watchlist)"""
+        pair = key[0]
+        if pair in self.watched_pairs:
+            self.multi_pairs_cache[pair] = {"ts": time.time(), "data": data}
     
     def api_get_watchlist(self):
         """Получить список отслеживаемых пар"""